@@ -0,0 +1,1240 @@
+"""Замеры производительности трекера образования студентов."""
+
+import argparse
+import asyncio
+import gc
+import io
+import json
+import os
+import pickle
+import platform
+import random
+import re
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from functools import partial
+from typing import Callable, Iterable, Iterator
+from unittest.mock import patch
+
+from task_v2 import (
+    Course, DiskEmailIndex, EventBus, JsonlEventSink,
+    LearningProgressTracker,
+    MaildirNotificationSink, PointHistory, ScoreChanged,
+    SQLiteLearningProgressTracker, StreamNotificationSink, Student,
+    StudentIndex, StudentValidator, TrackerContext, TrackerImage,
+    TrackerLocks,
+    TrackerMetrics, TrackerStatistics, TrackerStorage
+)
+
+COURSES_POINTS = {
+    "Python": 600,
+    "DSA": 400,
+    "Databases": 480,
+    "Flask": 550,
+}
+
+
+def reset_state() -> None:
+    """Сбрасывает состояние классов между замерами."""
+    Student.id_counter = 1000
+    Student.students = {}
+    Student.emails = {}
+    Student.index = StudentIndex()
+    Course.courses = {}
+    TrackerStatistics.reset()
+    for name, score in COURSES_POINTS.items():
+        Course(name, score)
+
+
+def generate_credentials(count: int) -> Iterator:
+    """Генерирует строки с данными студентов, каждая десятая - ошибочная."""
+    for i in range(count):
+        if i % 10 == 9:
+            yield f"Bad1 Name user{i}@example.com\n"
+        else:
+            yield f"John Smith user{i}@example.com\n"
+
+
+def report(name: str, rows: int, elapsed: float) -> None:
+    """Выводит результат замера."""
+    print(f"{name}: {rows} rows in {elapsed:.2f}s "
+          f"({rows / elapsed:,.0f} rows/s)")
+
+
+def bench_import_students(rows: int) -> None:
+    """Пакетный импорт студентов."""
+    reset_state()
+    rejects = io.StringIO()
+    start = time.perf_counter()
+    Student.import_students(generate_credentials(rows), rejects)
+    report("import_students", rows, time.perf_counter() - start)
+
+
+def bench_add_points_many(rows: int) -> None:
+    """Пакетное добавление баллов против построчного add_points."""
+    reset_state()
+    students = max(rows // 10, 1)
+    Student.import_students(generate_credentials(students))
+    ids = list(Student.students)
+    lines = [f"{ids[i % len(ids)]} {i % 7} {i % 5} 0 {i % 3}"
+             for i in range(rows)]
+
+    start = time.perf_counter()
+    Student.add_points_many(lines)
+    report("add_points_many", rows, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        for line in lines:
+            student_id, points = line.split(' ', 1)
+            Student.students[int(student_id)].add_points(points)
+    report("add_points (row by row)", rows, time.perf_counter() - start)
+
+
+def bench_memory_layout(rows: int) -> None:
+    """Память на студента: словарь объектов против столбцового хранилища."""
+    for name, columnar in (("dict of Student", False),
+                           ("ColumnarStudentStore", True)):
+        reset_state()
+        if columnar:
+            Student.use_columnar_store()
+        gc.collect()
+        tracemalloc.start()
+        Student.import_students(generate_credentials(rows))
+        gc.collect()
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        students = len(Student.students)
+        print(f"{name}: {students} students, {used / 2 ** 20:.1f} MiB "
+              f"({used / students:.0f} bytes/student)")
+
+
+def bench_top_students(rows: int) -> None:
+    """Запросы рейтинга курса при большом числе студентов."""
+    reset_state()
+    Student.import_students(generate_credentials(rows))
+    Student.add_points_many(f"{student_id} {student_id % 599 + 1} 0 0 0"
+                            for student_id in Student.students)
+    course = Course.courses["Python"]
+    students = len(course.student_scores)
+
+    for name, query in (
+            ("get_top_students (full)", course.get_top_students),
+            ("get_top_students (top 10)",
+             lambda: course.get_top_students(limit=10)),
+            ("get_student_rank", lambda: course.get_student_rank(1000)),
+    ):
+        repeats = 10
+        start = time.perf_counter()
+        for _ in range(repeats):
+            query()
+        elapsed = (time.perf_counter() - start) / repeats
+        print(f"{name}: {students} students, {elapsed * 1000:.3f} ms/call")
+
+
+def bench_statistics(rows: int) -> None:
+    """get_statistic при росте количества курсов."""
+    for course_count in (10, 100, 1000, 10000):
+        reset_state()
+        Course.courses = {}
+        TrackerStatistics.reset()
+        courses = [Course(f"Course{i}", 100 + i)
+                   for i in range(course_count)]
+        students = [Student("John", "Smith", f"js{i}@example.com")
+                    for i in range(min(rows, 50))]
+        # У курсов разное число студентов, заданий и средний балл.
+        for i, course in enumerate(courses):
+            for student in students[:i % len(students) + 1]:
+                course.update(student, i + 1)
+
+        statistics = TrackerStatistics()
+        for name, query in (("get_statistic", statistics.get_statistic),
+                            ("get_exact_statistic",
+                             statistics.get_exact_statistic)):
+            repeats = 100
+            start = time.perf_counter()
+            for _ in range(repeats):
+                query()
+            elapsed = (time.perf_counter() - start) / repeats
+            print(f"{name}: {course_count} courses, "
+                  f"{elapsed * 1000:.3f} ms/call")
+
+
+def bench_completion_memory(rows: int) -> None:
+    """Память очереди выпускников при повторных баллах после выпуска."""
+    reset_state()
+    students = 1000
+    Student.import_students(f"John Smith js{i}@example.com"
+                            for i in range(students))
+    Student.add_points_many(f"{student_id} 600 400 480 550"
+                            for student_id in Student.students)
+    ids = list(Student.students)
+
+    step = max(rows // 5, 1)
+    tracemalloc.start()
+    for done in range(step, rows + 1, step):
+        Student.add_points_many(f"{ids[i % students]} 1 1 1 1"
+                                for i in range(step))
+        used, _ = tracemalloc.get_traced_memory()
+        queued = sum(len(course.completed_course)
+                     for course in Course.courses.values())
+        print(f"completion queue after {done} updates: "
+              f"{queued} entries, {used / 2 ** 10:.0f} KiB traced")
+    tracemalloc.stop()
+
+
+def bench_notify(rows: int) -> None:
+    """Скорость и пиковая память команды notify."""
+    for name, make_sink in (
+            ("stream", lambda directory: StreamNotificationSink(
+                open(os.devnull, 'w'))),
+            ("maildir", MaildirNotificationSink),
+    ):
+        reset_state()
+        Student.import_students(generate_credentials(rows))
+        Student.add_points_many(f"{student_id} 600 0 0 0"
+                                for student_id in Student.students)
+        with tempfile.TemporaryDirectory() as directory:
+            tracker = LearningProgressTracker(make_sink(directory))
+            tracemalloc.start()
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                tracker.commands["notify"]()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        messages = len(Student.students)
+        print(f"notify ({name}): {messages} messages in {elapsed:.2f}s "
+              f"({messages / elapsed:,.0f} messages/s), "
+              f"peak {peak / 2 ** 20:.1f} MiB")
+
+
+def bench_storage(rows: int) -> None:
+    """Запись в журнал, снимок и холодный старт хранилища."""
+    with tempfile.TemporaryDirectory() as directory:
+        reset_state()
+        storage = TrackerStorage(directory)
+        storage.open()
+        start = time.perf_counter()
+        Student.import_students(generate_credentials(rows))
+        Student.add_points_many(f"{student_id} 1 2 3 4"
+                                for student_id in Student.students)
+        storage.sync()
+        events = len(Student.students) * 2
+        report("storage log write (events)", events,
+               time.perf_counter() - start)
+
+        start = time.perf_counter()
+        storage.close()
+        reset_state()
+        TrackerStorage(directory).open()
+        report("cold start from log (events)", events,
+               time.perf_counter() - start)
+
+        storage = TrackerStorage.active
+        start = time.perf_counter()
+        storage.checkpoint()
+        report("snapshot write (students)", len(Student.students),
+               time.perf_counter() - start)
+
+        storage.close()
+        reset_state()
+        start = time.perf_counter()
+        TrackerStorage(directory).open()
+        report("cold start from snapshot (students)", len(Student.students),
+               time.perf_counter() - start)
+        TrackerStorage.active.close()
+
+
+def bench_reports(rows: int, polls: int = 200) -> None:
+    """
+    Панель, которая в цикле опрашивает find, statistics и рейтинги
+    курсов: с готовыми строками из кешей и с построением заново.
+    Третий замер - опрос вперемешку с добавлением баллов.
+    """
+    reset_state()
+    Student.import_students(generate_credentials(rows))
+    Student.add_points_many(f"{student_id} {student_id % 700} "
+                            f"{student_id % 3} 0 {student_id % 5 * 100}"
+                            for student_id in Student.students)
+    ids = list(Student.students)[:100]
+    tracker = LearningProgressTracker()
+
+    def poll() -> None:
+        for student_id in ids:
+            tracker._find_student_score(str(student_id))
+        tracker._get_statistic()
+        for name in tracker._get_course_names():
+            Course.courses[name].get_top_students(limit=10)
+
+    def clear_caches() -> None:
+        Student.score_cache.clear()
+        for course in Course.courses.values():
+            course.reports.clear()
+        TrackerStatistics.report = None
+
+    def poll_with_points(i: int) -> None:
+        Student.add_points_many([f"{ids[i % len(ids)]} 1 0 0 1"])
+        poll()
+
+    for name, step in (("rendered", lambda i: (clear_caches(), poll())),
+                       ("cached", lambda i: poll()),
+                       ("cached + add points", poll_with_points)):
+        poll()
+        start = time.perf_counter()
+        for i in range(polls):
+            step(i)
+        elapsed = (time.perf_counter() - start) / polls
+        print(f"dashboard poll ({len(ids)} find + statistics + top), "
+              f"{name}: {elapsed * 1e6:.1f} us/poll")
+
+
+def _plain_state() -> dict:
+    """Состояние трекера из встроенных типов для pickle и JSON."""
+    return {
+        "id_counter": Student.id_counter,
+        "students": [[s.id, s.first_name, s.last_name, s.email]
+                     for s in Student.students.values()],
+        "courses": [[c.name, c.passing_scores, c.completed_tasks,
+                     c.all_score, list(c.student_scores.items()),
+                     [s.id for s in c.completed_course], sorted(c.notified)]
+                    for c in Course.courses.values()],
+    }
+
+
+def _restore_plain_state(state: dict) -> None:
+    """Восстанавливает студентов и курсы из результата _plain_state."""
+    reset_state()
+    Course.courses.clear()
+    TrackerStatistics.reset()
+    for student_id, first_name, last_name, email in state["students"]:
+        Student._restore(student_id, first_name, last_name, email)
+    Student.id_counter = state["id_counter"]
+    for (name, passing_scores, completed_tasks, all_score, scores,
+         pending, notified) in state["courses"]:
+        course = Course(name, passing_scores)
+        course.completed_tasks = completed_tasks
+        course.all_score = all_score
+        course.student_scores = dict(scores)
+        course.ranking = sorted((-points, student_id)
+                                for student_id, points in scores)
+        course.completed_course = [Student.students[student_id]
+                                   for student_id in pending]
+        course.notified = set(notified)
+        TrackerStatistics.course_updated(course)
+
+
+def bench_image(rows: int) -> None:
+    """
+    Образ TrackerImage против pickle и JSON: запись, размер файла
+    и открытие до первого ответа на find и рейтинг курса.
+    """
+    reset_state()
+    Student.import_students(generate_credentials(rows))
+    Student.add_points_many(f"{student_id} {student_id % 700} "
+                            f"{student_id % 3} 0 {student_id % 5 * 100}"
+                            for student_id in Student.students)
+    with open(os.devnull, 'w') as output, redirect_stdout(output):
+        LearningProgressTracker().commands["notify"]()
+    probe = next(iter(Student.students))
+    expected = (Student.students[probe].get_student_score(),
+                Course.courses["Python"].get_top_students(limit=10))
+
+    def write_pickle(path: str) -> None:
+        with open(path, 'wb') as file:
+            pickle.dump(_plain_state(), file, pickle.HIGHEST_PROTOCOL)
+
+    def open_pickle(path: str) -> None:
+        with open(path, 'rb') as file:
+            _restore_plain_state(pickle.load(file))
+
+    def write_json(path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(_plain_state(), file)
+
+    def open_json(path: str) -> None:
+        with open(path, encoding='utf-8') as file:
+            _restore_plain_state(json.load(file))
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {}
+        for name, write in (("image", TrackerImage.export),
+                            ("pickle", write_pickle), ("json", write_json)):
+            paths[name] = os.path.join(directory, f"state.{name}")
+            start = time.perf_counter()
+            write(paths[name])
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(paths[name])
+            print(f"{name} write: {elapsed:.2f}s, "
+                  f"{size / len(Student.students):.1f} bytes/student")
+
+        for name, load in (("image", TrackerImage.load),
+                           ("pickle", open_pickle), ("json", open_json)):
+            reset_state()
+            gc.collect()
+            start = time.perf_counter()
+            load(paths[name])
+            opened = time.perf_counter() - start
+            answer = (Student.students[probe].get_student_score(),
+                      Course.courses["Python"].get_top_students(limit=10))
+            total = time.perf_counter() - start
+            assert answer == expected, name
+            print(f"{name} open: {opened * 1000:.1f} ms, "
+                  f"first find + top: {total * 1000:.1f} ms")
+        reset_state()
+
+
+def bench_sqlite(rows: int) -> None:
+    """Хранение в памяти против SQLite на одинаковых операциях."""
+    with tempfile.TemporaryDirectory() as directory:
+        reset_state()
+        trackers = {
+            "memory": LearningProgressTracker(),
+            "sqlite": SQLiteLearningProgressTracker(
+                os.path.join(directory, "tracker.sqlite"), COURSES_POINTS
+            ),
+        }
+        for name, tracker in trackers.items():
+            start = time.perf_counter()
+            tracker.import_students(generate_credentials(rows))
+            report(f"{name}: import_students", rows,
+                   time.perf_counter() - start)
+
+            start = time.perf_counter()
+            tracker.import_points(f"{1000 + i % (rows * 9 // 10)} "
+                                  f"{i % 7} {i % 5} 0 {i % 3}"
+                                  for i in range(rows))
+            report(f"{name}: import_points", rows,
+                   time.perf_counter() - start)
+
+            for query_name, query in (
+                    ("find", lambda: tracker._find_student_score("1500")),
+                    ("get_top_students",
+                     lambda: tracker._get_top_students("Python")),
+                    ("statistics", tracker._get_statistic),
+            ):
+                repeats = 10
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    query()
+                elapsed = (time.perf_counter() - start) / repeats
+                print(f"{name}: {query_name} {elapsed * 1000:.3f} ms/call")
+        trackers["sqlite"].close()
+
+
+def bench_validation(rows: int) -> None:
+    """Проверка данных студентов: re.match по строкам против валидатора."""
+    lines = list(generate_credentials(rows))
+    credentials = [Student.parse_credentials(line.rstrip("\n"))
+                   for line in lines]
+
+    start = time.perf_counter()
+    for first_name, last_name, email in credentials:
+        (re.match(Student.name_pattern, first_name) is not None
+         and re.match(Student.name_pattern, last_name) is not None
+         and re.match(Student.email_pattern, email) is not None)
+    report("re.match with raw patterns", rows, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for first_name, last_name, email in credentials:
+        StudentValidator.error_code(first_name, last_name, email)
+    report("StudentValidator.error_code", rows, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    StudentValidator.validate_many(line.rstrip("\n") for line in lines)
+    report("StudentValidator.validate_many", rows,
+           time.perf_counter() - start)
+
+
+async def _server_client(port: int, client: int, requests: int,
+                         latencies: list[float]) -> None:
+    """Клиент нагрузочного теста: добавляет студента и ищет его."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    await reader.readline()
+    writer.write(f"add students\nJohn Smith js{client}@example.com\n"
+                 f"back\nfind\n".encode())
+    for _ in range(4):
+        await reader.readline()
+    for i in range(requests):
+        start = time.perf_counter()
+        writer.write(f"{1000 + (client + i) % 1000}\n".encode())
+        await reader.readline()
+        latencies.append(time.perf_counter() - start)
+    writer.write(b"back\nexit\n")
+    await reader.read()
+    writer.close()
+
+
+async def _server_load(port: int, connections: int,
+                       requests: int) -> tuple[list[float], float]:
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _server_client(port, client, requests, latencies)
+        for client in range(connections)
+    ))
+    return latencies, time.perf_counter() - start
+
+
+def bench_server(rows: int, connections: int = 1000) -> None:
+    """Сервер трекера под нагрузкой от множества подключений."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen([sys.executable, "task_v2.py", "--serve",
+                               f"127.0.0.1:{port}"],
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.05)
+        requests = max(rows // connections, 1)
+        latencies, elapsed = asyncio.run(
+            _server_load(port, connections, requests)
+        )
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"server: {connections} connections, {len(latencies)} commands "
+          f"in {elapsed:.2f}s ({len(latencies) / elapsed:,.0f} commands/s), "
+          f"p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+
+
+def bench_concurrent(rows: int) -> None:
+    """
+    Добавление баллов из пула потоков с включенными блокировками.
+    Проверяет, что итоговые суммы совпадают с ожидаемыми.
+    """
+    students = max(rows // 10, 1)
+    for workers in (1, 2, 4, 8):
+        reset_state()
+        Student.import_students(generate_credentials(students))
+        TrackerLocks.enable()
+        ids = list(Student.students)
+        lines = [f"{ids[i % len(ids)]} 1 2 0 3" for i in range(rows)]
+        chunks = [lines[i::workers] for i in range(workers)]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(Student.add_points_many, chunks))
+        elapsed = time.perf_counter() - start
+        TrackerLocks.disable()
+
+        totals = [course.all_score for course in Course.courses.values()]
+        assert totals == [rows, 2 * rows, 0, 3 * rows], totals
+        report(f"concurrent add_points_many ({workers} workers)",
+               rows, elapsed)
+
+
+def bench_parallel_points(rows: int) -> None:
+    """Многопроцессное добавление баллов против add_points_many."""
+    students = max(rows // 10, 1)
+    lines = [f"{1000 + i * 7919 % students} {i % 7} {i % 5} 0 {i % 3}"
+             for i in range(rows)]
+    runs = [("add_points_many", Student.add_points_many)]
+    runs += [(f"add_points_parallel ({workers} workers)",
+              partial(Student.add_points_parallel, workers=workers))
+             for workers in sorted({1, 2, 4, os.cpu_count() or 1})]
+
+    totals = []
+    for name, add_points in runs:
+        reset_state()
+        Student.import_students(f"John Smith user{i}@example.com"
+                                for i in range(students))
+        start = time.perf_counter()
+        add_points(lines)
+        report(name, rows, time.perf_counter() - start)
+        totals.append([course.all_score
+                       for course in Course.courses.values()])
+    assert all(total == totals[0] for total in totals), totals
+
+
+def generate_script(rows: int) -> Iterator[str]:
+    """
+    Сценарий сессии примерно из rows строк: студенты, баллы,
+    поиск, статистика и уведомления.
+    """
+    students = max(rows // 10, 1)
+    yield "add students\n"
+    for i in range(students):
+        yield f"John Smith user{i}@example.com\n"
+    yield "back\n"
+    points = (rows - students) * 3 // 4
+    yield "add points\n"
+    for i in range(points):
+        yield f"{1000 + i % students} {i % 7} {i % 5} 0 {i % 3}\n"
+    yield "back\n"
+    yield "find\n"
+    for i in range(rows - students - points):
+        yield f"{1000 + i % students}\n"
+    yield "back\n"
+    yield "statistics\n"
+    yield from ("Python\n", "DSA\n", "Databases\n", "Flask\n", "back\n")
+    yield "notify\n"
+    yield "exit\n"
+
+
+def bench_script(rows: int) -> None:
+    """
+    Пакетное выполнение сценария против интерактивного start().
+    Для сценария на 10M строк: benchmark.py script --rows 10000000.
+    """
+    reset_state()
+    with open(os.devnull, 'w') as output:
+        start = time.perf_counter()
+        count = LearningProgressTracker().run_script(generate_script(rows),
+                                                     output)
+        report("run_script", count, time.perf_counter() - start)
+
+    # Интерактивный режим заметно медленнее, сравниваем на части строк.
+    script = [line.rstrip('\n')
+              for line in generate_script(min(rows, 200_000))]
+    reset_state()
+    with open(os.devnull, 'w') as output:
+        start = time.perf_counter()
+        LearningProgressTracker().run_script(script, output)
+        report("run_script (same script as start)", len(script),
+               time.perf_counter() - start)
+
+    reset_state()
+    with open(os.devnull, 'w') as output, redirect_stdout(output), \
+            patch("builtins.input", side_effect=script):
+        start = time.perf_counter()
+        LearningProgressTracker().start()
+        elapsed = time.perf_counter() - start
+    report("start (input/print)", len(script), elapsed)
+
+
+def bench_metrics(rows: int) -> None:
+    """
+    Стоимость метрик: сценарий без проверки включения, с выключенными
+    и с включенными метриками.
+    """
+    script = [line.rstrip('\n') for line in generate_script(rows)]
+    for name, enabled, feed in (
+            ("dispatch without metrics check", False,
+             LearningProgressTracker._dispatch),
+            ("feed, metrics disabled", False, LearningProgressTracker.feed),
+            ("feed, metrics enabled", True, LearningProgressTracker.feed),
+    ):
+        reset_state()
+        TrackerMetrics.reset()
+        if enabled:
+            TrackerMetrics.enable()
+        tracker = LearningProgressTracker()
+        with open(os.devnull, 'w') as output, redirect_stdout(output):
+            start = time.perf_counter()
+            for line in script:
+                feed(tracker, line)
+            elapsed = time.perf_counter() - start
+        TrackerMetrics.disable()
+        report(name, len(script), elapsed)
+
+
+def bench_catalog(rows: int, course_count: int = 500) -> None:
+    """
+    Каталог из course_count курсов: память на студента, add_points,
+    find, рейтинг курса, добавление и удаление курса.
+    """
+    reset_state()
+    Course.courses = {}
+    TrackerStatistics.reset()
+    courses = [Course(f"Course{i}", 100) for i in range(course_count)]
+    students = max(rows // 10, 1)
+
+    gc.collect()
+    tracemalloc.start()
+    Student.import_students(generate_credentials(students))
+    # Каждый студент получает баллы в трех курсах из course_count.
+    zeros = ["0"] * course_count
+    for student_id in Student.students:
+        for column in (student_id % course_count, student_id * 7 % 97,
+                       student_id * 13 % course_count):
+            zeros[column] = "5"
+        Student.add_points_many([f"{student_id} {' '.join(zeros)}"])
+        zeros = ["0"] * course_count
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(Student.students)
+    print(f"catalog: {course_count} courses, {count} students, "
+          f"{used / count:.0f} bytes/student with scores")
+
+    ids = list(Student.students)
+    row = " ".join(str(i % 3) for i in range(course_count))
+    timings = []
+    with open(os.devnull, 'w') as output, redirect_stdout(output):
+        for name, query in (
+                ("add_points (500 columns)",
+                 lambda i: Student.students[ids[i % count]].add_points(row)),
+                ("find", lambda i: Student.students[
+                    ids[i % count]].get_student_score()),
+                ("get_top_students (top 10)",
+                 lambda i: courses[i % course_count].get_top_students(
+                     limit=10)),
+                ("add course + remove course",
+                 lambda i: Course.remove(Course(f"Extra{i}", 100).name)),
+        ):
+            repeats = 1000
+            start = time.perf_counter()
+            for i in range(repeats):
+                query(i)
+            timings.append((name, (time.perf_counter() - start) / repeats))
+    for name, elapsed in timings:
+        print(f"{name}: {elapsed * 1e6:.1f} us/call")
+
+
+def _letters(number: int) -> str:
+    """Записывает число буквами, чтобы получить много разных имен."""
+    word = ""
+    while True:
+        number, digit = divmod(number, 26)
+        word += chr(ord('a') + digit)
+        if not number:
+            return word.capitalize()
+
+
+def bench_find(rows: int) -> None:
+    """
+    find по email, фамилии, полному имени и префиксу против
+    перебора Student.students.
+    """
+    reset_state()
+    lines = [f"{_letters(i % 5000)}a {_letters(i // 7)}son "
+             f"user{i}@example.com" for i in range(rows)]
+    start = time.perf_counter()
+    Student.import_students(lines)
+    report("import_students with indexes", rows, time.perf_counter() - start)
+
+    tracker = LearningProgressTracker()
+    rng = random.Random(1)
+    samples = [Student.students[rng.randrange(1000, 1000 + rows)]
+               for _ in range(1000)]
+    for kind, key in (
+            ("email", lambda s: s.email),
+            ("name", lambda s: s.last_name.upper()),
+            ("name", lambda s: f"{s.first_name} {s.last_name}"),
+            ("prefix", lambda s: s.email[:7]),
+            ("prefix", lambda s: s.last_name[:3].lower()),
+    ):
+        queries = [key(student) for student in samples]
+        start = time.perf_counter()
+        for value in queries:
+            tracker._find_student_ids(kind, value)
+        elapsed = (time.perf_counter() - start) / len(queries)
+        print(f"find {kind} ({queries[0]!r}): {elapsed * 1e6:.1f} us/call")
+
+    email = samples[0].email
+    start = time.perf_counter()
+    next(student_id for student_id, student in Student.students.items()
+         if student.email == email)
+    print(f"scan Student.students by email: "
+          f"{(time.perf_counter() - start) * 1e6:.1f} us/call")
+
+
+def bench_history(rows: int, days: int = 90) -> None:
+    """
+    История баллов: запись rows событий за days дней и запрос окна
+    в 30 дней по итогам интервалов против перебора событий.
+    Отдельно - цена истории для add_points_many.
+    """
+    reset_state()
+    courses = list(Course.courses.values())
+    history = PointHistory()
+    rng = random.Random(2)
+    start_time = 1_700_000_000
+    batch = 1000
+    # Одна строка на студента дает в среднем два события.
+    batches = [[(1000 + rng.randrange(rows),
+                 [rng.choice((0, 0, 5, 60)) for _ in courses])
+                for _ in range(batch)] for _ in range(64)]
+    step = days * 86400 * batch // (rows // 2 or 1)
+    start = time.perf_counter()
+    timestamp = start_time
+    while len(history) < rows:
+        history.record(batches[timestamp % 64], courses, timestamp)
+        timestamp += max(step, 1)
+    elapsed = time.perf_counter() - start
+    print(f"history ingest: {len(history) / elapsed:,.0f} events/s "
+          f"({len(history)} events, {len(history.partitions)} partitions)")
+
+    end = timestamp - 12345
+    window = (end - 30 * 86400, end)
+    start = time.perf_counter()
+    for _ in range(100):
+        result = history.window(*window)
+    elapsed = (time.perf_counter() - start) / 100
+    print(f"history 30-day window: {elapsed * 1e3:.2f} ms/query, "
+          f"{sum(tasks for tasks, _ in result.values())} events")
+
+    start = time.perf_counter()
+    for partition in history.partitions.values():
+        sum(points for timestamp, points
+            in zip(partition.timestamps, partition.points)
+            if window[0] <= timestamp < window[1])
+    print(f"history 30-day scan: "
+          f"{(time.perf_counter() - start) * 1e3:.2f} ms/query")
+    del history, batches
+
+    Student.import_students(generate_credentials(10_000))
+    lines = [f"{1000 + i % 9000} {i % 7} 0 {i % 3} 5"
+             for i in range(min(rows, 1_000_000))]
+    for name, active in (("off", None), ("on", PointHistory())):
+        PointHistory.active = active
+        start = time.perf_counter()
+        Student.add_points_many(lines)
+        report(f"add_points_many, history {name}", len(lines),
+               time.perf_counter() - start)
+    PointHistory.active = None
+
+
+def bench_cohorts(rows: int, cohorts: int = 1000) -> None:
+    """
+    Много когорт в одном процессе: память и время создания когорт,
+    импорт rows студентов и команды вперемешку по всем когортам.
+    Для сравнения - RSS отдельного интерпретатора с одной когортой.
+    """
+    code = ("import resource, task_v2\n"
+            "task_v2.TrackerContext({'Python': 600, 'DSA': 400, "
+            "'Databases': 480, 'Flask': 550})\n"
+            "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)")
+    process_rss = int(subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True,
+        check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout)
+    print(f"one interpreter per cohort: {process_rss / 1024:.1f} MiB RSS "
+          f"each, {process_rss * cohorts / 2 ** 20:.1f} GiB for {cohorts}")
+
+    reset_state()
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    contexts = [TrackerContext(COURSES_POINTS) for _ in range(cohorts)]
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{cohorts} empty cohorts: {elapsed * 1e3:.1f} ms, "
+          f"{used / 2 ** 20:.1f} MiB ({used / cohorts / 1024:.1f} "
+          f"KiB/cohort)")
+
+    trackers = [LearningProgressTracker(context=context)
+                for context in contexts]
+    per_cohort = max(rows // cohorts, 1)
+    lines = list(generate_credentials(per_cohort))
+    start = time.perf_counter()
+    for tracker in trackers:
+        tracker.import_students(lines)
+    report(f"import_students into {cohorts} cohorts",
+           per_cohort * cohorts, time.perf_counter() - start)
+
+    rng = random.Random(3)
+    commands = []
+    for _ in range(100_000):
+        tracker = trackers[rng.randrange(cohorts)]
+        student_id = 1000 + rng.randrange(per_cohort)
+        commands += [(tracker, "add points"),
+                     (tracker, f"{student_id} 5 0 10 0"),
+                     (tracker, "back"), (tracker, "find"),
+                     (tracker, str(student_id)), (tracker, "back")]
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for tracker, line in commands:
+            tracker.feed(line)
+        elapsed = time.perf_counter() - start
+    print(f"mixed commands across {cohorts} cohorts: "
+          f"{elapsed / len(commands) * 1e6:.2f} us/line")
+
+    # Те же команды в одной когорте (как в отдельном процессе).
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _, line in commands:
+            trackers[0].feed(line)
+        elapsed = time.perf_counter() - start
+    print(f"same commands in one cohort: "
+          f"{elapsed / len(commands) * 1e6:.2f} us/line")
+
+
+def bench_sketches(rows: int) -> None:
+    """
+    Приближенная статистика: цена скетчей для add_points_many,
+    их память против словаря баллов курса и запросы медианы и
+    числа студентов против точного расчета.
+    """
+    students = max(rows // 50, 1)
+    lines = [f"{1000 + i * 7919 % students} {i % 97 + 1} {i % 5} 0 {i % 3}"
+             for i in range(rows)]
+    for approximate in (False, True):
+        # Прошлая когорта не должна замедлять сборку мусора.
+        context = None
+        gc.collect()
+        context = TrackerContext(COURSES_POINTS)
+        with context.activate():
+            Student.import_students(f"John Smith js{i}@example.com"
+                                    for i in range(students))
+            if approximate:
+                context.enable_sketches()
+            start = time.perf_counter()
+            Student.add_points_many(lines)
+            report("add_points_many, sketches "
+                   f"{'on' if approximate else 'off'}",
+                   rows, time.perf_counter() - start)
+
+    with context.activate():
+        course = Course.courses["Python"]
+        sketches = course.sketches
+        sketch_size = (len(sketches.students.registers)
+                       + sum(len(row) * row.itemsize
+                             for row in sketches.tasks.rows)
+                       + sys.getsizeof(sketches.scores.buckets))
+        dict_size = sys.getsizeof(course.student_scores)
+        print(f"Python course: {len(course.student_scores)} students, "
+              f"scores dict {dict_size / 2 ** 20:.1f} MiB, "
+              f"sketches {sketch_size / 1024:.0f} KiB")
+
+        statistics = TrackerStatistics()
+        for name, func in (
+                ("approximate statistics",
+                 statistics.get_approximate_statistic),
+                ("exact median and p90",
+                 lambda: [sorted(c.student_scores.values())[
+                     int(q * (len(c.student_scores) - 1))]
+                     for c in Course.courses.values() if c.student_scores
+                     for q in (0.5, 0.9)]),
+        ):
+            start = time.perf_counter()
+            for _ in range(10):
+                func()
+            elapsed = (time.perf_counter() - start) / 10
+            print(f"{name}: {elapsed * 1e3:.2f} ms/call")
+
+
+def bench_events(rows: int) -> None:
+    """
+    Шина событий: пропускная способность publish_many с подпиской и
+    с журналом JSON Lines, цена шины для add_points и add_points_many.
+    """
+    events = [ScoreChanged("Python", 1000 + i % 1000, i, i + 1)
+              for i in range(rows)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "events.jsonl")
+        for name, bus in (
+                ("subscriber", EventBus()),
+                ("jsonl sink", EventBus(JsonlEventSink(path))),
+        ):
+            subscription = bus.subscribe(capacity=rows)
+            start = time.perf_counter()
+            for i in range(0, rows, 1000):
+                bus.publish_many(events[i:i + 1000])
+            report(f"publish_many, {name}", rows,
+                   time.perf_counter() - start)
+            assert len(subscription.poll()) == rows
+            bus.close()
+        start = time.perf_counter()
+        consumed = sum(1 for _ in JsonlEventSink.read(path,
+                                                      after=rows // 2))
+        report("read jsonl from offset", rows - rows // 2 - 1,
+               time.perf_counter() - start)
+        assert consumed == rows - rows // 2 - 1
+
+    students = max(rows // 100, 1)
+    lines = [f"{1000 + i * 7919 % students} {i % 97 + 1} {i % 5} 0 {i % 3}"
+             for i in range(rows)]
+    single = lines[:rows // 10]
+    for enabled in (False, True):
+        context = None
+        gc.collect()
+        context = TrackerContext(COURSES_POINTS)
+        with context.activate():
+            Student.import_students(f"John Smith js{i}@example.com"
+                                    for i in range(students))
+            if enabled:
+                context.events = EventBus()
+                subscription = context.events.subscribe(capacity=10_000)
+            label = f"events {'on' if enabled else 'off'}"
+            with redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                for line in single:
+                    student_id, points = line.split(' ', 1)
+                    Student.students[int(student_id)].add_points(points)
+            report(f"add_points, {label}", len(single),
+                   time.perf_counter() - start)
+            start = time.perf_counter()
+            Student.add_points_many(lines)
+            report(f"add_points_many, {label}", rows,
+                   time.perf_counter() - start)
+            if enabled:
+                print(f"subscriber dropped {subscription.dropped} events")
+
+
+def bench_email_index(rows: int) -> None:
+    """
+    Проверка повторов email: import_students и проверки в секунду
+    для занятых и новых email со словарем Student.emails и с
+    DiskEmailIndex, память самих индексов (строки email у студентов
+    есть в обоих случаях, их размер выводится отдельно).
+    """
+    emails = [f"user{i}@example.com" for i in range(rows)]
+    fresh = [f"fresh{i}@example.com" for i in range(rows)]
+    lines = [f"John Smith {email}" for email in emails]
+    strings = sum(map(sys.getsizeof, emails))
+    print(f"email strings: {strings / rows:.1f} B/email")
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("dict", "disk index"):
+            context = None
+            gc.collect()
+            context = TrackerContext(COURSES_POINTS)
+            with context.activate():
+                if name == "disk index":
+                    Student.use_disk_email_index(directory, rows)
+                start = time.perf_counter()
+                Student.import_students(lines)
+                report(f"import_students, {name}", rows,
+                       time.perf_counter() - start)
+                index = Student.emails
+                for kind, sample in (("taken", emails), ("new", fresh)):
+                    start = time.perf_counter()
+                    found = sum(email in index for email in sample)
+                    elapsed = time.perf_counter() - start
+                    assert found == (len(sample) if kind == "taken" else 0)
+                    print(f"{name}, {kind} emails: "
+                          f"{rows / elapsed:,.0f} lookups/s")
+
+                gc.collect()
+                tracemalloc.start()
+                if name == "dict":
+                    copy = dict(index)
+                    disk = 0
+                else:
+                    copy = DiskEmailIndex(rows, directory)
+                    for email, student_id in zip(emails, Student.students):
+                        copy[email] = student_id
+                    disk = copy.map.size()
+                used, _ = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f"{name}: {used / rows:.1f} B/email in memory, "
+                      f"{disk / rows:.1f} B/email in file")
+                if name == "disk index":
+                    copy.close()
+                    index.close()
+                copy = None
+
+
+def _peak_rss_kib() -> int:
+    """Пиковый RSS процесса в KiB (на Linux ru_maxrss уже в KiB)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def measure(size: int, operation: str, func: Callable,
+            calls: Iterable[tuple], items_per_call: int = 1) -> dict:
+    """
+    Вызывает func для каждого набора аргументов из calls и замеряет
+    каждый вызов отдельно. Подготовка аргументов в замер не входит.
+    """
+    samples = array('q')
+    timer = time.perf_counter_ns
+    for args in calls:
+        start = timer()
+        func(*args)
+        samples.append(timer() - start)
+
+    total = sum(samples) / 1e9
+    ordered = sorted(samples)
+
+    def percentile(q: float) -> float:
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)] / 1e3
+
+    return {
+        "size": size,
+        "operation": operation,
+        "calls": len(samples),
+        "seconds": total,
+        "throughput": len(samples) * items_per_call / total if total else 0,
+        "p50_us": percentile(0.5),
+        "p90_us": percentile(0.9),
+        "p99_us": percentile(0.99),
+        "max_us": ordered[-1] / 1e3,
+        "peak_rss_kib": _peak_rss_kib(),
+    }
+
+
+def print_result(result: dict) -> None:
+    """Выводит одну строку результатов run_suite."""
+    print(f"{result['size']:>10} {result['operation']:<20} "
+          f"{result['calls']:>10} calls {result['throughput']:>14,.0f} /s  "
+          f"p50 {result['p50_us']:.1f} us  p99 {result['p99_us']:.1f} us  "
+          f"peak RSS {result['peak_rss_kib'] / 1024:.0f} MiB")
+
+
+def run_suite(sizes: Iterable[int]) -> list[dict]:
+    """
+    Замеры основных операций трекера на синтетических данных:
+    size студентов и size строк с баллами.
+    """
+    all_results = []
+    for size in sizes:
+        results = []
+        reset_state()
+        results.append(measure(
+            size, "Student.__init__", Student,
+            (("John", "Smith", f"user{i}@example.com") for i in range(size)),
+        ))
+        ids = list(Student.students)
+        with open(os.devnull, 'w') as output, redirect_stdout(output):
+            results.append(measure(
+                size, "add_points", Student.add_points,
+                ((Student.students[ids[i * 7919 % size]],
+                  f"{i % 11} {i % 7} {i % 5} {i % 13}")
+                 for i in range(size)),
+            ))
+        results.append(measure(
+            size, "get_student_score", Student.get_student_score,
+            ((Student.students[student_id],) for student_id in ids),
+        ))
+        courses = list(Course.courses.values())
+        results.append(measure(
+            size, "get_top_students", Course.get_top_students,
+            ((course,) for course in courses * 3),
+        ))
+        statistics = TrackerStatistics()
+        results.append(measure(
+            size, "get_statistic", statistics.get_statistic,
+            (() for _ in range(1000)),
+        ))
+        # Все студенты оканчивают Python, чтобы notify было что отправлять.
+        Student.add_points_many(f"{student_id} 600 0 0 0"
+                                for student_id in ids)
+        queued = sum(len(course.completed_course) for course in courses)
+        with open(os.devnull, 'w') as output, redirect_stdout(output):
+            tracker = LearningProgressTracker(StreamNotificationSink(output))
+            results.append(measure(
+                size, "notify", tracker.commands["notify"], [()],
+                items_per_call=max(queued, 1),
+            ))
+        # Вывод замеров подменен, поэтому печатаем результаты после них.
+        for result in results:
+            print_result(result)
+        all_results += results
+    return all_results
+
+
+def write_results(path: str, results: list[dict]) -> None:
+    """Сохраняет результаты замеров и описание окружения в JSON."""
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "results": results,
+        }, file, indent=2)
+
+
+def compare_results(old_path: str, new_path: str,
+                    threshold: float) -> int:
+    """
+    Сравнивает два прогона по совпадающим (size, operation).
+    Регрессия - падение пропускной способности или рост p99
+    больше чем на threshold. Возвращает количество регрессий.
+    """
+    runs = []
+    for path in (old_path, new_path):
+        with open(path, encoding='utf-8') as file:
+            runs.append({(result["size"], result["operation"]): result
+                         for result in json.load(file)["results"]})
+    old, new = runs
+
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        throughput = after["throughput"] / before["throughput"] - 1
+        p99 = after["p99_us"] / before["p99_us"] - 1
+        regressed = throughput < -threshold or p99 > threshold
+        regressions += regressed
+        print(f"{key[0]:>10} {key[1]:<20} throughput {throughput:+7.1%}  "
+              f"p99 {p99:+7.1%}{'  REGRESSION' if regressed else ''}")
+    for key in sorted(old.keys() ^ new.keys()):
+        print(f"{key[0]:>10} {key[1]:<20} only in "
+              f"{'old' if key in old else 'new'} run")
+    return regressions
+
+
+BENCHMARKS = {
+    "import_students": bench_import_students,
+    "add_points_many": bench_add_points_many,
+    "memory_layout": bench_memory_layout,
+    "top_students": bench_top_students,
+    "statistics": bench_statistics,
+    "completion_memory": bench_completion_memory,
+    "notify": bench_notify,
+    "storage": bench_storage,
+    "sqlite": bench_sqlite,
+    "validation": bench_validation,
+    "server": bench_server,
+    "concurrent": bench_concurrent,
+    "parallel_points": bench_parallel_points,
+    "script": bench_script,
+    "metrics": bench_metrics,
+    "catalog": bench_catalog,
+    "find": bench_find,
+    "image": bench_image,
+    "reports": bench_reports,
+    "history": bench_history,
+    "cohorts": bench_cohorts,
+    "sketches": bench_sketches,
+    "events": bench_events,
+    "email_index": bench_email_index,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("names", nargs="*",
+                        help="какие замеры запускать (по умолчанию все)")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--suite", action="store_true",
+                        help="замеры основных операций для --sizes")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10_000, 100_000],
+                        help="размеры данных для --suite")
+    parser.add_argument("--json", metavar="PATH",
+                        help="сохранить результаты --suite в JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="сравнить два JSON с результатами --suite")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="допустимое ухудшение для --compare")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    if args.compare:
+        sys.exit(1 if compare_results(*args.compare, args.threshold) else 0)
+    if args.suite:
+        results = run_suite(args.sizes)
+        if args.json:
+            write_results(args.json, results)
+        return
+
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name](args.rows)
+
+
+if __name__ == '__main__':
+    main()
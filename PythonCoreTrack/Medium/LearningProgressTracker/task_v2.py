@@ -1,6 +1,32 @@
 """Трекер образования студентов."""
 
+import argparse
+import asyncio
+import cProfile
+import io
+import json
+import math
+import mmap
+import os
 import re
+import socket
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_left, insort
+from contextlib import contextmanager, nullcontext, redirect_stdout
+from functools import partial, wraps
+from collections import Counter, OrderedDict, deque
+from collections.abc import Generator, Mapping, Sequence
+from contextvars import ContextVar
+from itertools import accumulate, chain, compress, islice, repeat
+from typing import Container, Iterable, Iterator, NamedTuple, TextIO
 
 
 class DataIsNotValid(Exception):
@@ -14,7 +40,540 @@ class EmailIsTaken(Exception):
     """
 
 
-class Student:
+class _WriteBarrier:
+    """
+    Барьер между изменениями состояния и снимком TrackerStorage.
+
+    Изменения проходят барьер совместно (with barrier), снимок -
+    исключительно (exclusive): он ждет, пока закончатся начатые
+    изменения, и не пускает новые. Поток, уже прошедший барьер,
+    проходит его повторно без ожидания.
+    """
+
+    def __init__(self) -> None:
+        self.changed = threading.Condition()
+        self.writers = 0
+        self.exclusive_held = False
+        self.local = threading.local()
+
+    def held(self) -> bool:
+        """Прошел ли барьер текущий поток."""
+        return getattr(self.local, 'depth', 0) > 0
+
+    def __enter__(self) -> None:
+        depth = getattr(self.local, 'depth', 0)
+        if not depth:
+            with self.changed:
+                self.changed.wait_for(lambda: not self.exclusive_held)
+                self.writers += 1
+        self.local.depth = depth + 1
+
+    def __exit__(self, *exc_info) -> None:
+        self.local.depth -= 1
+        if not self.local.depth:
+            with self.changed:
+                self.writers -= 1
+                if not self.writers:
+                    self.changed.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self.changed:
+            self.changed.wait_for(lambda: not self.exclusive_held)
+            self.exclusive_held = True
+            self.changed.wait_for(lambda: not self.writers)
+        try:
+            yield
+        finally:
+            with self.changed:
+                self.exclusive_held = False
+                self.changed.notify_all()
+
+
+class TrackerLocks:
+    """
+    Блокировки для обновления трекера из нескольких потоков.
+
+    По умолчанию вместо блокировок стоят пустые контекстные менеджеры,
+    и однопоточный трекер не платит за синхронизацию. enable включает
+    настоящие блокировки:
+    - registry защищает выдачу id, Student.students и Student.emails;
+    - students - полосы блокировок по id студента: строка баллов
+      add_points видна find целиком;
+    - у каждого курса своя блокировка для счетчиков и рейтинга;
+    - statistics защищает индексы критериев, поэтому статистика
+      читается согласованным снимком;
+    - storage упорядочивает запись событий в журнал;
+    - writes - барьер (_WriteBarrier): изменение состояния и его
+      запись в журнал проходят барьер вместе (writing), снимок
+      TrackerStorage делается, когда изменений нет (exclusive).
+    Блокировки захватываются в порядке барьер -> студент -> курс ->
+    статистика.
+    Блокировки общие для всех когорт (TrackerContext).
+    """
+
+    enabled = False
+    registry = nullcontext()
+    students = [nullcontext()]
+    statistics = nullcontext()
+    storage = nullcontext()
+    writes = nullcontext()
+
+    @classmethod
+    def enable(cls, shards: int = 64) -> None:
+        """Включает блокировки, в том числе у уже созданных курсов."""
+        cls.enabled = True
+        cls.registry = threading.Lock()
+        cls.students = [threading.Lock() for _ in range(shards)]
+        cls.statistics = threading.Lock()
+        cls.storage = threading.Lock()
+        cls.writes = _WriteBarrier()
+        for course in TrackerContext.all_courses():
+            course.lock = threading.Lock()
+
+    @classmethod
+    def disable(cls) -> None:
+        """Возвращает однопоточный режим без блокировок."""
+        cls.enabled = False
+        cls.registry = nullcontext()
+        cls.students = [nullcontext()]
+        cls.statistics = nullcontext()
+        cls.storage = nullcontext()
+        cls.writes = nullcontext()
+        for course in TrackerContext.all_courses():
+            course.lock = nullcontext()
+
+    @classmethod
+    @contextmanager
+    def writing(cls) -> Iterator[None]:
+        """
+        Изменение состояния вместе с записью в журнал. Снимок,
+        который назначил журнал, делается после выхода из блока.
+        """
+        with cls.writes:
+            yield
+        storage = TrackerStorage.active
+        if storage is not None and storage.checkpoint_due:
+            storage.checkpoint_if_due()
+
+    @classmethod
+    def exclusive(cls):
+        """Блок, во время которого состояние не меняется."""
+        return cls.writes.exclusive() if cls.enabled else nullcontext()
+
+    @classmethod
+    def course_lock(cls):
+        """Блокировка для нового курса."""
+        return threading.Lock() if cls.enabled else nullcontext()
+
+    @classmethod
+    def for_student(cls, student_id: int):
+        """Полоса блокировки, которой принадлежит студент."""
+        return cls.students[student_id % len(cls.students)]
+
+
+class LRUCache:
+    """
+    Ограниченный кеш, вытесняющий давно не использованные записи.
+
+    discard сбрасывает записи после изменения данных. Значение,
+    посчитанное до сброса, в кеш не попадает: put сверяет номер
+    сброса, взятый перед расчетом (stamp), с текущим.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Значение из кеша или None."""
+        try:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        except KeyError:
+            return None
+
+    def put(self, key, value, stamp: int | None = None) -> None:
+        with self.lock:
+            if stamp is not None and stamp != self.invalidations:
+                return
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def discard(self, keys: Iterable) -> None:
+        """Сбрасывает записи для ключей keys."""
+        with self.lock:
+            self.invalidations += 1
+            if self.entries:
+                for key in keys:
+                    self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.invalidations += 1
+            self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class StudentValidator:
+    """
+    Проверка данных студентов.
+
+    Шаблоны компилируются один раз при загрузке модуля. Перед
+    регулярным выражением выполняются дешевые проверки длины и набора
+    символов, поэтому большинство строк решается без него. Решения и
+    сообщения об ошибках те же, что и при проверке одними шаблонами.
+    """
+
+    name_pattern = (r"^(?![A-Za-z]*['-]{2})[A-Za-z][ '-]"
+                    r"?[A-Za-z]+(?:[ '-][A-Za-z]+)*$")
+    email_pattern = (r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]"
+                     r"+\.[a-zA-Z0-9]{1,}$")
+    name_regex = re.compile(name_pattern)
+    email_regex = re.compile(email_pattern)
+
+    # Коды ошибок validate_many.
+    OK = 0
+    INCORRECT_CREDENTIALS = 1
+    INCORRECT_FIRST_NAME = 2
+    INCORRECT_LAST_NAME = 3
+    INCORRECT_EMAIL = 4
+    EMAIL_TAKEN = 5
+    messages = {
+        INCORRECT_CREDENTIALS: "Incorrect credentials",
+        INCORRECT_FIRST_NAME: "Incorrect first name",
+        INCORRECT_LAST_NAME: "Incorrect last name",
+        INCORRECT_EMAIL: "Incorrect email",
+        EMAIL_TAKEN: "This email is already taken.",
+    }
+
+    @classmethod
+    def is_valid_name(cls, name: str) -> bool:
+        """Проверяет валидность имени или фамилии."""
+        # Шаблон допускает только латиницу, пробел, ' и -
+        # и требует минимум две буквы.
+        if len(name) < 2 or not name.isascii():
+            return False
+        if name.isalpha():
+            return True
+        return cls.name_regex.match(name) is not None
+
+    @classmethod
+    def is_valid_email(cls, email: str) -> bool:
+        """Проверяет валидность электронной почты."""
+        # Самый короткий подходящий адрес - "a@b.c".
+        if len(email) < 5 or '@' not in email or not email.isascii():
+            return False
+        return cls.email_regex.match(email) is not None
+
+    @classmethod
+    def error_code(cls, first_name: str, last_name: str, email: str) -> int:
+        """Код первой ошибки в данных студента или OK."""
+        if not cls.is_valid_name(first_name):
+            return cls.INCORRECT_FIRST_NAME
+        if not cls.is_valid_name(last_name):
+            return cls.INCORRECT_LAST_NAME
+        if not cls.is_valid_email(email):
+            return cls.INCORRECT_EMAIL
+        return cls.OK
+
+    @classmethod
+    def check_credentials(cls, first_name: str, last_name: str,
+                          email: str) -> None:
+        """Если данные студента не валидны, возвращает ошибку."""
+        code = cls.error_code(first_name, last_name, email)
+        if code != cls.OK:
+            raise DataIsNotValid(cls.messages[code])
+
+    @classmethod
+    def validate_lines(
+            cls, lines: Iterable[str], taken: Container[str] = frozenset()
+    ) -> Iterator[tuple[int, tuple[str, str, str] | None]]:
+        """
+        Проверяет строки "имя фамилия email" и отдает для каждой пары
+        (код, (имя, фамилия, email)). Email из taken и email, уже
+        встреченные в валидных строках выше, считаются занятыми.
+        """
+        seen = set()
+        for data in lines:
+            try:
+                credentials = Student.parse_credentials(data)
+            except DataIsNotValid:
+                yield cls.INCORRECT_CREDENTIALS, None
+                continue
+
+            code = cls.error_code(*credentials)
+            if code == cls.OK:
+                email = credentials[2]
+                if email in taken or email in seen:
+                    code = cls.EMAIL_TAKEN
+                else:
+                    seen.add(email)
+            yield code, credentials
+
+    @classmethod
+    def validate_many(cls, lines: Iterable[str],
+                      taken: Container[str] = frozenset()) -> list[int]:
+        """Коды ошибок для каждой строки с данными студента."""
+        return [code for code, _ in cls.validate_lines(lines, taken)]
+
+    @staticmethod
+    def parse_points(input_list: list[str],
+                     course_count: int) -> list[int] | None:
+        """
+        Проверяет список баллов и сразу переводит его в числа.
+
+        1. Балл - неотрицательное число.
+        2. Количество баллов равно количеству курсов.
+
+        Если баллы не валидны, возвращает None.
+        """
+        if not all(map(str.isdecimal, input_list)):
+            # Медленный путь для редких строк: цифры вроде '²'
+            # проходят isdigit, но не int(), поведение как раньше.
+            if not (all(num.isdigit() and int(num) >= 0
+                        for num in input_list)
+                    and len(input_list) == course_count):
+                return None
+        if len(input_list) != course_count:
+            return None
+        return list(map(int, input_list))
+
+
+class StudentPoints(Mapping):
+    """
+    Баллы студента по курсам каталога в порядке курсов.
+
+    Баллы хранятся один раз, в Course.student_scores, и только
+    ненулевые. Представление ничего не копирует и сразу видит
+    добавленные и удаленные курсы.
+    """
+
+    __slots__ = ("student_id",)
+
+    def __init__(self, student_id: int) -> None:
+        self.student_id = student_id
+
+    def __getitem__(self, course_name: str) -> int:
+        return Course.courses[course_name].student_scores.get(
+            self.student_id, 0
+        )
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(Course.courses)
+
+    def __len__(self) -> int:
+        return len(Course.courses)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class _PrefixIndex:
+    """
+    Отсортированные ключи для поиска по префиксу.
+
+    Ключи лежат в отсортированных блоках не длиннее 2 * block_size,
+    поэтому вставка сдвигает только один короткий блок, а поиск
+    начинается с бинарного поиска по последним ключам блоков.
+    """
+
+    block_size = 1000
+
+    def __init__(self) -> None:
+        self.blocks = []
+        self.maxes = []
+
+    def add(self, key: str) -> None:
+        if not self.blocks:
+            self.blocks.append([key])
+            self.maxes.append(key)
+            return
+
+        pos = bisect_left(self.maxes, key)
+        if pos == len(self.maxes):
+            # Ключ больше всех: дописываем в конец последнего блока.
+            pos -= 1
+            self.blocks[pos].append(key)
+            self.maxes[pos] = key
+        else:
+            insort(self.blocks[pos], key)
+
+        block = self.blocks[pos]
+        if len(block) > 2 * self.block_size:
+            tail = block[self.block_size:]
+            del block[self.block_size:]
+            self.blocks.insert(pos + 1, tail)
+            self.maxes[pos] = block[-1]
+            self.maxes.insert(pos + 1, tail[-1])
+
+    def update(self, keys: Iterable[str]) -> None:
+        """Добавляет ключи, пустой индекс заполняется блоками сразу."""
+        if self.blocks:
+            for key in keys:
+                self.add(key)
+            return
+
+        keys = sorted(keys)
+        self.blocks = [keys[start:start + self.block_size]
+                       for start in range(0, len(keys), self.block_size)]
+        self.maxes = [block[-1] for block in self.blocks]
+
+    def search(self, prefix: str) -> Iterator[str]:
+        """Ключи, начинающиеся с prefix, по возрастанию."""
+        for pos in range(bisect_left(self.maxes, prefix), len(self.blocks)):
+            block = self.blocks[pos]
+            for index in range(bisect_left(block, prefix), len(block)):
+                key = block[index]
+                if not key.startswith(prefix):
+                    return
+                yield key
+
+    def __len__(self) -> int:
+        return sum(map(len, self.blocks))
+
+
+class StudentIndex:
+    """
+    Индексы студентов для команды find.
+
+    Точный поиск по email выполняет словарь Student.emails, здесь -
+    индексы имен без учета регистра (фамилия, полное имя ->
+    id студентов по возрастанию) и индекс префиксов email и фамилий
+    для поиска по началу строки. Индексы пополняются при регистрации
+    студента, студенты из трекера не удаляются.
+
+    Индексы для уже существующих студентов (например, из образа
+    TrackerImage) строятся при первом обращении, см. build.
+    """
+
+    def __init__(self,
+                 students: Iterable['Student'] | None = None) -> None:
+        self.last_names = {}
+        self.full_names = {}
+        self.email_prefixes = _PrefixIndex()
+        self.last_name_prefixes = _PrefixIndex()
+        self.pending = students
+
+    def build(self) -> None:
+        """Добавляет в индексы студентов, переданных в конструктор."""
+        students, self.pending = self.pending, None
+        if students is None:
+            return
+        emails = []
+        for student in students:
+            self._add_names(student.id, student.first_name,
+                            student.last_name)
+            emails.append(student.email)
+        # Email попадают в индекс префиксов одной сортировкой.
+        self.email_prefixes.update(emails)
+
+    def add(self, student_id: int, first_name: str, last_name: str,
+            email: str) -> None:
+        if self.pending is not None:
+            self.build()
+        self._add_names(student_id, first_name, last_name)
+        self.email_prefixes.add(email)
+
+    def _add_names(self, student_id: int, first_name: str,
+                   last_name: str) -> None:
+        # Студентов импортируют миллионами, поэтому обновление
+        # индексов записано без вспомогательных вызовов.
+        first_key = first_name.casefold()
+        last_key = last_name.casefold()
+        ids = self.last_names.get(last_key)
+        if ids is None:
+            self.last_names[last_key] = [student_id]
+            self.last_name_prefixes.add(last_key)
+        else:
+            ids.append(student_id)
+        # Полные имена почти всегда уникальны: одиночный id хранится
+        # числом, список заводится только для тезок.
+        ids = self.full_names.get((first_key, last_key))
+        if ids is None:
+            self.full_names[first_key, last_key] = student_id
+        elif type(ids) is int:
+            self.full_names[first_key, last_key] = [ids, student_id]
+        else:
+            ids.append(student_id)
+
+    def find_name(self, name: str) -> Sequence[int]:
+        """
+        Id студентов по фамилии или по имени и фамилии через пробел.
+        Фамилия может состоять из нескольких слов ("van Helsing"),
+        поэтому сначала вся строка ищется как фамилия, а затем
+        первое слово - как имя. Регистр не учитывается.
+        """
+        self.build()
+        name = name.casefold().strip()
+        ids = self.last_names.get(name)
+        if ids is not None:
+            return ids
+        first_name, _, last_name = name.partition(' ')
+        if not last_name:
+            return ()
+        ids = self.full_names.get((first_name, last_name.strip()), ())
+        return [ids] if type(ids) is int else ids
+
+    def find_prefix(self, prefix: str, limit: int) -> list[int]:
+        """
+        Не больше limit id студентов, у которых email или фамилия
+        (без учета регистра) начинаются с prefix. Сначала идут
+        совпадения по email, затем по фамилии.
+        """
+        self.build()
+        found = {}
+        for email in self.email_prefixes.search(prefix):
+            if len(found) >= limit:
+                return list(found)
+            found[Student.emails[email]] = None
+        for last_name in self.last_name_prefixes.search(prefix.casefold()):
+            for student_id in self.last_names[last_name]:
+                if len(found) >= limit:
+                    return list(found)
+                found[student_id] = None
+        return list(found)
+
+
+class _ContextField:
+    """
+    Атрибут класса, значение которого хранится в текущем
+    TrackerContext: Student.students - это студенты текущей когорты.
+    Присваивание (Student.students = ...) обрабатывает _ContextBound.
+    """
+
+    def __init__(self, attribute: str | None = None) -> None:
+        self.attribute = attribute
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        if self.attribute is None:
+            self.attribute = name
+
+    def __get__(self, instance, owner: type | None = None):
+        return getattr(_current_context.get(), self.attribute)
+
+
+class _ContextBound(type):
+    """Метакласс классов с атрибутами _ContextField."""
+
+    def __setattr__(cls, name: str, value) -> None:
+        for klass in cls.__mro__:
+            field = klass.__dict__.get(name)
+            if field is not None:
+                break
+        if isinstance(field, _ContextField):
+            setattr(_current_context.get(), field.attribute, value)
+        else:
+            super().__setattr__(name, value)
+
+
+class Student(metaclass=_ContextBound):
     """
     Класс для управления информацией о студенте и его учебных баллах.
 
@@ -32,13 +591,20 @@ class Student:
     форматам валидации.
     """
 
-    id_counter = 1000
-    name_pattern = (r"^(?![A-Za-z]*['-]{2})[A-Za-z][ '-]"
-                    r"?[A-Za-z]+(?:[ '-][A-Za-z]+)*$")
-    email_pattern = (r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]"
-                     r"+\.[a-zA-Z0-9]{1,}$")
-    students = {}
-    emails = set()
+    __slots__ = ("first_name", "last_name", "email", "courses", "id")
+
+    # Студенты, индексы и счетчик id принадлежат когорте,
+    # см. TrackerContext.
+    id_counter = _ContextField()
+    name_pattern = StudentValidator.name_pattern
+    email_pattern = StudentValidator.email_pattern
+    students = _ContextField()
+    # Индекс email -> id, по нему же проверяются повторы email.
+    emails = _ContextField()
+    index = _ContextField()
+    # Готовые строки find: id -> (версия каталога курсов, строка).
+    # Курс сбрасывает строки студентов, чьи баллы изменил.
+    score_cache = _ContextField()
 
     def __init__(self, first_name: str, last_name: str,
                  email: str) -> None:
@@ -46,43 +612,123 @@ class Student:
         self.last_name = last_name
         self.email = email
         self.courses = Course.courses
-        self.id = Student.id_counter
-
-        if not self._is_valid_first_name():
-            raise DataIsNotValid("Incorrect first name")
-        if not self._is_valid_last_name():
-            raise DataIsNotValid("Incorrect last name")
-        if not self._is_valid_email():
-            raise DataIsNotValid("Incorrect email")
-        if self.email in self.emails:
-            raise EmailIsTaken("This email is already taken.")
-
-        self.points = {name: 0 for name in self.courses}
-        self.students[self.id_counter] = self
-        self.emails.add(email)
-        Student.id_counter += 1
-
-    def _is_valid_first_name(self) -> bool:
-        """Проверяет валидность имени студента."""
-        return re.match(self.name_pattern, self.first_name) is not None
-
-    def _is_valid_last_name(self) -> bool:
-        """Проверяет валидность фамилии студента."""
-        return re.match(self.name_pattern, self.last_name) is not None
-
-    def _is_valid_email(self) -> bool:
-        """Проверяет валидность электронной почты студента."""
-        return re.match(self.email_pattern, self.email) is not None
 
-    def _is_valid_points(self, input_list: list[str]) -> bool:
+        StudentValidator.check_credentials(first_name, last_name, email)
+        self._register()
+
+    @classmethod
+    def _create_validated(cls, first_name: str, last_name: str,
+                          email: str) -> 'Student':
+        """Создает студента по уже проверенным данным."""
+        student = cls.__new__(cls)
+        student.first_name = first_name
+        student.last_name = last_name
+        student.email = email
+        student.courses = Course.courses
+        student._register()
+        return student
+
+    def _register(self) -> None:
+        """
+        Выдает студенту id и добавляет его в списки студентов.
+        Проверка email и выдача id выполняются атомарно.
         """
-        Проверяет валидность списка баллов.
+        context = _current_context.get()
+        with TrackerLocks.writing(), TrackerLocks.registry:
+            if self.email in context.emails:
+                raise EmailIsTaken("This email is already taken.")
+            self.id = context.id_counter
+            context.id_counter += 1
+            context.students[self.id] = self
+            context.emails[self.email] = self.id
+            context.index.add(self.id, self.first_name, self.last_name,
+                              self.email)
 
-        1. Балл - неотрицательное число.
-        2. Количество баллов равно количеству курсов.
+            # Пишем в журнал под той же блокировкой, чтобы id
+            # в журнале шли по возрастанию.
+            if context.storage is not None:
+                context.storage.log_student(self)
+            if context.events is not None:
+                context.events.publish_many((StudentAdded(
+                    self.id, self.first_name, self.last_name, self.email
+                ),))
+
+    @classmethod
+    def _restore(cls, student_id: int, first_name: str, last_name: str,
+                 email: str) -> 'Student':
+        """
+        Восстанавливает уже проверенного студента (например, из снимка
+        состояния) без валидации и без записи в журнал.
+        """
+        student = cls.__new__(cls)
+        student.first_name = first_name
+        student.last_name = last_name
+        student.email = email
+        student.courses = Course.courses
+        student.id = student_id
+        cls.students[student_id] = student
+        cls.emails[email] = student_id
+        cls.index.add(student_id, first_name, last_name, email)
+        return student
+
+    @property
+    def points(self) -> StudentPoints:
+        """Баллы студента по курсам, только для чтения."""
+        return StudentPoints(self.id)
+
+    @staticmethod
+    def parse_credentials(data: str) -> tuple[str, str, str]:
         """
-        return (all(num.isdigit() and int(num) >= 0 for num in input_list)
-                and len(input_list) == len(self.points))
+        Разделяет строку с данными студента на имя, фамилию и email.
+        Если в строке меньше трех частей, возвращает ошибку.
+        """
+        if data.count(' ') < 2:
+            raise DataIsNotValid("Incorrect credentials")
+
+        # Используем rsplit для разделения с конца строки email.
+        full_name, email = data.rsplit(' ', 1)
+
+        # Разделяем полное имя на имя и фамилию
+        first_name, last_name = full_name.split(' ', 1)
+        return first_name.strip(), last_name.strip(), email.strip()
+
+    @classmethod
+    def import_students(cls, lines: Iterable[str],
+                        rejects: TextIO | None = None,
+                        chunk_size: int = 10_000) -> int:
+        """
+        Пакетное добавление студентов из потока строк (файл или stdin).
+
+        Строки обрабатываются порциями по chunk_size, правила проверки
+        те же, что и в интерактивном режиме. Отклоненные строки вместе
+        с причиной пишутся в rejects одной записью на порцию.
+        Возвращает количество добавленных студентов.
+        """
+        added = 0
+        messages = StudentValidator.messages
+        for chunk in _chunked(_strip_newlines(lines), chunk_size):
+            rejected = []
+            checked = StudentValidator.validate_lines(chunk, cls.emails)
+            for data, (code, credentials) in zip(chunk, checked):
+                if code == StudentValidator.OK:
+                    try:
+                        cls._create_validated(*credentials)
+                    except EmailIsTaken:
+                        # Email заняли из другого потока после проверки.
+                        code = StudentValidator.EMAIL_TAKEN
+                    else:
+                        added += 1
+                        continue
+                rejected.append(f'{data}\t{messages[code]}\n')
+            if rejects is not None and rejected:
+                rejects.writelines(rejected)
+        return added
+
+    def _is_valid_points(self, input_list: list[str]) -> bool:
+        """Проверяет валидность списка баллов студента."""
+        return StudentValidator.parse_points(
+            input_list, len(self.points)
+        ) is not None
 
     def add_points(self, input_string: str) -> None:
         """
@@ -90,169 +736,2840 @@ class Student:
         Отправляет данные о студенте в курсы.
         Если баллы не валидны, возвращает ошибку.
         """
-        courses_list = list(self.points)
-        input_list = input_string.split()
-        if self._is_valid_points(input_list):
-            points = list(map(int, input_list))
-            for i, course in enumerate(courses_list):
-                # Добавляем баллы пользователю.
-                self.points[course] += points[i]
-                # Отправляем данные в курс.
-                self.courses[course].update(self, points[i])
+        courses = list(self.courses.values())
+        points = StudentValidator.parse_points(input_string.split(),
+                                               len(courses))
+        if points is not None:
+            with TrackerLocks.writing():
+                with TrackerLocks.for_student(self.id):
+                    for course, value in zip(courses, points):
+                        # Баллы студента хранятся в курсе, нули не
+                        # меняют ничего.
+                        if value:
+                            course.update(self, value)
+                self._record_points([(self.id, points)], courses)
             print("Points updated.")
         else:
             raise DataIsNotValid("Incorrect points format.")
 
-    def get_student_score(self) -> str:
-        """Отдает строку с баллами студента в курсах."""
-        result_str = f'{self.id} points:'
-        for course, points in self.points.items():
-            result_str += f' {course}={points};'
-        return result_str.rstrip(";")
+    @classmethod
+    def add_points_many(cls, rows: Iterable[str | Sequence[int]],
+                        rejects: TextIO | None = None,
+                        chunk_size: int = 10_000) -> int:
+        """
+        Пакетное добавление баллов.
+
+        Строка - это "id p1 ... pN" (как в режиме add points) или
+        последовательность чисел (id, p1, ..., pN). Порция строк
+        сначала целиком разбирается в матрицу баллов и проверяется,
+        затем баллы применяются к курсам по столбцам. Результат такой же,
+        как при построчном вызове add_points.
+        Возвращает количество примененных строк.
+        """
+        updated = 0
+        courses = list(Course.courses.values())
+        for chunk in _chunked(_strip_newlines(rows), chunk_size):
+            students, matrix, rejected = cls._parse_points_rows(chunk)
+            if rejects is not None and rejected:
+                rejects.writelines(rejected)
+            if not matrix:
+                continue
+
+            with TrackerLocks.writing():
+                # Транспонируем матрицу и обновляем каждый курс одним
+                # вызовом.
+                for course, column in zip(courses, zip(*matrix)):
+                    course.update_many(zip(students, column))
+                if (TrackerStorage.active is not None
+                        or PointHistory.active is not None
+                        or EventBus.active is not None):
+                    cls._record_points(
+                        [(student.id, points)
+                         for student, points in zip(students, matrix)],
+                        courses,
+                    )
+            updated += len(matrix)
+        return updated
+
+    @classmethod
+    def add_points_parallel(cls, rows: Iterable[str | Sequence[int]],
+                            rejects: TextIO | None = None,
+                            workers: int | None = None,
+                            chunk_size: int = 100_000) -> int:
+        """
+        Пакетное добавление баллов в нескольких процессах.
+
+        Порция строк делится между процессами по id студента, поэтому
+        все строки одного студента попадают в один процесс. Процесс
+        проверяет строки и считает частичные итоги курсов
+        (CourseAggregate), а основной процесс сливает их в курсы в
+        фиксированном порядке. Итоговое состояние, очереди уведомлений,
+        отклоненные строки и журнал такие же, как у add_points_many.
+        Возвращает количество примененных строк.
+        """
+        updated = 0
+        courses = list(Course.courses.values())
+        passing_scores = [course.passing_scores for course in courses]
+        keep_rows = (TrackerStorage.active is not None
+                     or PointHistory.active is not None
+                     or EventBus.active is not None)
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers) as pool:
+            for chunk in _chunked(_strip_newlines(rows), chunk_size):
+                partitions = [[] for _ in range(workers)]
+                partition_ids = [set() for _ in range(workers)]
+                for index, row in enumerate(chunk):
+                    student_id = (row.partition(' ')[0]
+                                  if isinstance(row, str) else str(row[0]))
+                    part = 0
+                    if student_id.isdecimal():
+                        student_id = int(student_id)
+                        part = student_id % workers
+                        partition_ids[part].add(student_id)
+                    partitions[part].append((index, row))
+
+                futures = [
+                    pool.submit(_aggregate_points, partitions[part],
+                                cls._start_scores(partition_ids[part],
+                                                  courses),
+                                passing_scores, keep_rows)
+                    for part in range(workers) if partitions[part]
+                ]
+                results = [future.result() for future in futures]
+
+                rejected = sorted(line for result in results
+                                  for line in result[1])
+                if rejects is not None and rejected:
+                    rejects.writelines(line for _, line in rejected)
+                with TrackerLocks.writing():
+                    for column, course in enumerate(courses):
+                        course.merge_aggregates(result[0][column]
+                                                for result in results)
+                    if keep_rows:
+                        cls._record_points(
+                            [(student_id, points)
+                             for _, student_id, points
+                             in sorted(row for result in results
+                                       for row in result[2])],
+                            courses,
+                        )
+                updated += sum(len(result[2]) for result in results)
+        return updated
+
+    @staticmethod
+    def _record_points(rows: list[tuple[int, Sequence[int]]],
+                       courses: list['Course']) -> None:
+        """
+        Пишет принятые строки баллов в журнал, в историю баллов
+        и в шину событий.
+        """
+        if TrackerStorage.active is not None:
+            TrackerStorage.active.log_points(rows)
+        if PointHistory.active is not None:
+            PointHistory.active.record(rows, courses)
+        if EventBus.active is not None:
+            names = tuple(course.name for course in courses)
+            EventBus.active.publish_many(
+                PointsAdded(student_id, names, tuple(points))
+                for student_id, points in rows
+            )
+
+    @classmethod
+    def _start_scores(cls, student_ids: Iterable[int],
+                      courses: list['Course']) -> dict[int, list[int]]:
+        """Текущие баллы студентов в курсах для процесса-исполнителя."""
+        return {student_id: [course.student_scores.get(student_id, 0)
+                             for course in courses]
+                for student_id in student_ids if student_id in cls.students}
+
+    @classmethod
+    def _parse_points_rows(
+            cls, rows: list[str | Sequence[int]]
+    ) -> tuple[list['Student'], list[list[int]], list[str]]:
+        """
+        Разбирает порцию строк с баллами.
+        Возвращает студентов, матрицу баллов и отклоненные строки.
+        """
+        students = []
+        matrix = []
+        rejected = []
+        course_count = len(Course.courses)
+        for row in rows:
+            if isinstance(row, str):
+                student_id, _, points = row.partition(' ')
+                points = points.split()
+            else:
+                student_id, *points = map(str, row)
+
+            student = (cls.students.get(int(student_id))
+                       if student_id.isdecimal() else None)
+            if student is None:
+                rejected.append(
+                    f'{row}\tNo student is found for id={student_id}\n'
+                )
+                continue
+
+            values = StudentValidator.parse_points(points, course_count)
+            if values is None:
+                rejected.append(f'{row}\tIncorrect points format.\n')
+            else:
+                students.append(student)
+                matrix.append(values)
+        return students, matrix, rejected
+
+    def get_student_score(self) -> str:
+        """
+        Отдает строку с баллами студента в курсах.
+        Строка берется из score_cache, пока баллы и каталог не менялись.
+        """
+        student_id = self.id
+        cache = Student.score_cache
+        version = Course.catalog_version
+        cached = cache.get(student_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        stamp = cache.invalidations
+        with TrackerLocks.for_student(student_id):
+            parts = [f' {name}={course.student_scores.get(student_id, 0)};'
+                     for name, course in self.courses.items()]
+        score = f'{student_id} points:{"".join(parts)}'.rstrip(";")
+        cache.put(student_id, (version, score), stamp)
+        return score
+
+    @classmethod
+    def use_columnar_store(cls) -> None:
+        """
+        Переключает хранение студентов на ColumnarStudentStore.
+        Уже добавленные студенты переносятся в новое хранилище.
+        """
+        store = ColumnarStudentStore()
+        for student_id, student in cls.students.items():
+            store[student_id] = student
+        cls.students = store
+
+    @classmethod
+    def use_disk_email_index(cls, directory: str | None = None,
+                             capacity: int = 1 << 16) -> None:
+        """
+        Переключает проверку повторов email на DiskEmailIndex с
+        таблицей в directory. Email уже добавленных студентов
+        переносятся в новый индекс.
+        """
+        index = DiskEmailIndex(max(capacity, len(cls.emails)), directory)
+        for email, student_id in cls.emails.items():
+            index[email] = student_id
+        cls.emails = index
+
+    @staticmethod
+    def get_students_id() -> str:
+        """Отдает в консоль список id студентов."""
+        if not Student.students:
+            return "No students found"
+        # Создаем список строк, каждая из которых содержит ID студента.
+        students_ids = [str(key) for key in Student.students]
+        return "Students:\n" + "\n".join(students_ids)
+
+
+def _strip_newlines(lines: Iterable) -> Iterator:
+    """Убирает символы перевода строки, как это делает input()."""
+    for line in lines:
+        yield line.rstrip('\r\n') if isinstance(line, str) else line
+
+
+def _chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    """Разбивает поток на списки длиной не больше size."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class _StringTable:
+    """
+    Таблица интернированных строк.
+    Одинаковые строки хранятся один раз, в столбце лежат их номера.
+    """
+
+    def __init__(self) -> None:
+        self.strings = []
+        self.index = {}
+        self.codes = array('I')
+
+    def append(self, value: str) -> None:
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.strings)
+            self.strings.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, row: int) -> str:
+        return self.strings[self.codes[row]]
+
+
+class _StringColumn:
+    """Столбец уникальных строк: общий буфер байтов и массив смещений."""
+
+    def __init__(self) -> None:
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+
+    def append(self, value: str) -> None:
+        self.data += value.encode('utf-8')
+        self.offsets.append(len(self.data))
+
+    def __getitem__(self, row: int) -> str:
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self.data[start:end].decode('utf-8')
+
+
+class StudentRow(Student):
+    """
+    Легкое представление студента поверх одной строки
+    ColumnarStudentStore. Хранит только ссылку на хранилище и номер строки.
+    """
+
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store: 'ColumnarStudentStore', row: int) -> None:
+        # Валидация и регистрация уже выполнены в Student.__init__.
+        self._store = store
+        self._row = row
+
+    @property
+    def id(self) -> int:
+        return self._store.ids[self._row]
+
+    @property
+    def first_name(self) -> str:
+        return self._store.first_names[self._row]
+
+    @property
+    def last_name(self) -> str:
+        return self._store.last_names[self._row]
+
+    @property
+    def email(self) -> str:
+        return self._store.emails[self._row]
+
+    @property
+    def courses(self) -> dict:
+        return Course.courses
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, StudentRow)
+                and (self._store, self._row) == (other._store, other._row))
+
+    def __hash__(self) -> int:
+        return hash((id(self._store), self._row))
+
+
+class ColumnarStudentStore:
+    """
+    Компактное хранилище студентов по столбцам.
+
+    Id лежат в массиве, имена - в таблицах интернированных строк,
+    email - в общем буфере, баллы остаются в курсах. Ведет себя как
+    словарь {id: студент} и может заменить Student.students.
+    """
+
+    def __init__(self) -> None:
+        self.ids = array('q')
+        self.first_names = _StringTable()
+        self.last_names = _StringTable()
+        self.emails = _StringColumn()
+
+    def _find_row(self, student_id: int) -> int | None:
+        """Ищет строку студента бинарным поиском, id идут по возрастанию."""
+        row = bisect_left(self.ids, student_id)
+        if row < len(self.ids) and self.ids[row] == student_id:
+            return row
+        return None
+
+    def __setitem__(self, student_id: int, student: Student) -> None:
+        if self.ids and student_id <= self.ids[-1]:
+            raise KeyError(f"Student ids must grow: {student_id}")
+        self.ids.append(student_id)
+        self.first_names.append(student.first_name)
+        self.last_names.append(student.last_name)
+        self.emails.append(student.email)
+
+    def __getitem__(self, student_id: int) -> StudentRow:
+        row = self._find_row(student_id)
+        if row is None:
+            raise KeyError(student_id)
+        return StudentRow(self, row)
+
+    def get(self, student_id: int, default=None) -> StudentRow | None:
+        row = self._find_row(student_id)
+        return default if row is None else StudentRow(self, row)
+
+    def __contains__(self, student_id: int) -> bool:
+        return self._find_row(student_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def keys(self) -> Iterator[int]:
+        return iter(self.ids)
+
+    def values(self) -> Iterator[StudentRow]:
+        return (StudentRow(self, row) for row in range(len(self.ids)))
+
+    def items(self) -> Iterator[tuple[int, StudentRow]]:
+        return zip(self.ids, self.values())
+
+
+class _MappedStrings:
+    """Таблица строк образа: смещения и байты UTF-8 прямо из mmap."""
+
+    def __init__(self, offsets: memoryview, data: memoryview) -> None:
+        self.offsets = offsets
+        self.data = data
+
+    def __getitem__(self, code: int) -> str:
+        return str(self.data[self.offsets[code]:self.offsets[code + 1]],
+                   'utf-8')
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class _MappedColumn:
+    """Строковый столбец образа: номера строк в таблице _MappedStrings."""
+
+    def __init__(self, codes: memoryview, strings: _MappedStrings) -> None:
+        self.codes = codes
+        self.strings = strings
+
+    def __getitem__(self, row: int) -> str:
+        return self.strings[self.codes[row]]
+
+
+class MappedStudentStore(ColumnarStudentStore):
+    """
+    Студенты из образа TrackerImage.
+
+    Столбцы - представления memoryview над отображенным файлом, строки
+    декодируются только при обращении. Новые студенты добавляются
+    в обычное столбцовое хранилище tail, их id больше id из образа.
+    """
+
+    def __init__(self, ids: memoryview, first_names: _MappedColumn,
+                 last_names: _MappedColumn, emails: _MappedColumn) -> None:
+        self.ids = ids
+        self.first_names = first_names
+        self.last_names = last_names
+        self.emails = emails
+        self.tail = ColumnarStudentStore()
+
+    def __setitem__(self, student_id: int, student: Student) -> None:
+        if self.ids and student_id <= self.ids[-1]:
+            raise KeyError(f"Student ids must grow: {student_id}")
+        self.tail[student_id] = student
+
+    def __getitem__(self, student_id: int) -> StudentRow:
+        row = self._find_row(student_id)
+        if row is None:
+            return self.tail[student_id]
+        return StudentRow(self, row)
+
+    def get(self, student_id: int, default=None) -> StudentRow | None:
+        row = self._find_row(student_id)
+        if row is None:
+            return self.tail.get(student_id, default)
+        return StudentRow(self, row)
+
+    def __contains__(self, student_id: int) -> bool:
+        return (self._find_row(student_id) is not None
+                or student_id in self.tail)
+
+    def __iter__(self) -> Iterator[int]:
+        return chain(self.ids, self.tail)
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.tail)
+
+    def keys(self) -> Iterator[int]:
+        return iter(self)
+
+    def values(self) -> Iterator[StudentRow]:
+        return chain(super().values(), self.tail.values())
+
+    def items(self) -> Iterator[tuple[int, StudentRow]]:
+        return zip(self, self.values())
+
+
+class MappedEmailIndex(Mapping):
+    """
+    Индекс email -> id для студентов из образа.
+
+    В образе лежат номера строк студентов, отсортированные по email,
+    поэтому поиск - бинарный поиск с декодированием нескольких строк.
+    Email новых студентов хранятся в словаре added.
+    """
+
+    def __init__(self, store: MappedStudentStore,
+                 order: memoryview) -> None:
+        self.store = store
+        self.order = order
+        self.added = {}
+
+    def __getitem__(self, email: str) -> int:
+        student_id = self.added.get(email)
+        if student_id is not None:
+            return student_id
+        emails = self.store.emails
+        pos = bisect_left(self.order, email, key=emails.__getitem__)
+        if pos < len(self.order) and emails[self.order[pos]] == email:
+            return self.store.ids[self.order[pos]]
+        raise KeyError(email)
+
+    def __setitem__(self, email: str, student_id: int) -> None:
+        self.added[email] = student_id
+
+    def __iter__(self) -> Iterator[str]:
+        emails = self.store.emails
+        return chain((emails[row] for row in range(len(self.order))),
+                     self.added)
+
+    def __len__(self) -> int:
+        return len(self.order) + len(self.added)
+
+
+class BloomFilter:
+    """
+    Блочный фильтр Блума по 64-битным хешам: отвечает "точно нет" или
+    "возможно есть". Элемент ставит несколько бит в одном 64-битном
+    слове, набор бит берется из заранее построенной таблицы масок,
+    поэтому проверка - одно чтение слова. При bits_per_item = 10
+    ложных срабатываний около 1-2%.
+    """
+
+    # Число масок - 2 ** pattern_bits, маску выбирают младшие биты хеша.
+    pattern_bits = 12
+    # Таблицы масок по числу бит в маске.
+    pattern_tables = {}
+
+    def __init__(self, capacity: int, bits_per_item: int = 10) -> None:
+        words = max(capacity * bits_per_item // 64, 1)
+        self.mask = (1 << (words - 1).bit_length()) - 1
+        self.words = array('Q', bytes(8 * (self.mask + 1)))
+        hashes = max(round(bits_per_item * math.log(2)), 1)
+        self.patterns = self._patterns(hashes)
+        self.pattern_mask = len(self.patterns) - 1
+
+    @classmethod
+    def _patterns(cls, hashes: int) -> list[int]:
+        """Маски по hashes разных бит из 64, одни и те же в процессе."""
+        patterns = cls.pattern_tables.get(hashes)
+        if patterns is None:
+            patterns = []
+            value = hashes
+            for _ in range(1 << cls.pattern_bits):
+                pattern = 0
+                while pattern.bit_count() < hashes:
+                    value = _mix64(value)
+                    pattern |= 1 << (value & 63)
+                patterns.append(pattern)
+            cls.pattern_tables[hashes] = patterns
+        return patterns
+
+    def add(self, value: int) -> None:
+        self.words[value >> self.pattern_bits & self.mask] |= (
+            self.patterns[value & self.pattern_mask]
+        )
+
+    def __contains__(self, value: int) -> bool:
+        pattern = self.patterns[value & self.pattern_mask]
+        word = self.words[value >> self.pattern_bits & self.mask]
+        return word & pattern == pattern
+
+
+class DiskEmailIndex(Mapping):
+    """
+    Индекс email -> id для очень больших когорт.
+
+    Словарь email занимает около сотни байт памяти на студента.
+    Здесь в памяти только фильтр Блума (bits_per_email бит на email),
+    который отсекает почти все новые email. Возможные повторы
+    проверяет хеш-таблица с открытой адресацией во временном файле,
+    отображенном в память через mmap: слот - 64-битный хеш email и
+    id студента. Сам email берется у студента из Student.students,
+    поэтому ответ точный, как у словаря, даже при совпадении хешей
+    (id в индексе всегда указывает на студента с этим email).
+
+    Таблица и фильтр удваиваются, когда таблица заполнена больше
+    чем на load_factor; capacity задает ожидаемое число студентов.
+    """
+
+    load_factor = 0.7
+
+    def __init__(self, capacity: int = 1 << 16,
+                 directory: str | None = None,
+                 bits_per_email: int = 10) -> None:
+        self.directory = directory
+        self.bits_per_email = bits_per_email
+        self.count = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int) -> None:
+        """Создает пустые таблицу и фильтр на capacity email."""
+        slots = 1 << max(int(capacity / self.load_factor), 64).bit_length()
+        self.file = tempfile.TemporaryFile(dir=self.directory)
+        self.file.truncate(slots * 16)
+        self.map = mmap.mmap(self.file.fileno(), slots * 16)
+        # Слот i - это table[2 * i] (хеш, 0 - пусто) и table[2 * i + 1].
+        self.table = memoryview(self.map).cast('Q')
+        self.mask = slots - 1
+        self.limit = int(slots * self.load_factor)
+        self.bloom = BloomFilter(self.limit, self.bits_per_email)
+
+    @staticmethod
+    def _hash(email: str) -> int:
+        # Хеш нужен только этому процессу, 0 отмечает пустой слот.
+        return hash(email) & _MASK64 or 1
+
+    def _slot(self, email: str, value: int) -> int:
+        """Номер слота email или пустого слота, куда его добавить."""
+        table = self.table
+        mask = self.mask
+        students = Student.students
+        slot = value & mask
+        while True:
+            stored = table[2 * slot]
+            if not stored or (stored == value and students[
+                    table[2 * slot + 1]].email == email):
+                return slot
+            slot = (slot + 1) & mask
+
+    def get(self, email: str, default: int | None = None) -> int | None:
+        value = self._hash(email)
+        if value in self.bloom:
+            slot = self._slot(email, value)
+            if self.table[2 * slot]:
+                return self.table[2 * slot + 1]
+        return default
+
+    def __contains__(self, email: object) -> bool:
+        # Mapping проверял бы наличие через KeyError, это медленно.
+        return isinstance(email, str) and self.get(email) is not None
+
+    def __getitem__(self, email: str) -> int:
+        student_id = self.get(email)
+        if student_id is None:
+            raise KeyError(email)
+        return student_id
+
+    def __setitem__(self, email: str, student_id: int) -> None:
+        if self.count >= self.limit:
+            self._grow()
+        value = self._hash(email)
+        slot = self._slot(email, value)
+        if not self.table[2 * slot]:
+            self.table[2 * slot] = value
+            self.bloom.add(value)
+            self.count += 1
+        self.table[2 * slot + 1] = student_id
+
+    def _grow(self) -> None:
+        """Переносит хеши и id в таблицу и фильтр вдвое больше."""
+        table, old_map, old_file = self.table, self.map, self.file
+        self._allocate(2 * self.limit)
+        new_table = self.table
+        mask = self.mask
+        bloom = self.bloom
+        for value, student_id in zip(table[::2], table[1::2]):
+            if value:
+                slot = value & mask
+                while new_table[2 * slot]:
+                    slot = (slot + 1) & mask
+                new_table[2 * slot] = value
+                new_table[2 * slot + 1] = student_id
+                bloom.add(value)
+        table.release()
+        old_map.close()
+        old_file.close()
+
+    def __iter__(self) -> Iterator[str]:
+        students = Student.students
+        table = self.table
+        for value, student_id in zip(table[::2], table[1::2]):
+            if value:
+                yield students[student_id].email
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        """Закрывает и удаляет файл таблицы."""
+        self.table.release()
+        self.map.close()
+        self.file.close()
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value: int) -> int:
+    """Перемешивает биты числа (splitmix64), хеш для HyperLogLog."""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = (value ^ (value >> 30)) * 0xBF58476D1CE4E5B9 & _MASK64
+    value = (value ^ (value >> 27)) * 0x94D049BB133111EB & _MASK64
+    return value ^ (value >> 31)
+
+
+class HyperLogLog:
+    """
+    Приближенное число различных id: 2 ** precision регистров по
+    байту, стандартная ошибка 1.04 / sqrt(2 ** precision)
+    (1.6% для precision=12 и 4 KiB памяти).
+    """
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = 12) -> None:
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add_many(self, values: Iterable[int]) -> None:
+        registers = self.registers
+        shift = 64 - self.precision
+        mask = (1 << shift) - 1
+        for value in values:
+            hashed = _mix64(value)
+            rank = shift - (hashed & mask).bit_length() + 1
+            index = hashed >> shift
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def __len__(self) -> int:
+        registers = self.registers
+        size = len(registers)
+        total = sum(registers.count(rank) * 2.0 ** -rank
+                    for rank in range(max(registers) + 1))
+        estimate = 0.7213 / (1 + 1.079 / size) * size * size / total
+        zeros = registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # Для малых чисел точнее подсчет пустых регистров.
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
+
+
+class QuantileSketch:
+    """
+    Приближенные квантили положительных чисел с относительной
+    погрешностью relative_accuracy: значения раскладываются по
+    логарифмическим корзинам (как в DDSketch). В отличие от t-digest
+    и KLL значение можно удалить, а баллы студента меняются.
+    Корзин не больше max_buckets: лишние младшие корзины сливаются,
+    и погрешность остается только у старших квантилей.
+    """
+
+    __slots__ = ("gamma", "max_buckets", "bounds", "buckets", "min_key",
+                 "count")
+
+    def __init__(self, relative_accuracy: float = 0.01,
+                 max_buckets: int = 2048) -> None:
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.max_buckets = max_buckets
+        # bounds[k] = gamma ** k, в корзине k лежат значения
+        # из (bounds[k - 1], bounds[k]]: ключ ищет bisect.
+        self.bounds = [1.0]
+        self.buckets = {}
+        # Значения с ключом меньше min_key лежат в корзине min_key.
+        self.min_key = None
+        self.count = 0
+
+    def _keys(self, values: Iterable[int]) -> Counter:
+        """Сколько значений попадает в каждую корзину."""
+        values = list(values)
+        if not values:
+            return Counter()
+        bounds = self.bounds
+        top = max(values)
+        while bounds[-1] < top:
+            bounds.append(self.gamma ** len(bounds))
+        keys = Counter(map(partial(bisect_left, bounds), values))
+        if self.min_key is not None:
+            for key in [key for key in keys if key < self.min_key]:
+                keys[self.min_key] += keys.pop(key)
+        return keys
+
+    def update(self, added: Iterable[int] = (),
+               removed: Iterable[int] = ()) -> None:
+        """Добавляет значения added и удаляет добавленные раньше removed."""
+        buckets = self.buckets
+        for key, count in self._keys(removed).items():
+            self.count -= count
+            count = buckets[key] - count
+            if count:
+                buckets[key] = count
+            else:
+                del buckets[key]
+        for key, count in self._keys(added).items():
+            self.count += count
+            buckets[key] = buckets.get(key, 0) + count
+        while len(buckets) > self.max_buckets:
+            lowest, self.min_key = sorted(buckets)[:2]
+            buckets[self.min_key] += buckets.pop(lowest)
+
+    def quantile(self, q: float) -> float | None:
+        """Значение с рангом q * (count - 1) или None без значений."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                break
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+
+class CountMinSketch:
+    """
+    Приближенные счетчики по id в таблице depth x 2 ** width_bits.
+    Оценка не меньше настоящего значения и с вероятностью
+    1 - exp(-depth) больше него не больше чем на e / width * total.
+    """
+
+    __slots__ = ("width", "width_bits", "rows", "total")
+
+    def __init__(self, width_bits: int = 11, depth: int = 4) -> None:
+        # Столбцы строк - разные группы битов одного 64-битного хеша.
+        if width_bits * depth > 64:
+            raise ValueError("width_bits * depth must not exceed 64")
+        self.width_bits = width_bits
+        self.width = 1 << width_bits
+        self.rows = [array('q', bytes(8 * self.width))
+                     for _ in range(depth)]
+        self.total = 0
+
+    def _columns(self, hashes: list[int]) -> Iterator[Iterator[int]]:
+        """Номера столбцов каждой строки таблицы для хешей id."""
+        mask = self.width - 1
+        for row in range(len(self.rows)):
+            yield map(mask.__and__,
+                      map((row * self.width_bits).__rrshift__, hashes))
+
+    @staticmethod
+    def _hashes(values: Iterable[int]) -> list[int]:
+        # hash кортежа перемешивает биты id и считается без цикла
+        # в Python (хеш самого int равен числу).
+        return list(map(hash, zip(repeat(0), values)))
+
+    def add_many(self, counts: Mapping[int, int]) -> None:
+        """Прибавляет counts[id] к счетчикам id."""
+        hashes = self._hashes(counts)
+        total = sum(counts.values())
+        # Обычно у студента одно задание на пакет, и повторять
+        # столбцы по числу заданий не нужно.
+        single = total == len(counts)
+        for row, columns in zip(self.rows, self._columns(hashes)):
+            if not single:
+                columns = chain.from_iterable(
+                    map(repeat, columns, counts.values())
+                )
+            for column, count in Counter(columns).items():
+                row[column] += count
+        self.total += total
+
+    def __getitem__(self, value: int) -> int:
+        return min(row[column] for row, (column,)
+                   in zip(self.rows, self._columns(self._hashes([value]))))
+
+
+class CourseSketches:
+    """
+    Скетчи курса с фиксированной памятью для приближенной статистики:
+    число студентов (HyperLogLog), распределение баллов
+    (QuantileSketch) и число заданий студентов (CountMinSketch).
+    Обновляются вместе с курсом, см. TrackerContext.enable_sketches.
+    """
+
+    __slots__ = ("students", "scores", "tasks")
+
+    def __init__(self) -> None:
+        self.students = HyperLogLog()
+        self.scores = QuantileSketch()
+        self.tasks = CountMinSketch()
+
+    @classmethod
+    def from_course(cls, course: 'Course') -> 'CourseSketches':
+        """
+        Скетчи по текущим баллам курса. Задания студентов до этого
+        момента не известны и считаются с нуля.
+        """
+        sketches = cls()
+        sketches.students.add_many(course.student_scores)
+        sketches.scores.update(course.student_scores.values())
+        return sketches
+
+    def update(self, previous: dict[int, int], scores: Mapping[int, int],
+               tasks: Mapping[int, int]) -> None:
+        """
+        Учитывает пакет баллов: previous - баллы студентов до него,
+        scores - после, tasks - число заданий студентов в пакете.
+        """
+        self.students.add_many(student_id for student_id, old_score
+                               in previous.items() if not old_score)
+        self.scores.update(map(scores.__getitem__, previous),
+                           filter(None, previous.values()))
+        self.tasks.add_many(tasks)
+
+
+class CourseAggregate:
+    """
+    Частичные итоги одного курса по части строк с баллами.
+
+    previous - баллы студентов до этих строк, scores - после них,
+    tasks - число заданий студентов, completed - пары (номер строки,
+    id) студентов, которые перешли порог курса. Итоги по разным
+    студентам складываются через merge и применяются к курсу через
+    Course.merge_aggregates.
+    """
+
+    __slots__ = ("previous", "scores", "tasks", "completed_tasks",
+                 "all_score", "completed")
+
+    def __init__(self) -> None:
+        self.previous = {}
+        self.scores = {}
+        self.tasks = {}
+        self.completed_tasks = 0
+        self.all_score = 0
+        self.completed = []
+
+    def merge(self, other: 'CourseAggregate') -> 'CourseAggregate':
+        """Добавляет итоги по другому набору студентов."""
+        self.previous.update(other.previous)
+        self.scores.update(other.scores)
+        self.tasks.update(other.tasks)
+        self.completed_tasks += other.completed_tasks
+        self.all_score += other.all_score
+        self.completed = sorted(self.completed + other.completed)
+        return self
+
+
+def _aggregate_points(
+        rows: list[tuple[int, str | Sequence[int]]],
+        start_scores: dict[int, list[int]],
+        passing_scores: list[int],
+        keep_rows: bool
+) -> tuple[list[CourseAggregate], list[tuple[int, str]],
+           list[tuple[int, int, list[int]]]]:
+    """
+    Обрабатывает строки с баллами одной части в процессе-исполнителе.
+
+    rows - пары (номер строки, строка), start_scores - баллы студентов
+    этой части в курсах до порции. Правила те же, что в
+    Student._parse_points_rows и Course.update_many. Возвращает
+    частичные итоги курсов, отклоненные строки с номерами и принятые
+    строки (номер, id, баллы); принятые строки с баллами нужны только
+    для журнала, без keep_rows в них остаются лишь номера.
+    """
+    aggregates = [CourseAggregate() for _ in passing_scores]
+    current_scores = {}
+    rejected = []
+    accepted = []
+    for index, row in rows:
+        if isinstance(row, str):
+            student_id, _, points = row.partition(' ')
+            points = points.split()
+        else:
+            student_id, *points = map(str, row)
+
+        start = (start_scores.get(int(student_id))
+                 if student_id.isdecimal() else None)
+        if start is None:
+            rejected.append(
+                (index, f'{row}\tNo student is found for id={student_id}\n')
+            )
+            continue
+
+        values = StudentValidator.parse_points(points, len(passing_scores))
+        if values is None:
+            rejected.append((index, f'{row}\tIncorrect points format.\n'))
+            continue
+
+        student_id = int(student_id)
+        scores = current_scores.get(student_id)
+        if scores is None:
+            scores = current_scores[student_id] = list(start)
+        for column, points in enumerate(values):
+            if points == 0:
+                continue
+            aggregate = aggregates[column]
+            old_score = scores[column]
+            aggregate.previous.setdefault(student_id, old_score)
+            scores[column] = old_score + points
+            aggregate.tasks[student_id] = (
+                aggregate.tasks.get(student_id, 0) + 1
+            )
+            aggregate.completed_tasks += 1
+            aggregate.all_score += points
+            if old_score < passing_scores[column] <= scores[column]:
+                aggregate.completed.append((index, student_id))
+        accepted.append((index, student_id, values) if keep_rows
+                        else (index,))
+
+    for column, aggregate in enumerate(aggregates):
+        aggregate.scores = {student_id: current_scores[student_id][column]
+                            for student_id in aggregate.previous}
+    return aggregates, rejected, accepted
+
+
+class Course(metaclass=_ContextBound):
+    """
+    Класс для работы с курсами.
+
+    Course.courses - каталог курсов текущей когорты в порядке их
+    создания. Курсы можно добавлять и удалять во время работы, баллы
+    студентов хранятся в курсах (student_scores), поэтому это не
+    зависит от числа студентов. Курс помнит свою когорту (context)
+    и обновляет ее статистику и кеши.
+    """
+    courses = _ContextField()
+    # Порядковый номер следующего курса, курсы в статистике
+    # выводятся в порядке этих номеров.
+    position_counter = _ContextField()
+    # Растет при добавлении и удалении курсов: от состава каталога
+    # зависят строки баллов студентов.
+    catalog_version = _ContextField()
+
+    def __init__(self, name: str, passing_scores: int) -> None:
+        self.name = name
+        self.passing_scores = passing_scores
+        self.completed_tasks = 0
+        self.all_score = 0
+        self.student_scores = {}
+        # Рейтинг студентов: отсортированный список (-баллы, id),
+        # поддерживается в актуальном состоянии при каждом обновлении.
+        self.ranking = []
+        # Очередь студентов, окончивших курс и еще не получивших
+        # уведомление. Каждый студент попадает в нее ровно один раз.
+        self.completed_course = []
+        # Id студентов, которым уже отправлено уведомление. По нему
+        # iter_completion_messages не шлет письмо повторно, даже
+        # если студент снова попал в очередь.
+        self.notified = set()
+        # Защищает счетчики, баллы и рейтинг курса, см. TrackerLocks.
+        self.lock = TrackerLocks.course_lock()
+        # Растет при каждом изменении баллов курса, по нему
+        # проверяются готовые рейтинги в reports.
+        self.version = 0
+        self.reports = LRUCache(16)
+        self.context = context = _current_context.get()
+        # Скетчи приближенной статистики, если когорта их ведет.
+        self.sketches = CourseSketches() if context.approximate else None
+        with TrackerLocks.writing():
+            context.add_course(self)
+            if context.storage is not None:
+                context.storage.log_course(self)
+
+    @classmethod
+    def remove(cls, name: str) -> 'Course':
+        """Удаляет курс из каталога вместе с баллами студентов в нем."""
+        context = _current_context.get()
+        with TrackerLocks.writing():
+            course = context.courses.pop(name)
+            context.catalog_version += 1
+            TrackerStatistics.course_removed(course)
+            if context.storage is not None:
+                context.storage.log_course_removed(name)
+        return course
+
+    @staticmethod
+    def parse_course(data: str) -> tuple[str, int]:
+        """
+        Разбирает строку "название проходной_балл".
+        Название - одно слово, проходной балл - положительное число.
+        """
+        parts = data.split()
+        if (len(parts) != 2 or not parts[1].isdecimal()
+                or int(parts[1]) == 0 or parts[0].isdecimal()):
+            raise DataIsNotValid("Incorrect course data.")
+        return parts[0], int(parts[1])
+
+    def update(self, student: Student, points: int) -> None:
+        """Обновление данных курса."""
+        self.update_many(((student, points),))
+
+    def update_many(self, updates: Iterable[tuple[Student, int]]) -> None:
+        """
+        Пакетное обновление данных курса.
+        Равносильно вызову update для каждой пары по порядку.
+        """
+        with self.lock:
+            self._update_many(updates)
+
+    def _update_many(self, updates: Iterable[tuple[Student, int]]) -> None:
+        sketches = self.sketches
+        # Число заданий студентов в пакете для CountMinSketch.
+        tasks = {} if sketches is not None else None
+        student_scores = self.student_scores
+        completed_start = len(self.completed_course)
+        # Баллы студентов до пакета, чтобы обновить рейтинг один раз.
+        previous_scores = {}
+        completed_tasks = 0
+        all_score = 0
+
+        for student, points in updates:
+            if points == 0:
+                continue
+
+            old_score = student_scores.get(student.id, 0)
+            previous_scores.setdefault(student.id, old_score)
+            score = old_score + points
+            student_scores[student.id] = score
+            completed_tasks += 1
+            all_score += points
+            if tasks is not None:
+                tasks[student.id] = tasks.get(student.id, 0) + 1
+
+            # Если балов студента стало достаточно для окончания курса,
+            # добавляем его в список для выпуска курса. Баллы только
+            # растут, поэтому порог пересекается один раз.
+            if old_score < self.passing_scores <= score:
+                self.completed_course.append(student)
+
+        self._update_ranking(previous_scores)
+        self.completed_tasks += completed_tasks
+        self.all_score += all_score
+        if completed_tasks:
+            self.version += 1
+            self.context.score_cache.discard(previous_scores)
+            if sketches is not None:
+                sketches.update(previous_scores, student_scores, tasks)
+            if self.context.events is not None:
+                self._publish(previous_scores,
+                              [student.id for student
+                               in self.completed_course[completed_start:]])
+            TrackerStatistics.course_updated(self)
+
+    def merge_aggregates(self, aggregates: Iterable[CourseAggregate]) -> None:
+        """
+        Применяет частичные итоги по непересекающимся наборам студентов.
+        Результат не зависит от порядка частей: очередь окончивших
+        курс упорядочена по номерам строк.
+        """
+        total = CourseAggregate()
+        for aggregate in aggregates:
+            total.merge(aggregate)
+
+        with self.lock:
+            self.student_scores.update(total.scores)
+            students = self.context.students
+            self.completed_course.extend(
+                students[student_id] for _, student_id in total.completed
+            )
+            self._update_ranking(total.previous)
+            self.completed_tasks += total.completed_tasks
+            self.all_score += total.all_score
+            if total.completed_tasks:
+                self.version += 1
+                self.context.score_cache.discard(total.previous)
+                if self.sketches is not None:
+                    self.sketches.update(total.previous, total.scores,
+                                         total.tasks)
+                if self.context.events is not None:
+                    self._publish(total.previous,
+                                  [student_id for _, student_id
+                                   in total.completed])
+                TrackerStatistics.course_updated(self)
+
+    def _publish(self, previous_scores: dict[int, int],
+                 completed: list[int]) -> None:
+        """Отправляет в шину событий изменения баллов и выпуски пакета."""
+        name = self.name
+        scores = self.student_scores
+        self.context.events.publish_many(chain(
+            (ScoreChanged(name, student_id, old_score, scores[student_id])
+             for student_id, old_score in previous_scores.items()),
+            (CourseCompleted(name, student_id) for student_id in completed),
+        ))
+
+    def _update_ranking(self, previous_scores: dict[int, int]) -> None:
+        """
+        Переносит в рейтинге студентов, чьи баллы изменились.
+        Если изменилась заметная часть рейтинга, дешевле
+        отсортировать его заново.
+        """
+        ranking = self.ranking
+        if len(previous_scores) > len(ranking) // 16:
+            self.ranking = sorted((-points, student_id) for student_id, points
+                                  in self.student_scores.items())
+            return
+
+        for student_id, old_score in previous_scores.items():
+            if old_score:
+                del ranking[bisect_left(ranking, (-old_score, student_id))]
+            insort(ranking, (-self.student_scores[student_id], student_id))
+
+    def rebuild_sketches(self) -> None:
+        """
+        Заводит скетчи по текущим баллам, если когорта их ведет
+        (например, после загрузки курса из снимка).
+        """
+        with self.lock:
+            self.sketches = (CourseSketches.from_course(self)
+                             if self.context.approximate else None)
+
+    def get_average_score(self) -> float:
+        """
+        Если есть данные о выполненных задачах, возвращает
+        средний балл выполненных задач.
+        """
+        if self.completed_tasks == 0:
+            return 0
+        return self.all_score / self.completed_tasks
+
+    def get_top_page(self, offset: int = 0,
+                     limit: int | None = None) -> list[tuple[int, int]]:
+        """
+        Страница рейтинга курса: список (id, баллы) студентов,
+        отсортированных по баллам (по убыванию), а при равенстве
+        баллов - по ID (по возрастанию).
+        """
+        end = None if limit is None else offset + limit
+        with self.lock:
+            page = self.ranking[offset:end]
+        return [(student_id, -points) for points, student_id in page]
+
+    def get_student_rank(self, student_id: int) -> int | None:
+        """Место студента в рейтинге курса (с 1) или None."""
+        with self.lock:
+            score = self.student_scores.get(student_id)
+            if score is None:
+                return None
+            return bisect_left(self.ranking, (-score, student_id)) + 1
+
+    def get_top_students(self, offset: int = 0,
+                         limit: int | None = None) -> str:
+        """
+        Получаем отсортированных студентов курса.
+        Готовая страница рейтинга хранится в reports до изменения курса.
+        """
+        version = self.version
+        cached = self.reports.get((offset, limit))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        report = self.format_top_students(self.name, self.passing_scores,
+                                          self.get_top_page(offset, limit))
+        self.reports.put((offset, limit), (version, report))
+        return report
+
+    @staticmethod
+    def format_top_students(name: str, passing_scores: int,
+                            rows: Iterable[tuple[int, int]]) -> str:
+        """Формирует рейтинг курса из пар (id, баллы)."""
+        lines = [name, "id  points completed"]
+        for student_id, points in rows:
+            completion_rate = (points / passing_scores) * 100
+            lines.append(f"{student_id} {points}    {completion_rate:.1f}%")
+        return "\n".join(lines)
+
+    def iter_completion_messages(self) -> Iterator[tuple[Student, str]]:
+        """
+        Забирает очередь студентов, окончивших курс, и по одному
+        отдает пары (студент, письмо). Студенты из notified
+        пропускаются.
+        """
+        with TrackerLocks.writing():
+            with self.lock:
+                students = self.completed_course
+                self.completed_course = []
+            storage = self.context.storage
+            if students and storage is not None:
+                storage.log_notify(self.name)
+
+        notified = self.notified
+        for student in students:
+            if student.id in notified:
+                continue
+            notified.add(student.id)
+            yield student, self.format_completion_message(
+                student.first_name, student.last_name, student.email,
+                self.name,
+            )
+
+    @staticmethod
+    def format_completion_message(first_name: str, last_name: str,
+                                  email: str, course_name: str) -> str:
+        """Письмо студенту, окончившему курс."""
+        full_name = f'{first_name} {last_name}'
+
+        return (f'To: {email}\n'
+                f'Re: Your Learning Progress\n'
+                f'Hello, {full_name}! '
+                f'You have accomplished our {course_name} course!\n')
+
+    def get_completed_student_data(self) -> tuple[str, list[Student]]:
+        """
+        Получаем строку с сообщениями для студентов
+        окончивших курс и список этих студентов.
+        """
+        students = []
+        messages = []
+        for student, message in self.iter_completion_messages():
+            students.append(student)
+            messages.append(message)
+        return ''.join(messages), students
+
+
+class MappedScores(Mapping):
+    """
+    Баллы курса из образа только для чтения: id по возрастанию
+    и баллы в двух столбцах memoryview, поиск - бинарный.
+    """
+
+    def __init__(self, ids: memoryview, scores: memoryview) -> None:
+        self.ids = ids
+        self.scores = scores
+
+    def __getitem__(self, student_id: int) -> int:
+        pos = bisect_left(self.ids, student_id)
+        if pos < len(self.ids) and self.ids[pos] == student_id:
+            return self.scores[pos]
+        raise KeyError(student_id)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def values(self) -> Iterator[int]:
+        return iter(self.scores)
+
+    def items(self) -> Iterator[tuple[int, int]]:
+        return zip(self.ids, self.scores)
+
+
+class _RankingView(Sequence):
+    """
+    Рейтинг курса из образа в виде последовательности (-баллы, id),
+    как Course.ranking. Пары создаются только при обращении.
+    """
+
+    def __init__(self, ids: memoryview, scores: memoryview) -> None:
+        self.ids = ids
+        self.scores = scores
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [(-self.scores[i], self.ids[i])
+                    for i in range(*index.indices(len(self.ids)))]
+        return -self.scores[index], self.ids[index]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class MappedCourse(Course):
+    """
+    Курс из образа TrackerImage.
+
+    Баллы и рейтинг читаются из файла через MappedScores и _RankingView.
+    Перед первым изменением курс копирует их в обычные словарь и список
+    и дальше работает как Course.
+    """
+
+    @classmethod
+    def _restore(cls, name: str, passing_scores: int, completed_tasks: int,
+                 all_score: int, scores: MappedScores, ranking: _RankingView,
+                 completed_course: list[Student],
+                 notified: set[int]) -> 'MappedCourse':
+        """Создает курс по данным образа без записи в журнал."""
+        course = cls.__new__(cls)
+        course.name = name
+        course.passing_scores = passing_scores
+        course.completed_tasks = completed_tasks
+        course.all_score = all_score
+        course.student_scores = scores
+        course.ranking = ranking
+        course.completed_course = completed_course
+        course.notified = notified
+        course.lock = TrackerLocks.course_lock()
+        course.version = 0
+        course.reports = LRUCache(16)
+        course.context = _current_context.get()
+        course.context.add_course(course)
+        course.rebuild_sketches()
+        return course
+
+    def _materialize(self) -> None:
+        """Копирует баллы и рейтинг из образа в память."""
+        if not isinstance(self.student_scores, dict):
+            self.student_scores = dict(self.student_scores.items())
+            self.ranking = self.ranking[:]
+
+    def _update_many(self, updates: Iterable[tuple[Student, int]]) -> None:
+        self._materialize()
+        super()._update_many(updates)
+
+    def merge_aggregates(self, aggregates: Iterable[CourseAggregate]) -> None:
+        with self.lock:
+            self._materialize()
+        super().merge_aggregates(aggregates)
+
+
+class StreamNotificationSink:
+    """
+    Пишет уведомления в текстовый поток (по умолчанию stdout)
+    порциями по buffer_size писем.
+    """
+
+    def __init__(self, stream: TextIO | None = None,
+                 buffer_size: int = 1000) -> None:
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.written = 0
+
+    def write(self, message: str) -> None:
+        self.buffer.append(message)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        stream = self.stream or sys.stdout
+        if self.buffer:
+            stream.write(''.join(self.buffer))
+            self.written += len(self.buffer)
+            self.buffer.clear()
+        stream.flush()
+
+    def close(self) -> None:
+        """Дописывает остаток буфера."""
+        if not self.written and not self.buffer:
+            # Раньше пустое сообщение выводилось пустой строкой.
+            self.buffer.append('\n')
+        self.flush()
+        self.written = 0
+
+
+class MaildirNotificationSink:
+    """
+    Складывает каждое уведомление отдельным файлом в каталог
+    в стиле Maildir: письмо пишется в tmp и переносится в new.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.counter = 0
+        for subdir in ("tmp", "new", "cur"):
+            os.makedirs(os.path.join(directory, subdir), exist_ok=True)
+
+    def write(self, message: str) -> None:
+        self.counter += 1
+        name = (f'{time.time_ns()}.{os.getpid()}_{self.counter}.'
+                f'{socket.gethostname()}')
+        tmp_path = os.path.join(self.directory, "tmp", name)
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(message)
+        os.replace(tmp_path, os.path.join(self.directory, "new", name))
+
+    def close(self) -> None:
+        """Письма уже на диске, делать нечего."""
+
+
+class _CriteriaIndex:
+    """
+    Индекс значения критерия по курсам.
+
+    Хранит положительные значения курсов, группы курсов с одинаковым
+    значением и отсортированный список различных значений, поэтому
+    курсы с максимальным и минимальным значением известны без
+    пересчета по всем курсам.
+    """
+
+    def __init__(self) -> None:
+        self.values = {}
+        self.groups = {}
+        self.sorted_values = []
+
+    def set(self, course: 'Course', value: float) -> None:
+        """Обновляет значение критерия для курса."""
+        old_value = self.values.get(course.name)
+        if old_value == value:
+            return
+
+        if old_value is not None:
+            group = self.groups[old_value]
+            del group[course.name]
+            if not group:
+                del self.groups[old_value]
+                del self.sorted_values[
+                    bisect_left(self.sorted_values, old_value)
+                ]
+            del self.values[course.name]
+
+        # Как и раньше, курсы с нулевым значением в статистику не входят.
+        if value > 0:
+            self.values[course.name] = value
+            if value not in self.groups:
+                self.groups[value] = {}
+                insort(self.sorted_values, value)
+            self.groups[value][course.name] = course
+
+    def _names(self, value: float) -> list[str]:
+        """Курсы с данным значением в порядке их создания."""
+        courses = sorted(self.groups[value].values(),
+                         key=lambda course: course.position)
+        return [course.name for course in courses]
+
+    def most_and_least(self) -> tuple[list[str], list[str]]:
+        """Курсы с максимальным и минимальным значением критерия."""
+        if not self.sorted_values:
+            return ["n/a"], ["n/a"]
+
+        most_criteria = self._names(self.sorted_values[-1])
+        least_criteria = self._names(self.sorted_values[0])
+
+        if most_criteria == least_criteria:
+            return most_criteria, ["n/a"]
+
+        return most_criteria, least_criteria
+
+
+class TrackerStatistics(metaclass=_ContextBound):
+    """
+    Класс для расчета метрик курсов.
+
+    Индексы критериев обновляются из Course.update при каждом
+    изменении курса, поэтому get_statistic не пересчитывает
+    значения по всем курсам. Индексы у каждой когорты свои
+    (TrackerContext), критерии общие.
+    """
+
+    # Популярность - количество студентов,
+    # активность - количество выполненных заданий,
+    # сложность - средний балл выполненных заданий.
+    criteria = {
+        "popularity": lambda course: len(course.student_scores),
+        "activity": lambda course: course.completed_tasks,
+        "difficulty": lambda course: course.get_average_score(),
+    }
+    indexes = _ContextField("statistic_indexes")
+    # Растет при каждом изменении индексов. report - пара
+    # (версия, текст) последней выведенной статистики.
+    version = _ContextField("statistics_version")
+    report = _ContextField("statistics_report")
+
+    @classmethod
+    def new_indexes(cls) -> dict[str, _CriteriaIndex]:
+        """Пустые индексы по всем критериям."""
+        return {name: _CriteriaIndex() for name in cls.criteria}
+
+    @classmethod
+    def reset(cls) -> None:
+        """Очищает индексы, например, при пересоздании курсов."""
+        context = _current_context.get()
+        with TrackerLocks.statistics:
+            context.statistic_indexes = cls.new_indexes()
+            context.statistics_version += 1
+
+    @classmethod
+    def course_updated(cls, course: 'Course') -> None:
+        """Пересчитывает значения критериев одного курса."""
+        context = course.context
+        with TrackerLocks.statistics:
+            indexes = context.statistic_indexes
+            for name, criteria_func in cls.criteria.items():
+                indexes[name].set(course, criteria_func(course))
+            context.statistics_version += 1
+
+    @classmethod
+    def course_removed(cls, course: 'Course') -> None:
+        """Убирает удаленный курс из индексов."""
+        context = course.context
+        with TrackerLocks.statistics:
+            for index in context.statistic_indexes.values():
+                index.set(course, 0)
+            context.statistics_version += 1
+
+    @staticmethod
+    def _calculate_by_criteria(criteria_func) -> tuple[list[str], list[str]]:
+        """
+        Метод для расчета статистики по критериям полным перебором курсов.
+        Возвращает кортеж из двух списков: курсы с максимальным
+        и минимальным значениями по заданному критерию.
+        """
+        return TrackerStatistics.most_and_least({
+            name: criteria_func(course)
+            for name, course in Course.courses.items()
+        })
+
+    @staticmethod
+    def most_and_least(
+            criteria_results: dict[str, float]
+    ) -> tuple[list[str], list[str]]:
+        """
+        Курсы с максимальным и минимальным значением критерия
+        по словарю {курс: значение}. Курсы с нулевым значением
+        не учитываются.
+        """
+        criteria_results = {name: value
+                            for name, value in criteria_results.items()
+                            if value > 0}
+
+        if not criteria_results:
+            return ["n/a"], ["n/a"]
+
+        max_value = max(criteria_results.values())
+        min_value = min(criteria_results.values())
+
+        most_criteria = [name for name, value in criteria_results.items()
+                         if value == max_value]
+        least_criteria = [name for name, value in criteria_results.items()
+                          if value == min_value]
+
+        if most_criteria == least_criteria:
+            return most_criteria, ["n/a"]
+
+        return most_criteria, least_criteria
+
+    @staticmethod
+    def format_statistic(popularity: tuple[list[str], list[str]],
+                         activity: tuple[list[str], list[str]],
+                         difficulty: tuple[list[str], list[str]]) -> str:
+        """Формирует текст статистики."""
+        return (
+            f'Most popular: {", ".join(popularity[0])}\n'
+            f'Least popular: {", ".join(popularity[1])}\n'
+            f'Highest activity: {", ".join(activity[0])}\n'
+            f'Lowest activity: {", ".join(activity[1])}\n'
+            f'Easiest course: {", ".join(difficulty[0])}\n'
+            f'Hardest course: {", ".join(difficulty[1])}'
+        )
+
+    def get_statistic(self) -> str:
+        """
+        Метод для получения развернутой статистике по курсам.
+        Метод берет лучшие и худшие курсы по категориям из индексов.
+        Индексы читаются под одной блокировкой, поэтому все категории
+        относятся к одному и тому же состоянию курсов. Пока индексы
+        не менялись, отдается уже готовый текст.
+        """
+        context = _current_context.get()
+        with TrackerLocks.statistics:
+            report = context.statistics_report
+            version = context.statistics_version
+            if report is not None and report[0] == version:
+                return report[1]
+            results = [context.statistic_indexes[name].most_and_least()
+                       for name in self.criteria]
+        text = self.format_statistic(*results)
+        context.statistics_report = (version, text)
+        return text
+
+    def get_approximate_statistic(self) -> str | None:
+        """
+        Приближенная статистика по скетчам курсов (CourseSketches):
+        число студентов, медиана и 90-й процентиль выполнения курса.
+        None, если когорта не ведет скетчи.
+        """
+        context = _current_context.get()
+        if not context.approximate:
+            return None
+        lines = []
+        for name, course in context.courses.items():
+            with course.lock:
+                students = len(course.sketches.students)
+                median, p90 = (course.sketches.scores.quantile(q)
+                               for q in (0.5, 0.9))
+            median, p90 = (
+                "n/a" if score is None
+                else f"{score / course.passing_scores * 100:.1f}%"
+                for score in (median, p90)
+            )
+            lines.append(f"{name}: ~{students} students, "
+                         f"median {median}, p90 {p90}")
+        return "\n".join(lines)
+
+    def get_approximate_tasks(self, student_id: int) -> str:
+        """Приближенное число заданий студента по курсам."""
+        parts = []
+        for name, course in _current_context.get().courses.items():
+            with course.lock:
+                parts.append(f'{name}~{course.sketches.tasks[student_id]}')
+        return f'{student_id} tasks: {"; ".join(parts)}'
+
+    def get_exact_statistic(self) -> str:
+        """Та же статистика, рассчитанная полным перебором курсов."""
+        return self.format_statistic(
+            *(self._calculate_by_criteria(criteria_func)
+              for criteria_func in self.criteria.values())
+        )
+
+
+class TrackerContext:
+    """
+    Состояние одной когорты: студенты, индексы, счетчик id, каталог
+    курсов, статистика, хранилище и история баллов.
+
+    Student.students, Course.courses, TrackerStatistics.indexes и
+    другие атрибуты _ContextField читаются из текущего контекста,
+    поэтому в одном процессе можно держать много когорт. Текущий
+    контекст задает activate (для потоков и задач asyncio он свой),
+    LearningProgressTracker выполняет команды в своем контексте.
+    Без activate работает контекст по умолчанию.
+
+    Общие для всех когорт неизменяемые данные не копируются: проверки
+    StudentValidator, критерии статистики и словарь проходных баллов,
+    переданный в courses_points.
+    """
+
+    # Все созданные контексты, например, чтобы включить блокировки
+    # курсов во всех когортах.
+    contexts = weakref.WeakSet()
+
+    def __init__(self,
+                 courses_points: Mapping[str, int] | None = None) -> None:
+        self.courses_points = courses_points
+        self.students = {}
+        self.emails = {}
+        self.index = StudentIndex()
+        self.id_counter = 1000
+        self.score_cache = LRUCache(10_000)
+        self.courses = {}
+        self.position_counter = 0
+        self.catalog_version = 0
+        self.statistic_indexes = TrackerStatistics.new_indexes()
+        self.statistics_version = 0
+        self.statistics_report = None
+        # Хранилище, в которое пишутся события когорты, и история
+        # баллов (TrackerStorage.active и PointHistory.active).
+        self.storage = None
+        self.history = None
+        # Шина событий когорты (EventBus.active).
+        self.events = None
+        # Ведут ли курсы скетчи приближенной статистики.
+        self.approximate = False
+        TrackerContext.contexts.add(self)
+        if courses_points:
+            with self.activate():
+                for name, passing_scores in courses_points.items():
+                    Course(name, passing_scores)
+
+    @staticmethod
+    def current() -> 'TrackerContext':
+        """Контекст, с которым сейчас работают классы трекера."""
+        return _current_context.get()
+
+    @contextmanager
+    def activate(self) -> Iterator['TrackerContext']:
+        """Делает контекст текущим внутри блока with."""
+        token = _current_context.set(self)
+        try:
+            yield self
+        finally:
+            _current_context.reset(token)
+
+    @classmethod
+    def all_courses(cls) -> Iterator['Course']:
+        """Курсы всех когорт."""
+        for context in list(cls.contexts):
+            yield from list(context.courses.values())
+
+    def enable_sketches(self) -> None:
+        """
+        Включает приближенную статистику (CourseSketches) для курсов
+        когорты, в том числе уже созданных.
+        """
+        self.approximate = True
+        for course in self.courses.values():
+            course.rebuild_sketches()
+
+    def add_course(self, course: 'Course') -> None:
+        """Добавляет курс в конец каталога когорты."""
+        course.position = self.position_counter
+        self.position_counter += 1
+        self.catalog_version += 1
+        self.courses[course.name] = course
+
+
+# Текущая когорта. Потоки и задачи, не выбравшие когорту,
+# работают с контекстом по умолчанию.
+_current_context = ContextVar('tracker_context', default=TrackerContext())
+
+
+class TrackerStorage(metaclass=_ContextBound):
+    """
+    Хранение состояния трекера на диске.
+
+    Все изменения (новые студенты, баллы, отправка уведомлений,
+    добавление и удаление курсов) дописываются в журнал events.<N>.log,
+    fsync выполняется раз в sync_every событий. checkpoint сохраняет
+    компактный двоичный снимок snapshot.bin и начинает новый журнал.
+    При запуске снимок читается через mmap, а из журнала применяются
+    только события после него.
+    """
+
+    # Хранилище, в которое сейчас пишутся события трекера.
+    active = _ContextField("storage")
+
+    magic = b'LPTS'
+    version = 2
+    event_student = 1
+    event_points = 2
+    event_notify = 3
+    event_course = 4
+    event_course_removed = 5
+    # Заголовок записи журнала: тип события и длина данных.
+    record_header = struct.Struct('<BI')
+    # Заголовок снимка: сигнатура, версия, номер журнала,
+    # следующий id студента, количество курсов и студентов.
+    snapshot_header = struct.Struct('<4sHqqIQ')
+    # Заголовок курса: проходной балл, число заданий, сумма баллов,
+    # длины списков ожидающих и уведомленных и число студентов с баллами.
+    course_header = struct.Struct('<qqqQQQ')
+    # В версии 1 баллы хранились плотной матрицей студенты x курсы.
+    course_header_v1 = struct.Struct('<qqqQQ')
+    string_length = struct.Struct('<H')
+    int64 = struct.Struct('<q')
+
+    def __init__(self, directory: str, sync_every: int = 1000,
+                 checkpoint_every: int | None = None) -> None:
+        self.directory = directory
+        self.sync_every = sync_every
+        self.checkpoint_every = checkpoint_every
+        self.generation = 0
+        self.log = None
+        self.unsynced = 0
+        self.logged = 0
+        # Журнал набрал checkpoint_every событий, снимок сделает
+        # TrackerLocks.writing после изменения.
+        self.checkpoint_due = False
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, "snapshot.bin")
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"events.{generation}.log")
+
+    def open(self) -> int:
+        """
+        Восстанавливает состояние из снимка и журнала и начинает
+        запись новых событий. Возвращает число событий из журнала.
+        """
+        if os.path.exists(self.snapshot_path):
+            self._load_snapshot()
+        replayed = self._replay_log()
+        self.log = open(self._log_path(self.generation), 'ab')
+        TrackerStorage.active = self
+        return replayed
+
+    def close(self) -> None:
+        """Сбрасывает журнал на диск и прекращает запись событий."""
+        if TrackerStorage.active is self:
+            TrackerStorage.active = None
+        if self.log is not None:
+            self.sync()
+            self.log.close()
+            self.log = None
+
+    def sync(self) -> None:
+        """Сбрасывает записанные события на диск."""
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.unsynced = 0
+
+    # Запись событий. Методы вызываются после изменения состояния
+    # внутри того же блока TrackerLocks.writing, а снимок делается
+    # вне таких блоков, поэтому он содержит ровно события журнала
+    # до него.
+
+    @classmethod
+    def _pack_str(cls, value: str) -> bytes:
+        data = value.encode('utf-8')
+        return cls.string_length.pack(len(data)) + data
+
+    @classmethod
+    def _unpack_str(cls, data, offset: int) -> tuple[str, int]:
+        (length,) = cls.string_length.unpack_from(data, offset)
+        offset += cls.string_length.size
+        return str(data[offset:offset + length], 'utf-8'), offset + length
+
+    def _append(self, kind: int, payload: bytes) -> None:
+        self.log.write(self.record_header.pack(kind, len(payload)))
+        self.log.write(payload)
+        self.unsynced += 1
+        self.logged += 1
+        if self.unsynced >= self.sync_every:
+            self.sync()
+
+    def _maybe_checkpoint(self) -> None:
+        if self.checkpoint_every and self.logged >= self.checkpoint_every:
+            self.checkpoint_due = True
+
+    def checkpoint_if_due(self) -> None:
+        """Делает назначенный журналом снимок."""
+        # Поток внутри изменения сделает снимок, когда выйдет из него.
+        if TrackerLocks.enabled and TrackerLocks.writes.held():
+            return
+        with TrackerLocks.exclusive():
+            if self.checkpoint_due:
+                self._checkpoint()
+
+    def log_student(self, student: Student) -> None:
+        with TrackerLocks.storage:
+            self._append(self.event_student, b''.join((
+                self.int64.pack(student.id),
+                self._pack_str(student.first_name),
+                self._pack_str(student.last_name),
+                self._pack_str(student.email),
+            )))
+            self._maybe_checkpoint()
+
+    def log_points(self, rows: list[tuple[int, list[int]]]) -> None:
+        with TrackerLocks.storage:
+            for student_id, points in rows:
+                self._append(self.event_points, struct.pack(
+                    f'<qH{len(points)}q', student_id, len(points), *points
+                ))
+            self._maybe_checkpoint()
+
+    def log_notify(self, course_name: str) -> None:
+        with TrackerLocks.storage:
+            self._append(self.event_notify, self._pack_str(course_name))
+            self._maybe_checkpoint()
+
+    def log_course(self, course: 'Course') -> None:
+        with TrackerLocks.storage:
+            self._append(self.event_course,
+                         self.int64.pack(course.passing_scores)
+                         + self._pack_str(course.name))
+            self._maybe_checkpoint()
+
+    def log_course_removed(self, course_name: str) -> None:
+        with TrackerLocks.storage:
+            self._append(self.event_course_removed,
+                         self._pack_str(course_name))
+            self._maybe_checkpoint()
+
+    def _replay_log(self) -> int:
+        """
+        Применяет события журнала текущего поколения.
+        Недописанная запись в конце журнала отбрасывается.
+        """
+        path = self._log_path(self.generation)
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as file:
+            data = file.read()
+
+        replayed = 0
+        offset = 0
+        rows = []
+        header_size = self.record_header.size
+        while offset + header_size <= len(data):
+            kind, size = self.record_header.unpack_from(data, offset)
+            start = offset + header_size
+            if start + size > len(data):
+                break
+
+            if kind == self.event_points:
+                student_id, count = struct.unpack_from('<qH', data, start)
+                rows.append((student_id, *struct.unpack_from(
+                    f'<{count}q', data, start + 10
+                )))
+            else:
+                # Баллы подряд применяем одной пачкой.
+                Student.add_points_many(rows)
+                rows = []
+                if kind == self.event_student:
+                    (Student.id_counter,) = self.int64.unpack_from(
+                        data, start
+                    )
+                    first_name, pos = self._unpack_str(data, start + 8)
+                    last_name, pos = self._unpack_str(data, pos)
+                    email, _ = self._unpack_str(data, pos)
+                    Student(first_name, last_name, email)
+                elif kind == self.event_notify:
+                    name, _ = self._unpack_str(data, start)
+                    for _ in Course.courses[name].iter_completion_messages():
+                        pass
+                elif kind == self.event_course:
+                    (passing_scores,) = self.int64.unpack_from(data, start)
+                    name, _ = self._unpack_str(data, start + 8)
+                    Course(name, passing_scores)
+                elif kind == self.event_course_removed:
+                    name, _ = self._unpack_str(data, start)
+                    Course.remove(name)
+                else:
+                    raise ValueError(f"Unknown event type {kind} in {path}")
+            offset = start + size
+            replayed += 1
+        Student.add_points_many(rows)
+
+        if offset < len(data):
+            with open(path, 'r+b') as file:
+                file.truncate(offset)
+        return replayed
+
+    def checkpoint(self) -> None:
+        """Сохраняет снимок состояния и начинает новый журнал."""
+        with TrackerLocks.exclusive():
+            self._checkpoint()
+
+    def _checkpoint(self) -> None:
+        self.checkpoint_due = False
+        generation = self.generation + 1
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            self._write_snapshot(file, generation)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        old_log, old_path = self.log, self._log_path(self.generation)
+        self.generation = generation
+        self.log = open(self._log_path(generation), 'ab')
+        self.unsynced = 0
+        self.logged = 0
+        if old_log is not None:
+            old_log.close()
+            os.remove(old_path)
+
+    def _write_snapshot(self, file, generation: int) -> None:
+        courses = list(Course.courses.values())
+        file.write(self.snapshot_header.pack(
+            self.magic, self.version, generation, Student.id_counter,
+            len(courses), len(Student.students),
+        ))
+        for course in courses:
+            pending = array('q', (student.id
+                                  for student in course.completed_course))
+            notified = array('q', course.notified)
+            # Баллы курса: массив id и массив баллов, только ненулевые.
+            scored = array('q', course.student_scores)
+            scores = array('q', course.student_scores.values())
+            file.write(self._pack_str(course.name))
+            file.write(self.course_header.pack(
+                course.passing_scores, course.completed_tasks,
+                course.all_score, len(pending), len(notified), len(scored),
+            ))
+            for ids in (pending, notified, scored, scores):
+                file.write(ids.tobytes())
+
+        chunk = []
+        for student in Student.students.values():
+            chunk.append(self.int64.pack(student.id))
+            chunk.append(self._pack_str(student.first_name))
+            chunk.append(self._pack_str(student.last_name))
+            chunk.append(self._pack_str(student.email))
+            if len(chunk) >= 40_000:
+                file.write(b''.join(chunk))
+                chunk.clear()
+        file.write(b''.join(chunk))
+
+    def _load_snapshot(self) -> None:
+        """
+        Загружает снимок состояния, отображая файл в память.
+        Каталог курсов заменяется курсами из снимка.
+        """
+        with open(self.snapshot_path, 'rb') as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            (magic, version, self.generation, id_counter, course_count,
+             student_count) = self.snapshot_header.unpack_from(data, 0)
+            if magic != self.magic or version not in (1, self.version):
+                raise ValueError(f"Unknown snapshot format: {magic!r} "
+                                 f"version {version}")
+            course_header = (self.course_header_v1 if version == 1
+                             else self.course_header)
+            offset = self.snapshot_header.size
+
+            existing = dict(Course.courses)
+            Course.courses.clear()
+            courses = []
+            pending_ids = []
+            for _ in range(course_count):
+                name, offset = self._unpack_str(data, offset)
+                (passing_scores, completed_tasks, all_score, pending,
+                 notified, *scored) = course_header.unpack_from(data, offset)
+                scored = scored[0] if scored else 0
+                offset += course_header.size
+                ids = array('q')
+                size = 8 * (pending + notified + 2 * scored)
+                ids.frombytes(data[offset:offset + size])
+                offset += size
+
+                course = (existing.pop(name, None)
+                          or Course(name, passing_scores))
+                Course.courses[name] = course
+                course.position = Course.position_counter
+                Course.position_counter += 1
+                course.version += 1
+                course.passing_scores = passing_scores
+                course.completed_tasks = completed_tasks
+                course.all_score = all_score
+                course.notified = set(ids[pending:pending + notified])
+                scores_start = pending + notified
+                course.student_scores.update(zip(
+                    ids[scores_start:scores_start + scored],
+                    ids[scores_start + scored:],
+                ))
+                courses.append(course)
+                pending_ids.append(ids[:pending])
+            for course in existing.values():
+                TrackerStatistics.course_removed(course)
+            Course.catalog_version += 1
+
+            # В версии 1 после id студента идут его баллы по всем курсам.
+            dense_count = course_count if version == 1 else 0
+            points = struct.Struct(f'<q{dense_count}q')
+            scores = [course.student_scores for course in courses]
+            for _ in range(student_count):
+                student_id, *values = points.unpack_from(data, offset)
+                first_name, offset = self._unpack_str(data,
+                                                      offset + points.size)
+                last_name, offset = self._unpack_str(data, offset)
+                email, offset = self._unpack_str(data, offset)
+
+                Student._restore(student_id, first_name, last_name, email)
+                for course_scores, value in zip(scores, values):
+                    if value:
+                        course_scores[student_id] = value
+
+        Student.id_counter = id_counter
+        for course, ids in zip(courses, pending_ids):
+            course.ranking = sorted(
+                (-points, student_id)
+                for student_id, points in course.student_scores.items()
+            )
+            course.completed_course = [Student.students[student_id]
+                                       for student_id in ids]
+            course.rebuild_sketches()
+            TrackerStatistics.course_updated(course)
+
+
+class TrackerImage:
+    """
+    Двоичный образ всего состояния трекера для переноса между машинами.
+
+    Файл состоит из заголовка, таблицы строк (имена, email и названия
+    курсов), столбцов студентов фиксированной ширины (id и номера строк
+    имени, фамилии и email), номеров студентов в порядке email и
+    столбцов баллов и рейтинга каждого курса. Столбцы выровнены по
+    8 байт, поэтому load отображает файл в память и раздает
+    представления memoryview без копирования и разбора: строки
+    декодируются при обращении, курс копирует баллы в память только
+    перед первым изменением.
+    """
+
+    magic = b'LPTIMAGE'
+    version = 1
+    # Заголовок: сигнатура, версия, количество курсов, следующий id
+    # студента, количество студентов, строк и байтов таблицы строк.
+    header = struct.Struct('<8sIIqQQQ')
+    # Заголовок курса: номер названия в таблице строк, проходной балл,
+    # число заданий, сумма баллов, длины очереди окончивших курс,
+    # списка уведомленных и столбцов баллов.
+    course_header = struct.Struct('<qqqqQQQ')
+
+    @staticmethod
+    def _write_column(file, data: bytes) -> None:
+        """Пишет столбец и дополняет его нулями до границы 8 байт."""
+        file.write(data)
+        file.write(bytes(-len(data) % 8))
+
+    @staticmethod
+    def _column(view: memoryview, offset: int, kind: str,
+                count: int) -> tuple[memoryview, int]:
+        """Столбец из count чисел типа kind и смещение следующего."""
+        size = struct.calcsize(kind) * count
+        column = view[offset:offset + size].cast(kind)
+        return column, offset + size + -size % 8
+
+    @classmethod
+    def export(cls, path: str) -> None:
+        """Сохраняет текущее состояние трекера в файл path."""
+        strings = {}
+        ids = array('q')
+        columns = (array('I'), array('I'), array('I'))
+        first_names, last_names, emails = columns
+        for student_id, student in Student.students.items():
+            ids.append(student_id)
+            first_names.append(strings.setdefault(student.first_name,
+                                                  len(strings)))
+            last_names.append(strings.setdefault(student.last_name,
+                                                 len(strings)))
+            emails.append(strings.setdefault(student.email, len(strings)))
+        course_names = [strings.setdefault(name, len(strings))
+                        for name in Course.courses]
+
+        table = list(strings)
+        order = array('I', sorted(range(len(ids)),
+                                  key=lambda row: table[emails[row]]))
+        encoded = [value.encode('utf-8') for value in table]
+        offsets = array('Q', accumulate(map(len, encoded), initial=0))
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(cls.header.pack(
+                cls.magic, cls.version, len(Course.courses),
+                Student.id_counter, len(ids), len(table), offsets[-1],
+            ))
+            for column in (offsets, ids, *columns, order):
+                cls._write_column(file, column.tobytes())
+            cls._write_column(file, b''.join(encoded))
+
+            for name, course in zip(course_names, Course.courses.values()):
+                pending = array('q', (student.id
+                                      for student in course.completed_course))
+                notified = array('q', sorted(course.notified))
+                scored = sorted(course.student_scores.items())
+                ranking = course.ranking[:]
+                file.write(cls.course_header.pack(
+                    name, course.passing_scores, course.completed_tasks,
+                    course.all_score, len(pending), len(notified),
+                    len(scored),
+                ))
+                for column in (
+                        pending, notified,
+                        array('q', (student_id for student_id, _ in scored)),
+                        array('q', (points for _, points in scored)),
+                        array('q', (student_id for _, student_id in ranking)),
+                        array('q', (-points for points, _ in ranking)),
+                ):
+                    file.write(column.tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> None:
+        """
+        Заменяет студентов и курсы трекера состоянием из образа path.
+        Файл остается отображенным в память, пока на него ссылаются
+        студенты и курсы.
+        """
+        with open(path, 'rb') as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(data)
+        (magic, version, course_count, id_counter, student_count,
+         string_count, string_size) = cls.header.unpack_from(view, 0)
+        if magic != cls.magic or version != cls.version:
+            raise ValueError(f"Unknown image format: {magic!r} "
+                             f"version {version}")
+
+        offset = cls.header.size
+        offsets, offset = cls._column(view, offset, 'Q', string_count + 1)
+        ids, offset = cls._column(view, offset, 'q', student_count)
+        codes = []
+        for _ in range(3):
+            column, offset = cls._column(view, offset, 'I', student_count)
+            codes.append(column)
+        order, offset = cls._column(view, offset, 'I', student_count)
+        chars, offset = cls._column(view, offset, 'B', string_size)
+        strings = _MappedStrings(offsets, chars)
+
+        store = MappedStudentStore(
+            ids, *(_MappedColumn(column, strings) for column in codes)
+        )
+        Student.students = store
+        Student.emails = MappedEmailIndex(store, order)
+        Student.index = StudentIndex(StudentRow(store, row)
+                                     for row in range(student_count))
+        Student.id_counter = id_counter
+
+        Course.courses.clear()
+        TrackerStatistics.reset()
+        for _ in range(course_count):
+            (name, passing_scores, completed_tasks, all_score, pending,
+             notified, scored) = cls.course_header.unpack_from(view, offset)
+            offset += cls.course_header.size
+            columns = []
+            for count in (pending, notified, scored, scored, scored, scored):
+                column, offset = cls._column(view, offset, 'q', count)
+                columns.append(column)
+            (pending_ids, notified_ids, score_ids, scores, rank_ids,
+             rank_scores) = columns
+            course = MappedCourse._restore(
+                strings[name], passing_scores, completed_tasks, all_score,
+                MappedScores(score_ids, scores),
+                _RankingView(rank_ids, rank_scores),
+                [store[student_id] for student_id in pending_ids],
+                set(notified_ids),
+            )
+            TrackerStatistics.course_updated(course)
+
+
+class _HistoryPartition:
+    """
+    События истории баллов за один интервал [start, end).
+
+    События лежат в типизированных столбцах. Итоги (число событий
+    и сумма баллов) ведутся по курсам за весь интервал и за каждый
+    слот длиной slot_seconds, поэтому окно запроса читает события
+    только в неполных слотах на своих краях.
+    """
+
+    def __init__(self, start: int, end: int, slot_seconds: int) -> None:
+        self.start = start
+        self.end = end
+        self.slot_seconds = slot_seconds
+        self.timestamps = array('q')
+        self.students = array('q')
+        self.courses = array('I')
+        self.points = array('q')
+        # События добавлены по возрастанию времени: края окна
+        # ищутся бинарным поиском.
+        self.ordered = True
+        self.counts = {}
+        self.totals = {}
+        self.slot_counts = {}
+        self.slot_totals = {}
+
+    def add(self, timestamp: int, rows: list[tuple[int, Sequence[int]]],
+            codes: list[int]) -> None:
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            self.ordered = False
+        slot = (timestamp - self.start) // self.slot_seconds
+        slots = -(-(self.end - self.start) // self.slot_seconds)
+        ids = [student_id for student_id, _ in rows]
+        columns = zip(*(points for _, points in rows))
+        for code, column in zip(codes, columns):
+            values = [value for value in column if value]
+            if not values:
+                continue
+            students = compress(ids, column)
+            self.timestamps.extend(repeat(timestamp, len(values)))
+            self.students.extend(students)
+            self.courses.extend(repeat(code, len(values)))
+            self.points.extend(values)
+
+            total = sum(values)
+            if code not in self.counts:
+                self.counts[code] = self.totals[code] = 0
+                self.slot_counts[code] = array('q', bytes(8 * slots))
+                self.slot_totals[code] = array('q', bytes(8 * slots))
+            self.counts[code] += len(values)
+            self.totals[code] += total
+            self.slot_counts[code][slot] += len(values)
+            self.slot_totals[code][slot] += total
+
+    def aggregate(self, start: int, end: int, counts: dict[int, int],
+                  totals: dict[int, int]) -> None:
+        """Добавляет к counts и totals итоги событий из [start, end)."""
+        start = max(start, self.start)
+        end = min(end, self.end)
+        if start >= end:
+            return
+        if start == self.start and end == self.end:
+            for code, count in self.counts.items():
+                counts[code] = counts.get(code, 0) + count
+                totals[code] = totals.get(code, 0) + self.totals[code]
+            return
+
+        width = self.slot_seconds
+        first_slot = -(-(start - self.start) // width)
+        last_slot = (end - self.start) // width
+        if end == self.end:
+            last_slot = len(next(iter(self.slot_counts.values()), ()))
+        if first_slot >= last_slot:
+            self._scan(start, end, counts, totals)
+            return
+
+        for code, slot_counts in self.slot_counts.items():
+            count = sum(slot_counts[first_slot:last_slot])
+            if count:
+                counts[code] = counts.get(code, 0) + count
+                totals[code] = (totals.get(code, 0)
+                                + sum(self.slot_totals[code]
+                                      [first_slot:last_slot]))
+        self._scan(start, self.start + first_slot * width, counts, totals)
+        self._scan(self.start + last_slot * width, end, counts, totals)
+
+    def _scan(self, start: int, end: int, counts: dict[int, int],
+              totals: dict[int, int]) -> None:
+        """Итоги по событиям из [start, end) перебором."""
+        if start >= end:
+            return
+        if self.ordered:
+            first = bisect_left(self.timestamps, start)
+            last = bisect_left(self.timestamps, end, first)
+            events = zip(self.courses[first:last], self.points[first:last])
+        else:
+            events = ((code, points) for timestamp, code, points
+                      in zip(self.timestamps, self.courses, self.points)
+                      if start <= timestamp < end)
+        for code, points in events:
+            counts[code] = counts.get(code, 0) + 1
+            totals[code] = totals.get(code, 0) + points
+
+
+class PointHistory(metaclass=_ContextBound):
+    """
+    История принятых баллов для запросов по окнам времени.
+
+    Каждая принятая строка баллов превращается в события (время, id
+    студента, номер курса, баллы) - по одному на ненулевой балл.
+    События делятся на интервалы по bucket_seconds (_HistoryPartition)
+    с заранее посчитанными итогами, поэтому запрос по окну складывает
+    итоги интервалов и читает события только на краях окна.
+
+    Номера курсов не меняются при удалении курсов из каталога.
+    История хранится в памяти, при восстановлении из журнала
+    TrackerStorage время событий не известно, поэтому историю
+    включают после открытия хранилища.
+    """
+
+    # История, в которую сейчас пишутся баллы, или None.
+    active = _ContextField("history")
+
+    def __init__(self, bucket_seconds: int = 3600, slot_seconds: int = 60,
+                 clock=time.time) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.slot_seconds = slot_seconds
+        self.clock = clock
+        self.course_codes = {}
+        self.course_names = []
+        self.partitions = {}
+        # Номера интервалов по возрастанию.
+        self.buckets = []
+        self.lock = threading.Lock()
+
+    def _course_code(self, name: str) -> int:
+        code = self.course_codes.get(name)
+        if code is None:
+            code = self.course_codes[name] = len(self.course_names)
+            self.course_names.append(name)
+        return code
+
+    def record(self, rows: list[tuple[int, Sequence[int]]],
+               courses: list['Course'],
+               timestamp: int | None = None) -> None:
+        """
+        Добавляет строки (id студента, баллы по courses), принятые
+        в момент timestamp (по умолчанию сейчас, в секундах).
+        """
+        if timestamp is None:
+            timestamp = int(self.clock())
+        bucket = timestamp // self.bucket_seconds
+        with self.lock:
+            codes = [self._course_code(course.name) for course in courses]
+            partition = self.partitions.get(bucket)
+            if partition is None:
+                start = bucket * self.bucket_seconds
+                partition = self.partitions[bucket] = _HistoryPartition(
+                    start, start + self.bucket_seconds, self.slot_seconds
+                )
+                insort(self.buckets, bucket)
+            partition.add(timestamp, rows, codes)
+
+    def window(self, start: int, end: int) -> dict[str, tuple[int, int]]:
+        """
+        Итоги событий из [start, end) по курсам: название ->
+        (число принятых баллов, сумма баллов). Курсы без событий
+        не выводятся.
+        """
+        counts = {}
+        totals = {}
+        with self.lock:
+            first = bisect_left(self.buckets, start // self.bucket_seconds)
+            last = bisect_left(self.buckets,
+                               -(-end // self.bucket_seconds), first)
+            for bucket in self.buckets[first:last]:
+                self.partitions[bucket].aggregate(start, end, counts, totals)
+            names = self.course_names
+        return {names[code]: (counts[code], totals[code])
+                for code in sorted(counts)}
+
+    def series(self, start: int, end: int,
+               step: int) -> list[tuple[int, dict[str, tuple[int, int]]]]:
+        """
+        Итоги по окнам [start, start + step), ... до end, например
+        баллы по курсам за каждую неделю.
+        """
+        return [(window_start,
+                 self.window(window_start, min(window_start + step, end)))
+                for window_start in range(start, end, step)]
+
+    def __len__(self) -> int:
+        return sum(len(partition.points)
+                   for partition in self.partitions.values())
+
+
+class StudentAdded(NamedTuple):
+    """Событие: добавлен студент."""
+    student_id: int
+    first_name: str
+    last_name: str
+    email: str
+
+
+class PointsAdded(NamedTuple):
+    """Событие: принята строка баллов, points - баллы по courses."""
+    student_id: int
+    courses: tuple[str, ...]
+    points: tuple[int, ...]
+
+
+class ScoreChanged(NamedTuple):
+    """
+    Событие: баллы студента в курсе изменились с old_score на score.
+    Пакетные обновления дают одно событие на студента за пакет.
+    """
+    course: str
+    student_id: int
+    old_score: int
+    score: int
+
 
-    @staticmethod
-    def get_students_id() -> str:
-        """Отдает в консоль список id студентов."""
-        if not Student.students:
-            return "No students found"
-        # Создаем список строк, каждая из которых содержит ID студента.
-        students_ids = [str(key) for key in Student.students]
-        return "Students:\n" + "\n".join(students_ids)
+class CourseCompleted(NamedTuple):
+    """Событие: студент набрал проходной балл курса."""
+    course: str
+    student_id: int
 
 
-class Course:
-    """Класс для работы с курсами."""
-    courses = {}
+EVENT_TYPES = {event_type.__name__: event_type for event_type in (
+    StudentAdded, PointsAdded, ScoreChanged, CourseCompleted
+)}
 
-    def __init__(self, name: str, passing_scores: int) -> None:
-        self.name = name
-        self.passing_scores = passing_scores
-        self.completed_tasks = 0
-        self.all_score = 0
-        self.student_scores = {}
-        self.completed_course = []
-        self.courses[name] = self
 
-    def update(self, student: Student, points: int) -> None:
-        """Обновление данных курса."""
-        if points == 0:
-            return
+class EventSubscription:
+    """
+    Подписка на события EventBus: кольцевой буфер на capacity пар
+    (смещение, событие). Если буфер полон, policy решает, что делать:
+    - drop_oldest: вытеснить самое старое событие;
+    - drop_newest: отбросить новое событие;
+    - block: ждать, пока подписчик заберет события (только если
+      подписчик читает в другом потоке).
+    Отброшенные события считаются в dropped.
+    """
+
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    BLOCK = "block"
 
-        self.student_scores[student.id] = (
-                self.student_scores.get(student.id, 0) + points
+    def __init__(self, bus: 'EventBus', capacity: int, policy: str,
+                 types: Iterable[type] | None) -> None:
+        if policy not in (self.DROP_OLDEST, self.DROP_NEWEST, self.BLOCK):
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.bus = bus
+        self.capacity = capacity
+        self.policy = policy
+        self.types = tuple(types) if types is not None else None
+        self.buffer = deque(
+            maxlen=capacity if policy == self.DROP_OLDEST else None
         )
-        self.completed_tasks += 1
-        self.all_score += points
+        self.dropped = 0
+        self.closed = False
 
-        # Если балов студентов достаточно для окончания курса,
-        # добавляем его в список для выпуска курса.
-        if self.student_scores[student.id] >= self.passing_scores:
-            self.completed_course.append(student)
+    def _push_many(self, events: list[tuple[int, NamedTuple]]) -> None:
+        """Кладет события в буфер, вызывается под bus.changed."""
+        if self.types is not None:
+            events = [item for item in events
+                      if isinstance(item[1], self.types)]
+        buffer = self.buffer
+        if self.policy == self.BLOCK:
+            changed = self.bus.changed
+            for item in events:
+                if len(buffer) >= self.capacity:
+                    changed.notify_all()
+                    changed.wait_for(
+                        lambda: len(buffer) < self.capacity or self.closed
+                    )
+                    if self.closed:
+                        return
+                buffer.append(item)
+            return
+        overflow = len(buffer) + len(events) - self.capacity
+        if overflow > 0:
+            self.dropped += overflow
+            if self.policy == self.DROP_NEWEST:
+                events = events[:len(events) - overflow]
+        # У DROP_OLDEST deque с maxlen сам вытесняет старые события.
+        buffer.extend(events)
 
-    def get_average_score(self) -> float:
+    def poll(self, max_events: int | None = None,
+             timeout: float | None = None) -> list[tuple[int, NamedTuple]]:
         """
-        Если есть данные о выполненных задачах, возвращает
-        средний балл выполненных задач.
+        Забирает до max_events пар (смещение, событие). С timeout
+        ждет первое событие не дольше timeout секунд.
         """
-        if self.completed_tasks == 0:
-            return 0
-        return self.all_score / self.completed_tasks
+        with self.bus.changed:
+            if timeout is not None and not self.buffer:
+                self.bus.changed.wait_for(lambda: self.buffer, timeout)
+            buffer = self.buffer
+            count = len(buffer) if max_events is None else min(
+                max_events, len(buffer)
+            )
+            events = [buffer.popleft() for _ in range(count)]
+            if events:
+                self.bus.changed.notify_all()
+        return events
+
+    def close(self) -> None:
+        """Отписывается от событий."""
+        self.bus.unsubscribe(self)
+
+
+class JsonlEventSink:
+    """
+    Журнал событий в файле JSON Lines: одна строка на событие вида
+    {"offset": N, "type": "ScoreChanged", ...поля события}.
+    Смещения продолжаются после последней строки файла, поэтому
+    потребитель, запомнивший смещение, продолжает чтение с него
+    через read. Недописанная при сбое последняя строка при открытии
+    отрезается.
+    """
+
+    prefix = '{"offset": '
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.next_offset = 0
+        if os.path.exists(path):
+            with open(path, 'r+b') as file:
+                end = 0
+                last = None
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        break
+                    end += len(line)
+                    last = line
+                file.truncate(end)
+            if last is not None:
+                self.next_offset = json.loads(last)["offset"] + 1
+        self.file = open(path, 'a', encoding='utf-8')
 
-    def get_top_students(self) -> str:
-        """Получаем отсортированных студентов курса."""
-        # Сортируем студентов по баллам (по убыванию),
-        # а при равенстве баллов - по ID (по возрастанию)
-        sorted_students = sorted(
-            self.student_scores.items(), key=lambda x: (-x[1], x[0])
+    def write(self, events: list[tuple[int, NamedTuple]]) -> None:
+        self.file.writelines(
+            f'{self.prefix}{offset}, "type": "{type(event).__name__}", '
+            f'{json.dumps(event._asdict())[1:]}\n'
+            for offset, event in events
         )
+        self.file.flush()
 
-        result_str = f"{self.name}\nid  points completed\n"
-        for student_id, points in sorted_students:
-            completion_rate = (points / self.passing_scores) * 100
-            result_str += f"{student_id} {points}    {completion_rate:.1f}%\n"
-        # Удаляем последний перенос строки для красоты вывода
-        return result_str.rstrip()
+    def close(self) -> None:
+        self.file.close()
 
-    def get_completed_student_data(self) -> tuple[str, list[int]]:
+    @classmethod
+    def read(cls, path: str,
+             after: int = -1) -> Iterator[tuple[int, NamedTuple]]:
         """
-        Получаем строку с сообщениями для студентов
-        окончивших курс и список этих студентов.
+        Пары (смещение, событие) из файла со смещением больше after.
+        Строки до него не разбираются целиком.
         """
-        students = self.completed_course.copy()
-        self.completed_course.clear()
-        message = ''
+        start = len(cls.prefix)
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                if not line.endswith('\n'):
+                    # Строка, которую еще дописывают.
+                    break
+                offset = int(line[start:line.index(',', start)])
+                if offset <= after:
+                    continue
+                fields = json.loads(line)
+                del fields["offset"]
+                event_type = EVENT_TYPES[fields.pop("type")]
+                if event_type is PointsAdded:
+                    fields["courses"] = tuple(fields["courses"])
+                    fields["points"] = tuple(fields["points"])
+                yield offset, event_type(**fields)
 
-        for student in students:
-            full_name = f'{student.first_name} {student.last_name}'
 
-            message += (f'To: {student.email}\n'
-                        f'Re: Your Learning Progress\n'
-                        f'Hello, {full_name}! '
-                        f'You have accomplished our {self.name} course!\n')
+class EventBus(metaclass=_ContextBound):
+    """
+    Шина событий когорты: StudentAdded из Student._register,
+    PointsAdded из add_points и пакетных добавлений баллов,
+    ScoreChanged и CourseCompleted из обновлений курсов.
 
-        return message, students
+    Каждое событие получает смещение по порядку и попадает в буферы
+    подписок (EventSubscription) и в sink (например, JsonlEventSink).
+    PointsAdded отправляется после изменений курсов, которые вызвали
+    эти баллы, как и запись в журнал TrackerStorage.
+    Пока шина не задана в EventBus.active, события не создаются.
+    """
 
+    # Шина, в которую сейчас отправляются события, или None.
+    active = _ContextField("events")
 
-class TrackerStatistics:
-    """Класс для расчета метрик курсов."""
+    def __init__(self, sink: JsonlEventSink | None = None) -> None:
+        self.sink = sink
+        self.offset = sink.next_offset if sink is not None else 0
+        self.subscriptions = []
+        # publishing держится всю отправку, чтобы события доходили до
+        # подписчиков по порядку смещений, даже пока block ждет место.
+        self.publishing = threading.Lock()
+        self.changed = threading.Condition()
 
-    @staticmethod
-    def _calculate_by_criteria(criteria_func) -> tuple[list[str], list[str]]:
-        """
-        Метод для расчета статистики по критериям.
-        Возвращает кортеж из двух списков: курсы с максимальным
-        и минимальным значениями по заданному критерию.
-        """
-        criteria_results = {name: criteria_func(course)
-                            for name, course in Course.courses.items()
-                            if criteria_func(course) > 0}
+    def subscribe(self, capacity: int = 1024,
+                  policy: str = EventSubscription.DROP_OLDEST,
+                  types: Iterable[type] | None = None) -> EventSubscription:
+        """Подписка на события типов types (по умолчанию всех)."""
+        subscription = EventSubscription(self, capacity, policy, types)
+        with self.changed:
+            self.subscriptions.append(subscription)
+        return subscription
 
-        if not criteria_results:
-            return ["n/a"], ["n/a"]
+    def unsubscribe(self, subscription: EventSubscription) -> None:
+        with self.changed:
+            if not subscription.closed:
+                subscription.closed = True
+                self.subscriptions.remove(subscription)
+            self.changed.notify_all()
 
-        max_value = max(criteria_results.values())
-        min_value = min(criteria_results.values())
+    def publish_many(self, events: Iterable[NamedTuple]) -> None:
+        """Назначает событиям смещения и раздает их подписчикам."""
+        with self.publishing, self.changed:
+            offset = self.offset
+            numbered = list(enumerate(events, offset))
+            if not numbered:
+                return
+            self.offset = offset + len(numbered)
+            # Подписчик с политикой block ждет без блокировки, за это
+            # время список подписок может измениться.
+            for subscription in list(self.subscriptions):
+                if not subscription.closed:
+                    subscription._push_many(numbered)
+            if self.subscriptions:
+                self.changed.notify_all()
+            if self.sink is not None:
+                self.sink.write(numbered)
 
-        most_criteria = [name for name, value in criteria_results.items()
-                         if value == max_value]
-        least_criteria = [name for name, value in criteria_results.items()
-                          if value == min_value]
+    def close(self) -> None:
+        if self.sink is not None:
+            self.sink.close()
 
-        if most_criteria == least_criteria:
-            return most_criteria, ["n/a"]
 
-        return most_criteria, least_criteria
+class LatencyHistogram:
+    """
+    Гистограмма задержек с корзинами по степеням двойки наносекунд.
+    Хранит число вызовов, суммарное и максимальное время.
+    """
 
-    # Пример использования обновленного
-    # метода для популярности, активности и сложности
-    def get_statistic(self) -> str:
-        """
-        Метод для получения развернутой статистике по курсам.
-        Метод расчитывает лучшие и худшие курсы по категориям.
-        """
-        # Расчет популярности на основании количества студентов.
-        popularity = self._calculate_by_criteria(
-            lambda course: len(course.student_scores)
-        )
+    __slots__ = ("counts", "count", "total_ns", "max_ns")
 
-        # Расчет активности на основании количества выполненных заданий.
-        activity = self._calculate_by_criteria(
-            lambda course: course.completed_tasks
-        )
+    def __init__(self) -> None:
+        self.counts = [0] * 64
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
 
-        # Расчет сложности на основании среднего балла выполненных заданий.
-        difficulty = self._calculate_by_criteria(
-            lambda course: course.get_average_score()
-        )
+    def observe(self, elapsed_ns: int) -> None:
+        self.counts[elapsed_ns.bit_length()] += 1
+        self.count += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
 
-        return (
-            f'Most popular: {", ".join(popularity[0])}\n'
-            f'Least popular: {", ".join(popularity[1])}\n'
-            f'Highest activity: {", ".join(activity[0])}\n'
-            f'Lowest activity: {", ".join(activity[1])}\n'
-            f'Easiest course: {", ".join(difficulty[0])}\n'
-            f'Hardest course: {", ".join(difficulty[1])}'
-        )
+    def percentile(self, q: float) -> int:
+        """Верхняя граница корзины, в которую попадает q-квантиль, в нс."""
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(1 << bucket, self.max_ns)
+        return 0
+
+
+class TrackerMetrics:
+    """
+    Счетчики и гистограммы задержек команд и горячих методов.
+
+    По умолчанию выключены. enable оборачивает методы из targets
+    замером времени, disable возвращает исходные методы, поэтому в
+    выключенном состоянии замеры ничего не стоят. Время команд
+    считает LearningProgressTracker.feed, строки подрежима относятся
+    к его команде. Под нагрузкой из нескольких потоков счетчики
+    приблизительные.
+    """
+
+    enabled = False
+    histograms = {}
+    # Course.update сводится к update_many и отдельно не считается.
+    targets = (
+        (Student, "add_points"),
+        (Student, "add_points_many"),
+        (Student, "add_points_parallel"),
+        (Course, "update_many"),
+        (Course, "get_top_students"),
+        (TrackerStatistics, "course_updated"),
+        (TrackerStatistics, "get_statistic"),
+    )
+    # Исходные методы, замененные на время включения.
+    originals = {}
+
+    @classmethod
+    def enable(cls) -> None:
+        """Включает сбор метрик."""
+        if cls.enabled:
+            return
+        cls.enabled = True
+        for owner, attr in cls.targets:
+            method = owner.__dict__[attr]
+            cls.originals[owner, attr] = method
+            name = f"{owner.__name__}.{attr}"
+            if isinstance(method, staticmethod):
+                wrapped = staticmethod(cls._timed(method.__func__, name))
+            elif isinstance(method, classmethod):
+                wrapped = classmethod(cls._timed(method.__func__, name))
+            else:
+                wrapped = cls._timed(method, name)
+            setattr(owner, attr, wrapped)
+
+    @classmethod
+    def disable(cls) -> None:
+        """Выключает сбор метрик, накопленные значения сохраняются."""
+        for (owner, attr), method in cls.originals.items():
+            setattr(owner, attr, method)
+        cls.originals = {}
+        cls.enabled = False
+
+    @classmethod
+    def reset(cls) -> None:
+        """Сбрасывает накопленные значения."""
+        cls.histograms = {}
+
+    @classmethod
+    def observe(cls, name: str, elapsed_ns: int) -> None:
+        histogram = cls.histograms.get(name)
+        if histogram is None:
+            histogram = cls.histograms[name] = LatencyHistogram()
+        histogram.observe(elapsed_ns)
+
+    @classmethod
+    def _timed(cls, func, name: str):
+        """Обертка, замеряющая каждый вызов func."""
+        timer = time.perf_counter_ns
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                cls.observe(name, timer() - start)
+        return wrapper
+
+    @classmethod
+    def report(cls) -> str:
+        """Таблица метрик для команды metrics, время в микросекундах."""
+        if not cls.enabled and not cls.histograms:
+            return "Metrics are disabled."
+        lines = [f"{'name':<36}{'calls':>10}{'total':>12}"
+                 f"{'p50':>10}{'p99':>10}{'max':>10}"]
+        for name, histogram in sorted(cls.histograms.items()):
+            lines.append(
+                f"{name:<36}{histogram.count:>10}"
+                f"{histogram.total_ns / 1000:>12.0f}"
+                f"{histogram.percentile(0.5) / 1000:>10.1f}"
+                f"{histogram.percentile(0.99) / 1000:>10.1f}"
+                f"{histogram.max_ns / 1000:>10.1f}"
+            )
+        return "\n".join(lines)
 
 
 class LearningProgressTracker:
@@ -264,45 +3581,147 @@ class LearningProgressTracker:
 
     Основные методы:
     - start(): Запускает цикл обработки команд пользователя.
+
+    Команды выполняются в контексте когорты context (по умолчанию
+    в текущем на момент создания трекера).
     """
 
-    def __init__(self):
+    # Сколько студентов find показывает при поиске по имени и префиксу.
+    find_limit = 10
+
+    def __init__(self, notification_sink=None,
+                 context: TrackerContext | None = None):
         self.running = True
+        self.context = context or TrackerContext.current()
+        # Куда писать уведомления команды notify, по умолчанию в консоль.
+        self.notification_sink = (notification_sink
+                                  or StreamNotificationSink())
         self.commands = {
             "exit": self._exit_command,
             "add students": self._student_manager,
-            "list": lambda: print(Student.get_students_id()),
+            "list": lambda: print(self._get_students_id()),
             "add points": self._add_student_points,
             "find": self._get_student_points,
             "statistics": self._statistics,
+            "approximate statistics": self._approximate_statistics,
             "notify": self._generate_notifications,
+            "metrics": lambda: print(TrackerMetrics.report()),
+            "activity": self._activity,
+            "add course": self._course_manager,
+            "remove course": self._remove_course_manager,
         }
 
+        # Текущий подрежим команды (например, add students): генератор,
+        # который получает строки ввода до команды back.
+        self.mode = None
+        # Команда, которой принадлежит подрежим, для метрик.
+        self.mode_command = None
+
     def start(self) -> None:
         """Запускает программу, принимает команды для исполнения."""
         print("Learning Progress Tracker")
 
         while self.running:
-            try:
-                command = input().strip()
-                if command == "back":
-                    print("Enter 'exit' to exit the program.")
-                elif command:
-                    self.commands[command]()
-                else:
-                    raise ValueError("No input.")
-            except KeyError:
-                print("Error: unknown command!")
-            except ValueError as e:
-                print(e)
+            self.feed(input())
+
+    def run_script(self, lines: Iterable[str],
+                   output: TextIO | None = None,
+                   buffer_size: int = 1 << 16) -> int:
+        """
+        Выполняет сценарий команд без интерактивного ввода.
+
+        Строки передаются в feed так же, как из input(), а вывод
+        собирается в буфер и пишется в output (по умолчанию stdout)
+        порциями не меньше buffer_size символов. Вывод совпадает с
+        выводом start() для того же ввода. Сценарий заканчивается
+        командой exit или концом строк.
+        Возвращает количество обработанных строк.
+        """
+        output = output or sys.stdout
+        buffer = io.StringIO()
+        count = 0
+        with redirect_stdout(buffer):
+            print("Learning Progress Tracker")
+            for line in _strip_newlines(lines):
+                self.feed(line)
+                count += 1
+                if not self.running:
+                    break
+                if buffer.tell() >= buffer_size:
+                    output.write(buffer.getvalue())
+                    buffer.seek(0)
+                    buffer.truncate()
+        output.write(buffer.getvalue())
+        output.flush()
+        return count
+
+    def feed(self, line: str) -> None:
+        """
+        Обрабатывает одну строку ввода: команду или строку подрежима.
+        Вывод, как и раньше, печатается в stdout.
+        """
+        token = _current_context.set(self.context)
+        try:
+            self._feed(line)
+        finally:
+            _current_context.reset(token)
+
+    def _feed(self, line: str) -> None:
+        if not TrackerMetrics.enabled:
+            self._dispatch(line)
+            return
+
+        if self.mode is not None:
+            command = self.mode_command
+        else:
+            command = line.strip()
+            if command not in self.commands:
+                command = "unknown"
+        start = time.perf_counter_ns()
+        try:
+            self._dispatch(line)
+        finally:
+            TrackerMetrics.observe(f"command:{command}",
+                                   time.perf_counter_ns() - start)
+
+    def _dispatch(self, line: str) -> None:
+        try:
+            if self.mode is not None:
+                self._feed_mode(line)
+                return
+
+            command = line.strip()
+            if command == "back":
+                print("Enter 'exit' to exit the program.")
+            elif command:
+                mode = self.commands[command]()
+                if isinstance(mode, Generator):
+                    # Подрежим печатает приглашение и ждет первую строку.
+                    self.mode = mode
+                    self.mode_command = command
+                    self._feed_mode(None)
+            else:
+                raise ValueError("No input.")
+        except KeyError:
+            self.mode = None
+            print("Error: unknown command!")
+        except ValueError as e:
+            self.mode = None
+            print(e)
+
+    def _feed_mode(self, line: str | None) -> None:
+        """Передает строку подрежиму, по команде back он завершается."""
+        try:
+            self.mode.send(line)
+        except StopIteration:
+            self.mode = None
 
     def _exit_command(self) -> None:
         """Изменяет флаг для выхода из программы."""
         self.running = False
         print("Bye!")
 
-    @staticmethod
-    def _student_manager() -> None:
+    def _student_manager(self) -> Generator[None, str, None]:
         """
         Принимает данные студента или команду back.
         Разделяет строку с данными студента.
@@ -313,45 +3732,29 @@ class LearningProgressTracker:
         student_count = 0
         while True:
 
-            data = input()
-            space_count = data.count(' ')
+            data = yield
 
             if data == "back":
                 print(f"Total {student_count} students have been added.")
                 break
 
-            if space_count >= 2:
-                # Используем rsplit для разделения с конца строки email.
-                parts = data.rsplit(' ', 1)
-                full_name = parts[0]
-                email = parts[1].strip()
-
-                # Разделяем полное имя на имя и фамилию
-                name_parts = full_name.split(' ', 1)
-                first_name = name_parts[0].strip()
-                last_name = name_parts[1].strip()
-
-                try:
-                    Student(first_name, last_name, email)
-
-                    student_count += 1
-                    print("The student has been added.")
+            try:
+                self._add_student(data)
 
-                except (DataIsNotValid, EmailIsTaken) as e:
-                    print(e)
+                student_count += 1
+                print("The student has been added.")
 
-            else:
-                print("Incorrect credentials")
+            except (DataIsNotValid, EmailIsTaken) as e:
+                print(e)
 
-    @staticmethod
-    def _add_student_points() -> None:
+    def _add_student_points(self) -> Generator[None, str, None]:
         """
         Добавление баллов пользователя.
         Если данные не валидны, выводит в консоль ошибку.
         """
         print("Enter an id and points or 'back' to return:")
         while True:
-            input_string = input()
+            input_string = yield
             if input_string == "back":
                 break
 
@@ -359,78 +3762,843 @@ class LearningProgressTracker:
             student_id, points = parts[0], parts[1]
 
             try:
-                if student_id.isdigit() and Student.students.get(int(student_id)):
-                    student = Student.students.get(int(student_id))
-                    student.add_points(points)
-                else:
+                if not self._add_points(student_id, points):
                     print(f'No student is found for id={student_id}')
             except DataIsNotValid as e:
                 print(e)
 
-    @staticmethod
-    def _get_student_points() -> None:
+    def _get_student_points(self) -> Generator[None, str, None]:
         """Выводит данные баллов определенного пользователя."""
         print("Enter an id or 'back' to return")
         while True:
-            str_input = input()
+            str_input = yield
             if str_input == "back":
                 break
-            if str_input.isdigit() and Student.students.get(int(str_input)):
-                student = Student.students.get(int(str_input))
-                print(student.get_student_score())
+            kind, _, value = str_input.partition(' ')
+            if kind in ("email", "name", "prefix") and value.strip():
+                # Поиск по индексам: "email адрес", "name фамилия",
+                # "name имя фамилия" или "prefix начало".
+                scores = [self._find_student_score(str(student_id))
+                          for student_id
+                          in self._find_student_ids(kind, value.strip())]
+                if scores:
+                    print("\n".join(scores))
+                else:
+                    print(f"No student is found for {kind}={value}")
+                continue
+
+            score = self._find_student_score(str_input)
+            if score is not None:
+                print(score)
             else:
                 print(f"No student is found for id={str_input}")
 
-    @staticmethod
-    def _statistics() -> None:
+    def _statistics(self) -> Generator[None, str, None]:
         """
         Выводит общую статистику по курсам,
         и лучших учениках по определённому курсу.
         """
-        tracker_statistics = TrackerStatistics()
         print("Type the name of a course to see details or 'back' to quit:")
-        print(tracker_statistics.get_statistic())
+        print(self._get_statistic())
 
-        # Создаем копию словаря со значениями в нижнем регистре,
+        # Создаем словарь с названиями курсов в нижнем регистре,
         # чтобы команды от регистра не зависели.
-        courses_lower = {key.lower(): value
-                         for key, value in Course.courses.items()}
+        courses_lower = {name.lower(): name
+                         for name in self._get_course_names()}
         while True:
-            str_input = input()
+            str_input = yield
             if str_input == "back":
                 break
             # Проверка наличие команды в нижнем регистре в словаре.
             if str_input.lower() in courses_lower:
-                course = str_input.lower()
-                print(courses_lower[course].get_top_students())
+                print(self._get_top_students(courses_lower[str_input.lower()]))
             else:
                 print("Unknown course.")
 
-    @staticmethod
-    def _generate_notifications() -> None:
+    def _activity(self) -> Generator[None, str, None] | None:
         """
-        Генерация и вывод в консоль сообщений для студентов
-        закончивших курс на основании количества баллов.
+        Выводит по курсам число принятых баллов и их сумму
+        за последние N дней (см. PointHistory).
         """
+        if self._get_activity(0) is None:
+            print("History is disabled.")
+            return None
+        return self._activity_mode()
 
-        message = ''
-        students = []
+    def _activity_mode(self) -> Generator[None, str, None]:
+        print("Enter a number of days or 'back' to return:")
+        while True:
+            str_input = yield
+            if str_input == "back":
+                break
+            if not str_input.isdecimal() or int(str_input) == 0:
+                print("Incorrect number of days.")
+                continue
+            activity = self._get_activity(int(str_input))
+            if not activity:
+                print("No activity.")
+                continue
+            print("\n".join(f"{name}: {tasks} tasks, {points} points"
+                            for name, (tasks, points) in activity.items()))
+
+    def _approximate_statistics(self) -> Generator[None, str, None] | None:
+        """
+        Выводит приближенную статистику по курсам и приближенное
+        число заданий студентов по id (см. CourseSketches).
+        """
+        statistic = self._get_approximate_statistic()
+        if statistic is None:
+            print("Approximate statistics are disabled.")
+            return None
+        return self._approximate_statistics_mode(statistic)
+
+    def _approximate_statistics_mode(
+            self, statistic: str
+    ) -> Generator[None, str, None]:
+        print("Type a student id to see task counts or 'back' to quit:")
+        print(statistic)
+        while True:
+            str_input = yield
+            if str_input == "back":
+                break
+            tasks = self._get_approximate_tasks(str_input)
+            if tasks is not None:
+                print(tasks)
+            else:
+                print(f"No student is found for id={str_input}")
+
+    def _course_names_lower(self) -> dict[str, str]:
+        """Названия курсов в нижнем регистре: {название: как в каталоге}."""
+        return {name.lower(): name for name in self._get_course_names()}
+
+    def _course_manager(self) -> Generator[None, str, None]:
+        """Добавляет курсы по строкам "название проходной_балл"."""
+        print("Enter a course name and passing score or 'back' to return:")
+        while True:
+            data = yield
+            if data == "back":
+                break
+            try:
+                name, passing_scores = Course.parse_course(data)
+                if name.lower() in self._course_names_lower():
+                    raise DataIsNotValid("This course already exists.")
+                self._add_course(name, passing_scores)
+                print("The course has been added.")
+            except DataIsNotValid as e:
+                print(e)
+
+    def _remove_course_manager(self) -> Generator[None, str, None]:
+        """Удаляет курсы по названию вместе с баллами в них."""
+        print("Enter a course name or 'back' to return:")
+        while True:
+            str_input = yield
+            if str_input == "back":
+                break
+            name = self._course_names_lower().get(str_input.lower())
+            if name is None:
+                print("Unknown course.")
+            else:
+                self._remove_course(name)
+                print("The course has been removed.")
+
+    def _generate_notifications(self) -> None:
+        """
+        Генерация и вывод сообщений для студентов закончивших курс
+        на основании количества баллов. Письма по одному передаются
+        в notification_sink, не собираясь в одну строку.
+        """
+        notified = set()
+
+        for student_id, message in self._iter_notifications():
+            self.notification_sink.write(message)
+            notified.add(student_id)
+        self.notification_sink.close()
+        print(f"Total {len(notified)} students have been notified.")
+
+    # Операции над данными трекера. Здесь данные хранятся в классах
+    # Student и Course, наследники могут хранить их иначе
+    # (например, в SQLite), переопределив эти методы.
+
+    def import_students(self, lines: Iterable[str],
+                        rejects: TextIO | None = None) -> int:
+        """Пакетное добавление студентов, см. Student.import_students."""
+        with self.context.activate():
+            return Student.import_students(lines, rejects)
 
+    def import_points(self, rows: Iterable[str],
+                      rejects: TextIO | None = None) -> int:
+        """Пакетное добавление баллов, см. Student.add_points_many."""
+        with self.context.activate():
+            return Student.add_points_many(rows, rejects)
+
+    def _add_student(self, data: str) -> None:
+        """Создает студента из строки с его данными."""
+        Student(*Student.parse_credentials(data))
+
+    def _add_points(self, student_id: str, points: str) -> bool:
+        """
+        Добавляет баллы студенту и выводит "Points updated.".
+        Возвращает False, если студент не найден.
+        """
+        student = (Student.students.get(int(student_id))
+                   if student_id.isdecimal() else None)
+        if student is None:
+            return False
+        student.add_points(points)
+        return True
+
+    def _get_students_id(self) -> str:
+        """Отдает строку со списком id студентов."""
+        return Student.get_students_id()
+
+    def _find_student_score(self, student_id: str) -> str | None:
+        """Отдает строку с баллами студента или None."""
+        student = (Student.students.get(int(student_id))
+                   if student_id.isdecimal() else None)
+        return student.get_student_score() if student is not None else None
+
+    def _find_student_ids(self, kind: str, value: str) -> list[int]:
+        """
+        Id студентов для find по email, имени или префиксу,
+        не больше find_limit.
+        """
+        with TrackerLocks.registry:
+            if kind == "email":
+                student_id = Student.emails.get(value)
+                return [] if student_id is None else [student_id]
+            if kind == "name":
+                return list(
+                    Student.index.find_name(value)[:self.find_limit]
+                )
+            return Student.index.find_prefix(value, self.find_limit)
+
+    def _get_statistic(self) -> str:
+        """Отдает общую статистику по курсам."""
+        return TrackerStatistics().get_statistic()
+
+    def _get_course_names(self) -> list[str]:
+        """Отдает названия курсов."""
+        return list(Course.courses)
+
+    def _get_approximate_statistic(self) -> str | None:
+        """Отдает приближенную статистику или None, если она выключена."""
+        return TrackerStatistics().get_approximate_statistic()
+
+    def _get_approximate_tasks(self, student_id: str) -> str | None:
+        """Отдает строку с числом заданий студента или None."""
+        student = (Student.students.get(int(student_id))
+                   if student_id.isdecimal() else None)
+        if student is None:
+            return None
+        return TrackerStatistics().get_approximate_tasks(student.id)
+
+    def _get_activity(self, days: int) -> dict[str, tuple[int, int]] | None:
+        """
+        Итоги истории баллов за последние days дней или None,
+        если история выключена.
+        """
+        history = PointHistory.active
+        if history is None:
+            return None
+        end = int(history.clock()) + 1
+        return history.window(end - days * 86400, end)
+
+    def _get_top_students(self, course_name: str) -> str:
+        """Отдает рейтинг студентов курса."""
+        return Course.courses[course_name].get_top_students()
+
+    def _add_course(self, name: str, passing_scores: int) -> None:
+        """Добавляет курс в каталог."""
+        Course(name, passing_scores)
+
+    def _remove_course(self, name: str) -> None:
+        """Удаляет курс из каталога."""
+        Course.remove(name)
+
+    def _iter_notifications(self) -> Iterator[tuple[int, str]]:
+        """Отдает пары (id студента, письмо) для окончивших курсы."""
         for course in Course.courses.values():
-            course_msg, student = course.get_completed_student_data()
-            message += course_msg
-            students.extend(student)
-        student_count = len(set(students))
-        # Обрезаем в конце знак переноса, чтобы
-        # не было переноса строки.
-        print(message.rstrip())
-        print(f"Total {student_count} students have been notified.")
+            for student, message in course.iter_completion_messages():
+                yield student.id, message
+
+
+class SQLiteLearningProgressTracker(LearningProgressTracker):
+    """
+    Трекер, который хранит студентов, курсы и баллы в файле SQLite
+    вместо классов Student и Course.
+
+    Команды и вывод в консоль те же. Добавление студентов и баллов
+    выполняется пачками через executemany в одной транзакции,
+    рейтинг курса и статистика считаются запросами к базе по индексам.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER PRIMARY KEY,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS courses (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            passing_scores INTEGER NOT NULL
+        );
+        -- Баллы студента в курсе: сумма, количество выполненных
+        -- заданий, номер события окончания курса и признак уведомления.
+        CREATE TABLE IF NOT EXISTS points (
+            course_id INTEGER NOT NULL REFERENCES courses (id),
+            student_id INTEGER NOT NULL REFERENCES students (id),
+            points INTEGER NOT NULL,
+            tasks INTEGER NOT NULL,
+            completed_seq INTEGER,
+            notified INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (course_id, student_id)
+        ) WITHOUT ROWID;
+        -- Поиск find по фамилии, имени и префиксу фамилии.
+        CREATE INDEX IF NOT EXISTS students_name
+            ON students (last_name COLLATE NOCASE,
+                         first_name COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS points_ranking
+            ON points (course_id, points DESC, student_id);
+        CREATE INDEX IF NOT EXISTS points_pending
+            ON points (course_id, completed_seq)
+            WHERE completed_seq IS NOT NULL AND notified = 0;
+    """
+
+    upsert_points = """
+        INSERT INTO points (course_id, student_id, points, tasks,
+                            completed_seq)
+        VALUES (:course, :student, :points, 1,
+                CASE WHEN :points >= :passing THEN :seq END)
+        ON CONFLICT (course_id, student_id) DO UPDATE SET
+            points = points + excluded.points,
+            tasks = tasks + 1,
+            completed_seq = CASE
+                WHEN completed_seq IS NULL
+                     AND points + excluded.points >= :passing THEN :seq
+                ELSE completed_seq
+            END
+    """
+
+    def __init__(self, path: str, courses: dict[str, int],
+                 notification_sink=None, chunk_size: int = 10_000) -> None:
+        super().__init__(notification_sink)
+        self.chunk_size = chunk_size
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(self.schema)
+        # Курсы по умолчанию добавляются только в новую базу, дальше
+        # каталогом управляют команды add course и remove course.
+        if self.connection.execute(
+                "SELECT 1 FROM courses LIMIT 1").fetchone() is None:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT INTO courses (name, passing_scores) "
+                    "VALUES (?, ?)", courses.items()
+                )
+        self._load_courses()
+        (self.next_id,) = self.connection.execute(
+            "SELECT COALESCE(MAX(id) + 1, 1000) FROM students"
+        ).fetchone()
+        (self.sequence,) = self.connection.execute(
+            "SELECT COALESCE(MAX(completed_seq), 0) FROM points"
+        ).fetchone()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def _load_courses(self) -> None:
+        # Курсы меняются редко, держим их список в памяти:
+        # (id, название, проходной балл) в порядке создания.
+        self.courses = self.connection.execute(
+            "SELECT id, name, passing_scores FROM courses ORDER BY id"
+        ).fetchall()
 
+    def _student_exists(self, student_id: str) -> bool:
+        return student_id.isdecimal() and self.connection.execute(
+            "SELECT 1 FROM students WHERE id = ?", (int(student_id),)
+        ).fetchone() is not None
 
-def main():
+    def _taken_emails(self, emails: list[str]) -> set[str]:
+        """Какие из email уже есть в базе."""
+        taken = set()
+        for chunk in _chunked(emails, 500):
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT email FROM students WHERE email IN ({placeholders})",
+                chunk,
+            )
+            taken.update(email for (email,) in rows)
+        return taken
+
+    def _existing_ids(self, ids: list[int]) -> set[int]:
+        """Какие из id студентов есть в базе."""
+        existing = set()
+        for chunk in _chunked(ids, 500):
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT id FROM students WHERE id IN ({placeholders})",
+                chunk,
+            )
+            existing.update(student_id for (student_id,) in rows)
+        return existing
+
+    def _insert_students(
+            self, rows: list[str]
+    ) -> tuple[int, list[tuple[str, DataIsNotValid | EmailIsTaken]]]:
+        """
+        Проверяет и добавляет порцию студентов одной транзакцией.
+        Возвращает число добавленных и пары (строка, ошибка)
+        для отклоненных строк в порядке входных данных.
+        """
+        errors = {}
+        parsed = []
+        for i, data in enumerate(rows):
+            try:
+                credentials = Student.parse_credentials(data)
+                StudentValidator.check_credentials(*credentials)
+                parsed.append((i, credentials))
+            except DataIsNotValid as e:
+                errors[i] = e
+
+        taken = self._taken_emails([email for _, (_, _, email) in parsed])
+        students = []
+        for i, (first_name, last_name, email) in parsed:
+            if email in taken:
+                errors[i] = EmailIsTaken("This email is already taken.")
+                continue
+            taken.add(email)
+            students.append((self.next_id + len(students), first_name,
+                             last_name, email))
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO students (id, first_name, last_name, email) "
+                "VALUES (?, ?, ?, ?)", students
+            )
+        self.next_id += len(students)
+        return len(students), [(rows[i], errors[i]) for i in sorted(errors)]
+
+    def _apply_points(self, rows: list[tuple[int, list[int]]]) -> None:
+        """Добавляет баллы порции студентов одной транзакцией."""
+        params = []
+        for student_id, points in rows:
+            for (course_id, _, passing_scores), value in zip(self.courses,
+                                                             points):
+                if value == 0:
+                    continue
+                self.sequence += 1
+                params.append({
+                    "course": course_id, "student": student_id,
+                    "points": value, "passing": passing_scores,
+                    "seq": self.sequence,
+                })
+        with self.connection:
+            self.connection.executemany(self.upsert_points, params)
+
+    def import_students(self, lines: Iterable[str],
+                        rejects: TextIO | None = None) -> int:
+        added = 0
+        for chunk in _chunked(_strip_newlines(lines), self.chunk_size):
+            count, rejected = self._insert_students(chunk)
+            added += count
+            if rejects is not None and rejected:
+                rejects.writelines(f'{data}\t{e}\n' for data, e in rejected)
+        return added
+
+    def import_points(self, rows: Iterable[str],
+                      rejects: TextIO | None = None) -> int:
+        updated = 0
+        for chunk in _chunked(_strip_newlines(rows), self.chunk_size):
+            parsed = []
+            for row in chunk:
+                student_id, _, points = row.partition(' ')
+                parsed.append((row, student_id, points.split()))
+            existing = self._existing_ids([int(student_id)
+                                           for _, student_id, _ in parsed
+                                           if student_id.isdecimal()])
+
+            accepted = []
+            rejected = []
+            for row, student_id, points in parsed:
+                if not (student_id.isdecimal()
+                        and int(student_id) in existing):
+                    rejected.append(
+                        f'{row}\tNo student is found for id={student_id}\n'
+                    )
+                elif (values := StudentValidator.parse_points(
+                        points, len(self.courses))) is None:
+                    rejected.append(f'{row}\tIncorrect points format.\n')
+                else:
+                    accepted.append((int(student_id), values))
+            self._apply_points(accepted)
+            updated += len(accepted)
+            if rejects is not None and rejected:
+                rejects.writelines(rejected)
+        return updated
+
+    def _add_student(self, data: str) -> None:
+        _, rejected = self._insert_students([data])
+        if rejected:
+            raise rejected[0][1]
+
+    def _add_points(self, student_id: str, points: str) -> bool:
+        if not self._student_exists(student_id):
+            return False
+        values = StudentValidator.parse_points(points.split(),
+                                               len(self.courses))
+        if values is None:
+            raise DataIsNotValid("Incorrect points format.")
+        self._apply_points([(int(student_id), values)])
+        print("Points updated.")
+        return True
+
+    def _get_students_id(self) -> str:
+        ids = [str(student_id) for (student_id,) in self.connection.execute(
+            "SELECT id FROM students ORDER BY id"
+        )]
+        if not ids:
+            return "No students found"
+        return "Students:\n" + "\n".join(ids)
+
+    def _find_student_score(self, student_id: str) -> str | None:
+        if not self._student_exists(student_id):
+            return None
+        scores = self.connection.execute(
+            "SELECT c.name, COALESCE(p.points, 0) FROM courses c "
+            "LEFT JOIN points p ON p.course_id = c.id AND p.student_id = ? "
+            "ORDER BY c.id", (int(student_id),)
+        )
+        return f'{int(student_id)} points: ' + '; '.join(
+            f'{course}={points}' for course, points in scores
+        )
+
+    def _find_student_ids(self, kind: str, value: str) -> list[int]:
+        if kind == "email":
+            return [student_id for (student_id,) in self.connection.execute(
+                "SELECT id FROM students WHERE email = ?", (value,)
+            )]
+        if kind == "name":
+            # Как StudentIndex.find_name: сначала вся строка как
+            # фамилия, затем первое слово как имя.
+            value = value.strip()
+            found = [student_id for (student_id,) in self.connection.execute(
+                "SELECT id FROM students WHERE last_name = ? COLLATE NOCASE "
+                "ORDER BY id LIMIT ?", (value, self.find_limit)
+            )]
+            first_name, _, last_name = value.partition(' ')
+            if found or not last_name:
+                return found
+            return [student_id for (student_id,) in self.connection.execute(
+                "SELECT id FROM students "
+                "WHERE last_name = ? COLLATE NOCASE "
+                "AND first_name = ? COLLATE NOCASE "
+                "ORDER BY id LIMIT ?",
+                (last_name.strip(), first_name, self.find_limit)
+            )]
+
+        # Префикс как диапазон [prefix, prefix + max символ), чтобы
+        # запрос шел по индексу.
+        upper = value + "\U0010ffff"
+        by_email = self.connection.execute(
+            "SELECT id FROM students WHERE email >= ? AND email < ? "
+            "ORDER BY email LIMIT ?", (value, upper, self.find_limit)
+        )
+        by_last_name = self.connection.execute(
+            "SELECT id FROM students "
+            "WHERE last_name >= ? COLLATE NOCASE "
+            "AND last_name < ? COLLATE NOCASE "
+            "ORDER BY last_name COLLATE NOCASE, id LIMIT ?",
+            (value, upper, self.find_limit)
+        )
+        found = dict.fromkeys(student_id for (student_id,)
+                              in chain(by_email, by_last_name))
+        return list(found)[:self.find_limit]
+
+    def _get_statistic(self) -> str:
+        popularity = {}
+        activity = {}
+        difficulty = {}
+        for name, students, tasks, total in self.connection.execute(
+            "SELECT c.name, COUNT(p.student_id), COALESCE(SUM(p.tasks), 0), "
+            "COALESCE(SUM(p.points), 0) FROM courses c "
+            "LEFT JOIN points p ON p.course_id = c.id "
+            "GROUP BY c.id ORDER BY c.id"
+        ):
+            popularity[name] = students
+            activity[name] = tasks
+            difficulty[name] = total / tasks if tasks else 0
+        return TrackerStatistics.format_statistic(
+            TrackerStatistics.most_and_least(popularity),
+            TrackerStatistics.most_and_least(activity),
+            TrackerStatistics.most_and_least(difficulty),
+        )
+
+    def _get_course_names(self) -> list[str]:
+        return [name for _, name, _ in self.courses]
+
+    def _get_activity(self, days: int) -> None:
+        # Баллы пишутся в SQLite мимо Student, история не ведется.
+        return None
+
+    def _get_approximate_statistic(self) -> None:
+        # Курсы в SQLite не ведут скетчи.
+        return None
+
+    def _get_top_students(self, course_name: str) -> str:
+        course_id, name, passing_scores = next(
+            course for course in self.courses if course[1] == course_name
+        )
+        rows = self.connection.execute(
+            "SELECT student_id, points FROM points WHERE course_id = ? "
+            "ORDER BY points DESC, student_id", (course_id,)
+        )
+        return Course.format_top_students(name, passing_scores, rows)
+
+    def _add_course(self, name: str, passing_scores: int) -> None:
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO courses (name, passing_scores) VALUES (?, ?)",
+                (name, passing_scores)
+            )
+        self._load_courses()
+
+    def _remove_course(self, name: str) -> None:
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM points WHERE course_id = "
+                "(SELECT id FROM courses WHERE name = ?)", (name,)
+            )
+            self.connection.execute("DELETE FROM courses WHERE name = ?",
+                                    (name,))
+        self._load_courses()
+
+    def _iter_notifications(self) -> Iterator[tuple[int, str]]:
+        last_seq = self.sequence
+        pending = self.connection.execute(
+            "SELECT s.id, s.first_name, s.last_name, s.email, c.name "
+            "FROM points p JOIN courses c ON c.id = p.course_id "
+            "JOIN students s ON s.id = p.student_id "
+            "WHERE p.completed_seq IS NOT NULL AND p.notified = 0 "
+            "ORDER BY p.course_id, p.completed_seq"
+        )
+        for student_id, first_name, last_name, email, course_name in pending:
+            yield student_id, Course.format_completion_message(
+                first_name, last_name, email, course_name
+            )
+        with self.connection:
+            self.connection.execute(
+                "UPDATE points SET notified = 1 WHERE completed_seq <= ? "
+                "AND notified = 0", (last_seq,)
+            )
+
+
+class TrackerServer:
+    """
+    Сетевой доступ к трекеру по TCP или Unix-сокету.
+
+    Каждое подключение получает свой LearningProgressTracker
+    (со своим подрежимом команд), данные студентов и курсов общие.
+    Протокол строковый: клиент шлет строки так же, как в консоли,
+    и получает тот же вывод. Команды выполняются целиком внутри
+    цикла событий без await, поэтому изменения данных от разных
+    подключений не перемешиваются.
+    """
+
+    def __init__(self, tracker_factory=LearningProgressTracker) -> None:
+        self.tracker_factory = tracker_factory
+        self.server = None
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """Обслуживает одно подключение до команды exit."""
+        tracker = self.tracker_factory()
+        writer.write(b"Learning Progress Tracker\n")
+        try:
+            while tracker.running:
+                line = await reader.readline()
+                if not line:
+                    break
+                output = io.StringIO()
+                with redirect_stdout(output):
+                    tracker.feed(line.decode('utf-8').rstrip('\r\n'))
+                writer.write(output.getvalue().encode('utf-8'))
+                await writer.drain()
+        except (ConnectionError, UnicodeDecodeError):
+            pass
+        except Exception as e:
+            # Ошибка, которая в консоли завершила бы программу,
+            # закрывает только это подключение.
+            writer.write(f"Error: {e!r}\n".encode('utf-8'))
+        finally:
+            writer.close()
+
+    async def start_tcp(self, host: str, port: int) -> asyncio.Server:
+        self.server = await asyncio.start_server(self.handle, host, port,
+                                                 backlog=4096)
+        return self.server
+
+    async def start_unix(self, path: str) -> asyncio.Server:
+        self.server = await asyncio.start_unix_server(self.handle, path,
+                                                      backlog=4096)
+        return self.server
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+
+
+async def _serve(address: str, tracker_factory) -> None:
+    """Запускает сервер трекера до остановки процесса."""
+    server = TrackerServer(tracker_factory)
+    if address.startswith("unix:"):
+        await server.start_unix(address.removeprefix("unix:"))
+    else:
+        host, _, port = address.rpartition(':')
+        await server.start_tcp(host or "127.0.0.1", int(port))
+    async with server.server:
+        await server.server.serve_forever()
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """Разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(description="Learning Progress Tracker")
+    parser.add_argument(
+        "--import-students", metavar="PATH",
+        help="пакетно добавить студентов из файла ('-' для stdin)",
+    )
+    parser.add_argument(
+        "--import-points", metavar="PATH",
+        help="пакетно добавить баллы из файла ('-' для stdin)",
+    )
+    parser.add_argument(
+        "--columnar", action="store_true",
+        help="хранить студентов в компактном столбцовом хранилище",
+    )
+    parser.add_argument(
+        "--email-index", metavar="DIR",
+        help="проверять повторы email по индексу на диске в каталоге DIR",
+    )
+    parser.add_argument(
+        "--notify-dir", metavar="PATH",
+        help="складывать уведомления в каталог в стиле Maildir",
+    )
+    backend = parser.add_mutually_exclusive_group()
+    backend.add_argument(
+        "--data-dir", metavar="PATH",
+        help="хранить состояние трекера в каталоге (снимок и журнал)",
+    )
+    backend.add_argument(
+        "--sqlite", metavar="PATH",
+        help="хранить студентов, курсы и баллы в файле SQLite",
+    )
+    backend.add_argument(
+        "--image", metavar="PATH",
+        help="открыть состояние трекера из двоичного образа",
+    )
+    parser.add_argument(
+        "--export-image", metavar="PATH",
+        help="сохранить состояние трекера в двоичный образ при выходе",
+    )
+    parser.add_argument(
+        "--serve", metavar="ADDRESS",
+        help="принимать команды по сети: HOST:PORT или unix:PATH",
+    )
+    parser.add_argument(
+        "--workers", metavar="N", type=int, default=1,
+        help="число процессов для --import-points",
+    )
+    parser.add_argument(
+        "--script", metavar="PATH",
+        help="выполнить сценарий команд из файла ('-' для stdin)",
+    )
+    parser.add_argument(
+        "--history", action="store_true",
+        help="вести историю принятых баллов (команда activity)",
+    )
+    parser.add_argument(
+        "--sketches", action="store_true",
+        help="вести приближенную статистику курсов "
+             "(команда approximate statistics)",
+    )
+    parser.add_argument(
+        "--events", metavar="PATH",
+        help="писать события студентов и курсов в файл JSON Lines",
+    )
+    parser.add_argument(
+        "--metrics", action="store_true",
+        help="собирать метрики команд и методов (команда metrics)",
+    )
+    parser.add_argument(
+        "--profile", metavar="PATH",
+        help="профилировать сессию cProfile и сохранить статистику",
+    )
+    parser.add_argument(
+        "--rejects", metavar="PATH",
+        help="файл для отклоненных строк пакетного импорта",
+    )
+    args = parser.parse_args(argv)
+    if args.serve and args.sqlite:
+        parser.error("--serve works only with the in-memory storage")
+    if args.workers > 1 and args.sqlite:
+        parser.error("--workers works only with the in-memory storage")
+    if args.export_image and args.sqlite:
+        parser.error("--export-image works only with the in-memory storage")
+    if args.history and args.sqlite:
+        parser.error("--history works only with the in-memory storage")
+    if args.sketches and args.sqlite:
+        parser.error("--sketches works only with the in-memory storage")
+    if args.events and args.sqlite:
+        parser.error("--events works only with the in-memory storage")
+    if args.email_index and args.sqlite:
+        parser.error("--email-index works only with the in-memory storage")
+    return args
+
+
+def _open_input(path: str) -> TextIO:
+    """Открывает файл для чтения, '-' означает stdin."""
+    if path == '-':
+        return sys.stdin
+    return open(path, encoding='utf-8')
+
+
+def _run_import(import_func, path: str, rejects: TextIO | None) -> int:
+    """Запускает пакетный импорт из файла, возвращает число строк."""
+    source = _open_input(path)
+    try:
+        return import_func(source, rejects)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+def _run_imports(tracker: LearningProgressTracker,
+                 args: argparse.Namespace) -> None:
+    """Выполняет пакетные импорты, заданные в командной строке."""
+    rejects = (open(args.rejects, 'w', encoding='utf-8')
+               if args.rejects else None)
+    try:
+        if args.import_students:
+            added = _run_import(tracker.import_students,
+                                args.import_students, rejects)
+            print(f"Total {added} students have been added.")
+        if args.import_points:
+            import_points = tracker.import_points
+            if args.workers > 1:
+                import_points = partial(Student.add_points_parallel,
+                                        workers=args.workers)
+            updated = _run_import(import_points, args.import_points, rejects)
+            print(f"Total {updated} points rows have been updated.")
+    finally:
+        if rejects is not None:
+            rejects.close()
+
+
+def main(argv: list[str] | None = None):
     """
     Запуск логики программы.
     """
+    args = parse_args(argv)
     courses_points = {
         "Python": 600,
         "DSA": 400,
@@ -441,8 +4609,70 @@ def main():
     for name, score in courses_points.items():
         Course(name, score)
 
-    tracker = LearningProgressTracker()
-    tracker.start()
+    if args.image:
+        TrackerImage.load(args.image)
+    elif args.columnar:
+        Student.use_columnar_store()
+    if args.email_index:
+        Student.use_disk_email_index(args.email_index)
+
+    sink = None
+    if args.notify_dir:
+        sink = MaildirNotificationSink(args.notify_dir)
+
+    if args.metrics:
+        TrackerMetrics.enable()
+    profiler = cProfile.Profile() if args.profile else None
+
+    storage = None
+    if args.sqlite:
+        tracker = SQLiteLearningProgressTracker(args.sqlite, courses_points,
+                                                sink)
+    else:
+        tracker = LearningProgressTracker(sink)
+        if args.data_dir:
+            storage = TrackerStorage(args.data_dir)
+            storage.open()
+    # История включается после восстановления из журнала: время
+    # восстановленных баллов не известно.
+    if args.history:
+        PointHistory.active = PointHistory()
+    if args.sketches:
+        TrackerContext.current().enable_sketches()
+    if args.events:
+        EventBus.active = EventBus(JsonlEventSink(args.events))
+    try:
+        if profiler is not None:
+            profiler.enable()
+        _run_imports(tracker, args)
+        if args.serve:
+            asyncio.run(_serve(args.serve,
+                               lambda: LearningProgressTracker(sink)))
+        elif args.script:
+            script = _open_input(args.script)
+            try:
+                tracker.run_script(script)
+            finally:
+                if script is not sys.stdin:
+                    script.close()
+        # stdin уже прочитан импортом, интерактивный режим не нужен.
+        elif '-' not in (args.import_students, args.import_points):
+            tracker.start()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if storage is not None:
+            storage.checkpoint()
+            storage.close()
+        if args.export_image:
+            TrackerImage.export(args.export_image)
+        PointHistory.active = None
+        if EventBus.active is not None:
+            EventBus.active.close()
+            EventBus.active = None
+        if args.sqlite:
+            tracker.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,2028 @@
+import asyncio
+import io
+import math
+import os
+import random
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from contextlib import redirect_stdout
+from copy import deepcopy
+from functools import partial
+from unittest.mock import patch
+
+from PythonCoreTrack.Medium.LearningProgressTracker.task_v2 import (
+    Course, CourseCompleted, DiskEmailIndex, EmailIsTaken, EventBus,
+    EventSubscription,
+    JsonlEventSink, LearningProgressTracker, LRUCache,
+    MaildirNotificationSink, PointHistory, PointsAdded, ScoreChanged,
+    SQLiteLearningProgressTracker, StreamNotificationSink, Student,
+    StudentAdded,
+    StudentIndex, StudentValidator, TrackerContext, TrackerLocks,
+    TrackerMetrics, TrackerImage, TrackerServer, TrackerStatistics,
+    TrackerStorage
+)
+
+COURSES_POINTS = {
+    "Python": 600,
+    "DSA": 400,
+    "Databases": 480,
+    "Flask": 550,
+}
+
+
+def reset_state() -> None:
+    """Сбрасывает состояние классов между тестами."""
+    Student.id_counter = 1000
+    Student.students = {}
+    Student.emails = {}
+    Student.index = StudentIndex()
+    Course.courses = {}
+    TrackerStatistics.reset()
+    for name, score in COURSES_POINTS.items():
+        Course(name, score)
+
+
+def run_session(lines: list[str],
+                tracker: LearningProgressTracker | None = None) -> str:
+    """Прогоняет интерактивную сессию и возвращает вывод."""
+    output = io.StringIO()
+    with patch("builtins.input", side_effect=lines), redirect_stdout(output):
+        (tracker or LearningProgressTracker()).start()
+    return output.getvalue()
+
+
+class TestImportStudents(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+
+    def test_import_same_rules_as_interactive(self):
+        """Пакетный импорт принимает и отклоняет те же строки."""
+        lines = [
+            "John Smith jsmith@hotmail.com",
+            "Jean-Clause van Helsing jch@example.com",
+            "John Smith jsmith@hotmail.com",
+            "Robert Jemison Van de Graaff robertvdgraaff@mit.edu",
+            "help",
+            "J. Smith jsmith@ex.com",
+            "John Sm1th js@example.com",
+            "John Smith jsmithexample.com",
+        ]
+        rejects = io.StringIO()
+        added = Student.import_students(
+            (line + "\n" for line in lines), rejects, chunk_size=3
+        )
+        imported_ids = list(Student.students)
+
+        reset_state()
+        output = run_session(["add students", *lines, "back", "exit"])
+
+        self.assertEqual(added, 3)
+        self.assertEqual(imported_ids, list(Student.students))
+        self.assertIn("Total 3 students have been added.", output)
+        self.assertEqual(rejects.getvalue().splitlines(), [
+            "John Smith jsmith@hotmail.com\tThis email is already taken.",
+            "help\tIncorrect credentials",
+            "J. Smith jsmith@ex.com\tIncorrect first name",
+            "John Sm1th js@example.com\tIncorrect last name",
+            "John Smith jsmithexample.com\tIncorrect email",
+        ])
+
+
+class TestAddPointsMany(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+        for i in range(3):
+            Student("John", "Smith", f"js{i}@example.com")
+
+    @staticmethod
+    def course_state() -> list:
+        return [(course.student_scores, course.completed_tasks,
+                 course.all_score, [s.id for s in course.completed_course])
+                for course in Course.courses.values()]
+
+    def test_same_result_as_row_by_row(self):
+        """Пакетное добавление дает то же состояние, что и построчное."""
+        rows = [
+            "1000 600 0 100 0",
+            "1001 10 20 30 40",
+            "9999 1 1 1 1",
+            "1000 5 400 0 550",
+            "1001 1 2 3",
+            "1002 1 -2 3 4",
+            "abc 1 2 3 4",
+            "1001 0 0 0 0",
+        ]
+        rejects = io.StringIO()
+        updated = Student.add_points_many(rows, rejects, chunk_size=3)
+        batch_points = [dict(s.points) for s in Student.students.values()]
+        batch_state = self.course_state()
+
+        self.setUp()
+        with redirect_stdout(io.StringIO()):
+            for row in rows:
+                student_id, points = row.split(' ', 1)
+                student = (Student.students.get(int(student_id))
+                           if student_id.isdigit() else None)
+                if student is not None and student._is_valid_points(
+                        points.split()):
+                    student.add_points(points)
+
+        self.assertEqual(updated, 4)
+        self.assertEqual(batch_points,
+                         [dict(s.points) for s in Student.students.values()])
+        self.assertEqual(batch_state, self.course_state())
+        self.assertEqual(rejects.getvalue().splitlines(), [
+            "9999 1 1 1 1\tNo student is found for id=9999",
+            "1001 1 2 3\tIncorrect points format.",
+            "1002 1 -2 3 4\tIncorrect points format.",
+            "abc 1 2 3 4\tNo student is found for id=abc",
+        ])
+
+    def test_sequence_rows(self):
+        """Строки можно передавать последовательностями чисел."""
+        updated = Student.add_points_many([(1000, 1, 2, 3, 4),
+                                           (1000, 1, 0, 0, 0)])
+        self.assertEqual(updated, 2)
+        self.assertEqual(Student.students[1000].points,
+                         {"Python": 2, "DSA": 2, "Databases": 3, "Flask": 4})
+        self.assertEqual(Course.courses["Python"].completed_tasks, 2)
+
+    def test_parallel_same_as_sequential(self):
+        """Многопроцессное добавление дает то же состояние и отказы."""
+        rng = random.Random(13)
+        Student.import_students(f"John Smith user{i}@example.com"
+                                for i in range(40))
+        rows = []
+        for _ in range(2000):
+            student_id = rng.randrange(995, 1050)
+            points = [rng.choice((0, 0, 7, 30, 90)) for _ in Course.courses]
+            if rng.random() < 0.05:
+                points.pop()
+            rows.append(f"{student_id} {' '.join(map(str, points))}")
+        rows += ["abc 1 2 3 4", (1000, 5, 5, 5, 5), "1001 1 -2 3 4"]
+
+        runs = []
+        for add_points in (Student.add_points_many,
+                           partial(Student.add_points_parallel, workers=3)):
+            self.setUp()
+            Student.import_students(f"John Smith user{i}@example.com"
+                                    for i in range(40))
+            rejects = io.StringIO()
+            updated = add_points(rows, rejects, chunk_size=300)
+            runs.append((updated, rejects.getvalue(), tracker_state()))
+        self.assertEqual(runs[0], runs[1])
+        self.assertTrue(Course.courses["Python"].completed_course)
+
+    def test_non_decimal_digit_id_is_rejected(self):
+        """Id из цифр вне 0-9 ('²') уходит в отказы, а не роняет пакет."""
+        rows = ["\u00b2 1 1 1 1", "1000 1 2 3 4"]
+        expected = ["\u00b2 1 1 1 1\tNo student is found for id=\u00b2"]
+        for add_points in (Student.add_points_many,
+                           partial(Student.add_points_parallel, workers=2)):
+            self.setUp()
+            rejects = io.StringIO()
+            self.assertEqual(add_points(rows, rejects), 1)
+            self.assertEqual(rejects.getvalue().splitlines(), expected)
+        with tempfile.TemporaryDirectory() as directory:
+            tracker = SQLiteLearningProgressTracker(
+                os.path.join(directory, "tracker.sqlite"), COURSES_POINTS
+            )
+            try:
+                tracker.import_students(["John Smith js@example.com"])
+                rejects = io.StringIO()
+                self.assertEqual(tracker.import_points(rows, rejects), 1)
+                self.assertEqual(rejects.getvalue().splitlines(), expected)
+                self.assertFalse(tracker._add_points("\u00b2", "1 1 1 1"))
+            finally:
+                tracker.close()
+        output = run_session(["add points", "\u00b2 1 1 1 1", "back",
+                              "find", "\u00b2", "back", "exit"])
+        self.assertEqual(output.count("No student is found for id=\u00b2"),
+                         2)
+
+
+class TestColumnarStudentStore(unittest.TestCase):
+
+    session = [
+        "add students",
+        "John Smith jsmith@example.com",
+        "Jean-Clause van Helsing jch@example.com",
+        "Mary Jane mj@example.com",
+        "back",
+        "list",
+        "add points",
+        "1000 600 400 0 0",
+        "1001 1 2 3 4",
+        "1000 1 1 1 1",
+        "back",
+        "find",
+        "1000",
+        "1001",
+        "1002",
+        "1003",
+        "back",
+        "statistics",
+        "python",
+        "dsa",
+        "back",
+        "notify",
+        "exit",
+    ]
+
+    def setUp(self):
+        reset_state()
+
+    def test_session_output_matches_dict_store(self):
+        """Вывод сессии не зависит от способа хранения студентов."""
+        expected = run_session(self.session)
+        reset_state()
+        Student.use_columnar_store()
+        self.assertEqual(run_session(self.session), expected)
+
+    def test_existing_students_are_migrated(self):
+        """Переключение хранилища сохраняет добавленных студентов."""
+        Student("John", "Smith", "js@example.com").add_points("1 2 3 4")
+        with redirect_stdout(io.StringIO()):
+            Student.use_columnar_store()
+        student = Student.students[1000]
+        self.assertEqual((student.id, student.first_name, student.email),
+                         (1000, "John", "js@example.com"))
+        self.assertEqual(student.get_student_score(),
+                         "1000 points: Python=1; DSA=2; Databases=3; Flask=4")
+        self.assertNotIn(1001, Student.students)
+
+
+class TestDiskEmailIndex(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+
+    def use_index(self, capacity: int = 1 << 16) -> DiskEmailIndex:
+        Student.use_disk_email_index(self.directory, capacity)
+        self.addCleanup(Student.emails.close)
+        return Student.emails
+
+    def test_duplicates_match_dict(self):
+        """Отклоненные строки и ответы те же, что со словарем."""
+        rng = random.Random(11)
+        lines = [f"John Smith js{rng.randrange(3000)}@example.com"
+                 for _ in range(5000)] + ["John Smith bad-email"]
+        expected_rejects = io.StringIO()
+        Student.import_students(lines, rejects=expected_rejects)
+        expected = dict(Student.emails)
+
+        reset_state()
+        index = self.use_index(capacity=10)
+        rejects = io.StringIO()
+        Student.import_students(lines, rejects=rejects)
+        self.assertEqual(rejects.getvalue(), expected_rejects.getvalue())
+        self.assertEqual(dict(index), expected)
+        # Таблица на 10 email выросла.
+        self.assertGreater(index.mask, 127)
+        with self.assertRaisesRegex(EmailIsTaken,
+                                    "This email is already taken."):
+            Student("Jane", "Doe", next(iter(expected)))
+        self.assertNotIn("nobody@example.com", index)
+        self.assertIsNone(index.get("nobody@example.com"))
+        self.assertEqual(
+            run_session(["add students", "Jane Doe jd@example.com",
+                         "John Doe jd@example.com", "back", "exit"])
+            .splitlines()[2:4],
+            ["The student has been added.", "This email is already taken."]
+        )
+
+    def test_hash_collisions_are_exact(self):
+        """Email с одинаковым хешем различаются по записи студента."""
+        with patch.object(DiskEmailIndex, "_hash",
+                          staticmethod(lambda email: 42)):
+            index = self.use_index()
+            Student.import_students(f"John Smith js{i}@example.com"
+                                    for i in range(50))
+            self.assertEqual(index["js7@example.com"], 1007)
+            self.assertNotIn("js50@example.com", index)
+            with self.assertRaises(EmailIsTaken):
+                Student("John", "Smith", "js49@example.com")
+            self.assertEqual(len(index), 50)
+
+    def test_existing_students_are_migrated(self):
+        """Переключение индекса переносит email добавленных студентов."""
+        Student.import_students(["John Smith js@example.com",
+                                 "Jane Doe jd@example.com"])
+        index = self.use_index()
+        self.assertEqual(dict(index), {"js@example.com": 1000,
+                                       "jd@example.com": 1001})
+        self.assertEqual(index.get("nobody@example.com", 0), 0)
+        with self.assertRaises(EmailIsTaken):
+            Student("John", "Doe", "jd@example.com")
+
+
+class TestCourseRanking(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+        self.course = Course.courses["DSA"]
+        for i in range(5):
+            Student("John", "Smith", f"js{i}@example.com")
+        Student.add_points_many([
+            "1000 0 100 0 0",
+            "1001 0 300 0 0",
+            "1002 0 100 0 0",
+            "1003 0 50 0 0",
+            "1000 0 200 0 0",
+        ])
+
+    def test_full_listing_format(self):
+        """Полный рейтинг выводится в прежнем формате."""
+        self.assertEqual(self.course.get_top_students(), (
+            "DSA\n"
+            "id  points completed\n"
+            "1000 300    75.0%\n"
+            "1001 300    75.0%\n"
+            "1002 100    25.0%\n"
+            "1003 50    12.5%"
+        ))
+        self.assertEqual(Course.courses["Python"].get_top_students(),
+                         "Python\nid  points completed")
+
+    def test_ranking_matches_full_sort(self):
+        """Рейтинг совпадает с сортировкой всех баллов курса."""
+        expected = sorted(self.course.student_scores.items(),
+                          key=lambda x: (-x[1], x[0]))
+        self.assertEqual(self.course.get_top_page(), expected)
+
+    def test_pages_and_rank(self):
+        """Постраничный вывод и место студента в рейтинге."""
+        self.assertEqual(self.course.get_top_page(1, 2),
+                         [(1001, 300), (1002, 100)])
+        self.assertEqual(self.course.get_top_students(3, 5),
+                         "DSA\nid  points completed\n1003 50    12.5%")
+        self.assertEqual(self.course.get_student_rank(1000), 1)
+        self.assertEqual(self.course.get_student_rank(1003), 4)
+        self.assertIsNone(self.course.get_student_rank(1004))
+
+
+class TestReportCache(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+        self.students = [Student("John", "Smith", f"js{i}@example.com")
+                         for i in range(3)]
+        Student.add_points_many(["1000 10 0 0 0", "1001 0 20 0 0"])
+
+    def test_student_score(self):
+        """Строка баллов берется из кеша до изменения баллов."""
+        student = self.students[0]
+        score = student.get_student_score()
+        self.assertIs(student.get_student_score(), score)
+        other = self.students[1].get_student_score()
+
+        Student.add_points_many(["1000 5 0 0 0"])
+        self.assertEqual(student.get_student_score(),
+                         "1000 points: Python=15; DSA=0; Databases=0; "
+                         "Flask=0")
+        # Баллы другого студента не менялись, строка осталась в кеше.
+        self.assertIs(self.students[1].get_student_score(), other)
+
+        Course("Django", 300)
+        self.assertEqual(self.students[1].get_student_score(),
+                         "1001 points: Python=0; DSA=20; Databases=0; "
+                         "Flask=0; Django=0")
+        Course.remove("Python")
+        self.assertEqual(student.get_student_score(),
+                         "1000 points: DSA=0; Databases=0; Flask=0; "
+                         "Django=0")
+
+    def test_top_students(self):
+        """Рейтинг курса пересчитывается только после изменения курса."""
+        course = Course.courses["Python"]
+        top = course.get_top_students()
+        self.assertIs(course.get_top_students(), top)
+        Student.add_points_many(["1001 0 1 0 0"])
+        self.assertIs(course.get_top_students(), top)
+        with redirect_stdout(io.StringIO()):
+            self.students[2].add_points("30 0 0 0")
+        self.assertEqual(course.get_top_students(limit=1),
+                         "Python\nid  points completed\n1002 30    5.0%")
+        self.assertNotEqual(course.get_top_students(), top)
+
+    def test_statistic(self):
+        """Статистика пересчитывается только после изменения индексов."""
+        statistic = TrackerStatistics().get_statistic()
+        self.assertIs(TrackerStatistics().get_statistic(), statistic)
+        Student.add_points_many(["1002 0 0 7 0"])
+        self.assertEqual(TrackerStatistics().get_statistic(),
+                         TrackerStatistics().get_exact_statistic())
+
+    def test_lru_bound_and_stale_values(self):
+        """Кеш ограничен по размеру и не принимает устаревшие значения."""
+        cache = LRUCache(2)
+        for key in range(3):
+            cache.put(key, str(key))
+        cache.get(1)
+        cache.put(3, "3")
+        self.assertEqual(list(cache.entries), [1, 3])
+
+        stamp = cache.invalidations
+        cache.discard([1])
+        cache.put(1, "old", stamp)
+        self.assertIsNone(cache.get(1))
+        cache.put(1, "new", cache.invalidations)
+        self.assertEqual(cache.get(1), "new")
+
+
+class TestCourseCatalog(unittest.TestCase):
+
+    session = [
+        "add students",
+        "John Smith js@example.com",
+        "Mary Jane mj@example.com",
+        "back",
+        "add points",
+        "1000 600 10 0 0",
+        "back",
+        "add course",
+        "Django 300",
+        "django 100",
+        "Django",
+        "Go 0",
+        "Go x",
+        "back",
+        "add points",
+        "1000 1 1 1 1",
+        "1001 0 0 0 0 300",
+        "back",
+        "find",
+        "1000",
+        "1001",
+        "back",
+        "remove course",
+        "dsa",
+        "Java",
+        "back",
+        "find",
+        "1000",
+        "back",
+        "statistics",
+        "django",
+        "dsa",
+        "back",
+        "notify",
+        "exit",
+    ]
+
+    def setUp(self):
+        reset_state()
+
+    def test_add_and_remove_courses(self):
+        """Курсы добавляются и удаляются во время работы."""
+        output = run_session(self.session)
+        self.assertEqual(output.count("The course has been added."), 1)
+        self.assertIn("This course already exists.", output)
+        self.assertEqual(output.count("Incorrect course data."), 3)
+        self.assertIn("Incorrect points format.", output)
+        self.assertIn("1001 points: Python=0; DSA=0; Databases=0; Flask=0; "
+                      "Django=300", output)
+        self.assertIn("The course has been removed.", output)
+        self.assertEqual(output.count("Unknown course."), 2)
+        self.assertIn("1000 points: Python=600; Databases=0; Flask=0; "
+                      "Django=0", output)
+        self.assertIn("Django\nid  points completed\n1001 300    100.0%",
+                      output)
+        self.assertIn("You have accomplished our Django course!", output)
+        self.assertEqual(list(Course.courses),
+                         ["Python", "Databases", "Flask", "Django"])
+
+    def test_sqlite_matches_memory(self):
+        """Каталог курсов в SQLite ведет себя так же, как в памяти."""
+        expected = run_session(self.session)
+        with tempfile.TemporaryDirectory() as directory:
+            tracker = SQLiteLearningProgressTracker(
+                os.path.join(directory, "tracker.sqlite"), COURSES_POINTS
+            )
+            try:
+                self.assertEqual(run_session(self.session, tracker),
+                                 expected)
+            finally:
+                tracker.close()
+
+    def test_scores_are_sparse(self):
+        """Хранятся только ненулевые баллы, у студента своих нет."""
+        student = Student("John", "Smith", "js@example.com")
+        Student("Mary", "Jane", "mj@example.com")
+        Student.add_points_many(["1000 0 5 0 0", "1001 0 0 0 0"])
+        self.assertFalse(hasattr(student, "__dict__"))
+        self.assertEqual([course.student_scores
+                          for course in Course.courses.values()],
+                         [{}, {1000: 5}, {}, {}])
+        self.assertEqual(student.points,
+                         {"Python": 0, "DSA": 5, "Databases": 0, "Flask": 0})
+
+        Course("Django", 300)
+        self.assertEqual(student.points["Django"], 0)
+        with redirect_stdout(io.StringIO()):
+            student.add_points("0 0 0 0 7")
+        Course.remove("DSA")
+        self.assertEqual(dict(student.points), {"Python": 0, "Databases": 0,
+                                                "Flask": 0, "Django": 7})
+        self.assertEqual(TrackerStatistics().get_statistic(),
+                         TrackerStatistics().get_exact_statistic())
+
+
+class TestFindIndex(unittest.TestCase):
+
+    session = [
+        "add students",
+        "John Smith js@example.com",
+        "Mary Smith mary@example.com",
+        "Jo Anne Jones jo@example.com",
+        "john smith john.smith@example.com",
+        "back",
+        "find",
+        "email mary@example.com",
+        "email MARY@example.com",
+        "name SMITH",
+        "name john smith",
+        "name Anne Jones",
+        "name Jo Anne Jones",
+        "prefix jo",
+        "prefix Sm",
+        "prefix x",
+        "1001",
+        "back",
+        "exit",
+    ]
+
+    def setUp(self):
+        reset_state()
+
+    def test_find_variants(self):
+        """find ищет по email, фамилии, полному имени и префиксу."""
+        output = run_session(self.session)
+        scores = "points: Python=0; DSA=0; Databases=0; Flask=0"
+        self.assertIn(f"Enter an id or 'back' to return\n1001 {scores}\n"
+                      "No student is found for email=MARY@example.com\n"
+                      f"1000 {scores}\n1001 {scores}\n1003 {scores}\n"
+                      f"1000 {scores}\n1003 {scores}\n"
+                      f"1002 {scores}\n"
+                      f"1002 {scores}\n"
+                      f"1002 {scores}\n1003 {scores}\n"
+                      f"1000 {scores}\n1001 {scores}\n1003 {scores}\n"
+                      "No student is found for prefix=x\n"
+                      f"1001 {scores}\n", output)
+
+    def test_find_limit(self):
+        """Поиск по имени и префиксу показывает не больше find_limit."""
+        for i in range(15):
+            Student("John", "Smith", f"john{i:02}@example.com")
+        tracker = LearningProgressTracker()
+        self.assertEqual(tracker._find_student_ids("name", "Smith"),
+                         list(range(1000, 1010)))
+        self.assertEqual(tracker._find_student_ids("prefix", "john1"),
+                         list(range(1010, 1015)))
+
+    def test_sqlite_matches_memory(self):
+        """find в SQLite отвечает так же, как по индексам в памяти."""
+        expected = run_session(self.session)
+        with tempfile.TemporaryDirectory() as directory:
+            tracker = SQLiteLearningProgressTracker(
+                os.path.join(directory, "tracker.sqlite"), COURSES_POINTS
+            )
+            try:
+                self.assertEqual(run_session(self.session, tracker),
+                                 expected)
+            finally:
+                tracker.close()
+
+    def test_multi_word_last_name(self):
+        """Фамилию из нескольких слов находят целиком и вместе с именем."""
+        session = [
+            "add students",
+            "Jean-Clause van Helsing jc@example.com",
+            "Robert Van de Graaff rvdg@example.com",
+            "Van Helsing van@example.com",
+            "back",
+            "find",
+            "name van helsing",
+            "name VAN DE GRAAFF",
+            "name Jean-Clause van Helsing",
+            "name robert van de graaff",
+            "name Helsing",
+            "name de Graaff",
+            "back",
+            "exit",
+        ]
+        scores = "points: Python=0; DSA=0; Databases=0; Flask=0"
+        expected = run_session(session)
+        self.assertIn(f"Enter an id or 'back' to return\n1000 {scores}\n"
+                      f"1001 {scores}\n1000 {scores}\n1001 {scores}\n"
+                      f"1002 {scores}\n"
+                      "No student is found for name=de Graaff\n", expected)
+        reset_state()
+        with tempfile.TemporaryDirectory() as directory:
+            tracker = SQLiteLearningProgressTracker(
+                os.path.join(directory, "tracker.sqlite"), COURSES_POINTS
+            )
+            try:
+                self.assertEqual(run_session(session, tracker), expected)
+            finally:
+                tracker.close()
+
+    def test_prefix_index_matches_scan(self):
+        """Индекс префиксов совпадает с перебором отсортированных ключей."""
+        rng = random.Random(7)
+        keys = [f"{rng.choice('abc')}{rng.randrange(10_000)}"
+                for _ in range(5_000)]
+        index = StudentIndex().email_prefixes
+        index.block_size = 8
+        for key in keys:
+            index.add(key)
+        self.assertEqual(len(index), len(keys))
+        self.assertTrue(all(len(block) <= 16 for block in index.blocks))
+        for prefix in ("", "a", "b12", "c999", "d"):
+            self.assertEqual(list(index.search(prefix)),
+                             sorted(k for k in keys if k.startswith(prefix)))
+
+
+class TestTrackerContext(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+        self.cohorts = [TrackerContext(COURSES_POINTS) for _ in range(2)]
+
+    def session(self, cohort: int, lines: list[str]) -> list[str]:
+        tracker = LearningProgressTracker(context=self.cohorts[cohort])
+        return run_session(lines + ["exit"], tracker).splitlines()[1:-1]
+
+    def test_cohorts_are_isolated(self):
+        """Студенты, id, баллы и статистика у когорт свои."""
+        add = ["add students", "John Smith js@example.com", "back"]
+        self.assertEqual(self.session(0, add)[-1],
+                         "Total 1 students have been added.")
+        self.assertEqual(self.session(1, add)[-1],
+                         "Total 1 students have been added.")
+        self.session(0, ["add points", "1000 600 0 0 0", "back"])
+
+        self.assertEqual(self.session(0, ["find", "1000", "back"])[1],
+                         "1000 points: Python=600; DSA=0; Databases=0; "
+                         "Flask=0")
+        self.assertEqual(self.session(1, ["find", "1000", "back"])[1],
+                         "1000 points: Python=0; DSA=0; Databases=0; "
+                         "Flask=0")
+        self.assertEqual(self.session(1, ["statistics", "back"])[1],
+                         "Most popular: n/a")
+        self.assertEqual(self.session(0, ["notify"]),
+                         ["To: js@example.com",
+                          "Re: Your Learning Progress",
+                          "Hello, John Smith! You have accomplished "
+                          "our Python course!",
+                          "Total 1 students have been notified."])
+
+        # Контекст по умолчанию не изменился.
+        self.assertEqual(Student.students, {})
+        self.assertEqual(Student.id_counter, 1000)
+        self.assertEqual(Course.courses["Python"].student_scores, {})
+        self.assertEqual([len(cohort.students) for cohort in self.cohorts],
+                         [1, 1])
+
+    def test_course_catalog_per_cohort(self):
+        """Курсы когорт разные, определения курсов общие."""
+        self.session(0, ["add course", "Django 300", "back"])
+        self.assertEqual(list(self.cohorts[0].courses),
+                         [*COURSES_POINTS, "Django"])
+        self.assertEqual(list(self.cohorts[1].courses), list(COURSES_POINTS))
+        self.assertIsNot(self.cohorts[0].courses["Python"],
+                         self.cohorts[1].courses["Python"])
+        self.assertIs(self.cohorts[0].courses_points,
+                      self.cohorts[1].courses_points)
+
+    def test_class_attributes_follow_current_context(self):
+        """Чтение и присваивание атрибутов классов идут в текущую когорту."""
+        cohort = self.cohorts[0]
+        with cohort.activate():
+            self.assertIs(TrackerContext.current(), cohort)
+            self.assertIs(Course.courses, cohort.courses)
+            Student.id_counter = 5000
+            Student("John", "Smith", "js@example.com")
+        self.assertEqual(list(cohort.students), [5000])
+        self.assertEqual(cohort.id_counter, 5001)
+        self.assertEqual(Student.id_counter, 1000)
+
+    def test_threads_choose_their_cohort(self):
+        """Потоки работают каждый со своей когортой."""
+        def work(cohort: TrackerContext, count: int) -> None:
+            with cohort.activate():
+                Student.import_students(f"John Smith js{i}@example.com"
+                                        for i in range(count))
+                Student.add_points_many(f"{student_id} 1 0 0 0"
+                                        for student_id in Student.students)
+
+        threads = [threading.Thread(target=work, args=(cohort, 50 * (i + 1)))
+                   for i, cohort in enumerate(self.cohorts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([cohort.courses["Python"].completed_tasks
+                          for cohort in self.cohorts], [50, 100])
+        self.assertEqual(Student.students, {})
+
+
+class TestEventBus(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+        self.context = TrackerContext(COURSES_POINTS)
+        self.bus = self.context.events = EventBus()
+        self.enterContext(self.context.activate())
+
+    def test_session_events(self):
+        """События сессии идут по порядку смещений."""
+        subscription = self.bus.subscribe()
+        Student.import_students(["John Smith js@example.com",
+                                 "Jane Doe jd@example.com"])
+        with redirect_stdout(io.StringIO()):
+            Student.students[1000].add_points("590 0 0 1")
+            Student.add_points_many(["1000 10 0 0 0", "1001 0 1 0 0",
+                                     "1000 5 0 0 0", "9999 1 1 1 1"])
+        self.assertEqual(subscription.poll(), list(enumerate([
+            StudentAdded(1000, "John", "Smith", "js@example.com"),
+            StudentAdded(1001, "Jane", "Doe", "jd@example.com"),
+            ScoreChanged("Python", 1000, 0, 590),
+            ScoreChanged("Flask", 1000, 0, 1),
+            PointsAdded(1000, ("Python", "DSA", "Databases", "Flask"),
+                        (590, 0, 0, 1)),
+            ScoreChanged("Python", 1000, 590, 605),
+            CourseCompleted("Python", 1000),
+            ScoreChanged("DSA", 1001, 0, 1),
+            PointsAdded(1000, ("Python", "DSA", "Databases", "Flask"),
+                        (10, 0, 0, 0)),
+            PointsAdded(1001, ("Python", "DSA", "Databases", "Flask"),
+                        (0, 1, 0, 0)),
+            PointsAdded(1000, ("Python", "DSA", "Databases", "Flask"),
+                        (5, 0, 0, 0)),
+        ])))
+        self.assertEqual(subscription.poll(), [])
+
+    def test_batch_scores_match_courses(self):
+        """Последние ScoreChanged совпадают с баллами курсов."""
+        rng = random.Random(3)
+        Student.import_students(f"John Smith js{i}@example.com"
+                                for i in range(50))
+        subscription = self.bus.subscribe(capacity=100_000,
+                                          types=(ScoreChanged,))
+        lines = [f"{rng.randrange(1000, 1050)} {rng.randrange(0, 40)} "
+                 f"{rng.randrange(0, 40)} 0 {rng.randrange(0, 3)}"
+                 for _ in range(2000)]
+        Student.add_points_many(lines[:1000])
+        Student.add_points_parallel(lines[1000:], workers=2,
+                                    chunk_size=300)
+        scores = {}
+        for _, event in subscription.poll():
+            self.assertIsInstance(event, ScoreChanged)
+            self.assertEqual(
+                scores.get((event.course, event.student_id), 0),
+                event.old_score)
+            scores[event.course, event.student_id] = event.score
+        self.assertEqual(scores, {
+            (course.name, student_id): score
+            for course in Course.courses.values()
+            for student_id, score in course.student_scores.items()
+        })
+
+    def test_drop_policies(self):
+        """Полный буфер вытесняет старые или отбрасывает новые."""
+        oldest = self.bus.subscribe(capacity=2)
+        newest = self.bus.subscribe(
+            capacity=2, policy=EventSubscription.DROP_NEWEST
+        )
+        added = self.bus.subscribe(types=(StudentAdded,))
+        Student.import_students(f"John Smith js{i}@example.com"
+                                for i in range(5))
+        self.assertEqual([offset for offset, _ in oldest.poll()], [3, 4])
+        self.assertEqual([offset for offset, _ in newest.poll()], [0, 1])
+        self.assertEqual((oldest.dropped, newest.dropped), (3, 3))
+        self.assertEqual(len(added.poll(max_events=3)), 3)
+        self.assertEqual(len(added.poll()), 2)
+        added.close()
+        Student.import_students(["John Smith js5@example.com"])
+        self.assertEqual(added.poll(), [])
+        with self.assertRaises(ValueError):
+            self.bus.subscribe(policy="drop_all")
+
+    def test_block_policy(self):
+        """С политикой block отправка ждет медленного подписчика."""
+        subscription = self.bus.subscribe(
+            capacity=3, policy=EventSubscription.BLOCK
+        )
+        context = self.context
+
+        def produce():
+            with context.activate():
+                Student.import_students(f"John Smith js{i}@example.com"
+                                        for i in range(20))
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        received = []
+        while len(received) < 20:
+            events = subscription.poll(max_events=2, timeout=5)
+            self.assertTrue(events)
+            self.assertLessEqual(len(subscription.buffer), 3)
+            received.extend(offset for offset, _ in events)
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(received, list(range(20)))
+        self.assertEqual(subscription.dropped, 0)
+
+    def test_unsubscribe_while_blocked(self):
+        """Отписка ждущего подписчика не отнимает события у других."""
+        blocked = self.bus.subscribe(capacity=1,
+                                     policy=EventSubscription.BLOCK)
+        other = self.bus.subscribe()
+        events = [StudentAdded(1000 + i, "John", "Smith",
+                               f"js{i}@example.com") for i in range(3)]
+        producer = threading.Thread(target=self.bus.publish_many,
+                                    args=(events,))
+        producer.start()
+        while not blocked.buffer:
+            time.sleep(0.001)
+        blocked.close()
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(other.poll(), list(enumerate(events)))
+        self.assertEqual(blocked.poll(), [(0, events[0])])
+
+    def test_jsonl_sink_torn_tail(self):
+        """Недописанная строка отрезается, смещения продолжаются."""
+        path = os.path.join(self.enterContext(
+            tempfile.TemporaryDirectory()), "events.jsonl")
+        self.bus = self.context.events = EventBus(JsonlEventSink(path))
+        Student.import_students(["John Smith js@example.com",
+                                 "Jane Doe jd@example.com"])
+        self.bus.close()
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write('{"offset": 2, "type": "Stud')
+
+        self.context.events = EventBus(JsonlEventSink(path))
+        Student.import_students(["Mary Jane mj@example.com"])
+        self.context.events.close()
+        self.assertEqual(list(JsonlEventSink.read(path)), [
+            (0, StudentAdded(1000, "John", "Smith", "js@example.com")),
+            (1, StudentAdded(1001, "Jane", "Doe", "jd@example.com")),
+            (2, StudentAdded(1002, "Mary", "Jane", "mj@example.com")),
+        ])
+
+    def test_jsonl_sink_resume(self):
+        """Смещения журнала продолжаются после переоткрытия файла."""
+        path = os.path.join(self.enterContext(
+            tempfile.TemporaryDirectory()), "events.jsonl")
+        self.bus = self.context.events = EventBus(JsonlEventSink(path))
+        Student.import_students(["John Smith js@example.com"])
+        with redirect_stdout(io.StringIO()):
+            Student.students[1000].add_points("700 0 0 0")
+        self.bus.close()
+        first = list(JsonlEventSink.read(path))
+        self.assertEqual([offset for offset, _ in first], [0, 1, 2, 3])
+        self.assertEqual(first[2][1], CourseCompleted("Python", 1000))
+        self.assertEqual(first[3][1], PointsAdded(
+            1000, ("Python", "DSA", "Databases", "Flask"), (700, 0, 0, 0)
+        ))
+
+        self.context.events = EventBus(JsonlEventSink(path))
+        Student.import_students(["Jane Doe jd@example.com"])
+        self.context.events.close()
+        self.assertEqual(list(JsonlEventSink.read(path, after=3)), [
+            (4, StudentAdded(1001, "Jane", "Doe", "jd@example.com")),
+        ])
+        self.assertEqual(list(JsonlEventSink.read(path))[:4], first)
+
+
+class TestCourseSketches(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+        self.context = TrackerContext(COURSES_POINTS)
+        self.context.enable_sketches()
+        self.enterContext(self.context.activate())
+
+    def fill(self, students: int, rows: int, seed: int = 7) -> list[str]:
+        rng = random.Random(seed)
+        Student.import_students(f"John Smith js{i}@example.com"
+                                for i in range(students))
+        lines = [f"{1000 + int(rng.paretovariate(1.2)) % students} "
+                 f"{rng.randrange(1, 50)} {rng.choice((0, 3, 700))} "
+                 f"{rng.choice((0, 0, 0, 1))} 0" for _ in range(rows)]
+        Student.add_points_many(lines)
+        return lines
+
+    def test_distinct_students(self):
+        """HyperLogLog в пределах трех стандартных ошибок."""
+        self.fill(30_000, 60_000)
+        for course in Course.courses.values():
+            exact = len(course.student_scores)
+            estimate = len(course.sketches.students)
+            self.assertLessEqual(abs(estimate - exact),
+                                 max(3 * 1.04 / 64 * exact, 2), course.name)
+        self.assertEqual(len(Course.courses["Flask"].sketches.students), 0)
+
+    def test_score_quantiles(self):
+        """Квантили баллов с относительной погрешностью 1%."""
+        self.fill(5_000, 40_000)
+        for course in list(Course.courses.values())[:3]:
+            scores = sorted(course.student_scores.values())
+            for q in (0.0, 0.1, 0.5, 0.9, 0.99, 1.0):
+                exact = scores[int(q * (len(scores) - 1))]
+                estimate = course.sketches.scores.quantile(q)
+                self.assertLessEqual(abs(estimate - exact),
+                                     0.01 * exact + 1e-9, (course.name, q))
+        self.assertIsNone(Course.courses["Flask"].sketches.scores
+                          .quantile(0.5))
+
+    def test_task_counts(self):
+        """Count-min не занижает счетчики и редко выходит за e/width."""
+        lines = self.fill(20_000, 50_000)
+        exact = Counter(int(line.split()[0]) for line in lines)
+        tasks = Course.courses["Python"].sketches.tasks
+        bound = math.e / tasks.width * tasks.total
+        within = 0
+        for student_id in Student.students:
+            estimate = tasks[student_id]
+            self.assertGreaterEqual(estimate, exact[student_id])
+            within += estimate - exact[student_id] <= bound
+        self.assertGreaterEqual(within / len(Student.students), 0.95)
+
+    def test_same_sketches_for_all_update_paths(self):
+        """Построчно, пакетами и в процессах скетчи одинаковые."""
+        rng = random.Random(3)
+        lines = [f"{rng.randrange(1000, 1060)} {rng.choice((0, 5, 90))} "
+                 f"{rng.choice((0, 400))} 1 0" for _ in range(3000)]
+
+        def state() -> list:
+            return [(bytes(c.sketches.students.registers),
+                     c.sketches.scores.buckets,
+                     [list(row) for row in c.sketches.tasks.rows])
+                    for c in Course.courses.values()]
+
+        states = []
+        for add_points in (None, Student.add_points_many,
+                           partial(Student.add_points_parallel, workers=3)):
+            self.setUp()
+            Student.import_students(f"John Smith js{i}@example.com"
+                                    for i in range(60))
+            if add_points is None:
+                with redirect_stdout(io.StringIO()):
+                    for line in lines:
+                        student_id, points = line.split(' ', 1)
+                        Student.students[int(student_id)].add_points(points)
+            else:
+                add_points(lines, chunk_size=700)
+            states.append(state())
+        self.assertEqual(states[0], states[1])
+        self.assertEqual(states[0], states[2])
+
+    def test_enable_with_existing_scores(self):
+        """Скетчи, включенные позже, строятся по текущим баллам."""
+        context = TrackerContext(COURSES_POINTS)
+        with context.activate():
+            self.fill(100, 500)
+            context.enable_sketches()
+            course = Course.courses["Python"]
+            self.assertEqual(len(course.sketches.students),
+                             len(course.student_scores))
+            self.assertEqual(course.sketches.scores.count,
+                             len(course.student_scores))
+            self.assertEqual(course.sketches.tasks.total, 0)
+
+    def test_approximate_statistics_command(self):
+        """Команда approximate statistics и ее подрежим."""
+        Student.import_students(["John Smith js@example.com",
+                                 "Mary Jane mj@example.com"])
+        Student.add_points_many(["1000 300 10 0 0", "1001 600 0 0 0",
+                                 "1000 1 0 0 0"])
+        output = run_session(["approximate statistics", "1000", "7", "back",
+                              "exit"])
+        lines = output.splitlines()[1:]
+        self.assertEqual(
+            lines[0], "Type a student id to see task counts or 'back' "
+                      "to quit:"
+        )
+        python = re.fullmatch(r"Python: ~2 students, median (.*)%, "
+                              r"p90 (.*)%", lines[1])
+        self.assertAlmostEqual(float(python[1]), 301 / 600 * 100, delta=0.6)
+        # Ранг 0.9 * (2 - 1) округляется вниз, это тоже 301 балл.
+        self.assertAlmostEqual(float(python[2]), 301 / 600 * 100, delta=0.6)
+        self.assertRegex(lines[2], r"DSA: ~1 students, median 2\.\d%")
+        self.assertEqual(lines[4], "Flask: ~0 students, median n/a, p90 n/a")
+        self.assertEqual(lines[5:], [
+            "1000 tasks: Python~2; DSA~1; Databases~0; Flask~0",
+            "No student is found for id=7",
+            "Bye!",
+        ])
+
+        with TrackerContext(COURSES_POINTS).activate():
+            self.assertEqual(
+                run_session(["approximate statistics", "exit"])
+                .splitlines()[1:],
+                ["Approximate statistics are disabled.", "Bye!"],
+            )
+
+
+class TestTrackerStatistics(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+
+    def test_empty_statistic(self):
+        """Без баллов все категории пустые."""
+        self.assertEqual(TrackerStatistics().get_statistic(), (
+            "Most popular: n/a\n"
+            "Least popular: n/a\n"
+            "Highest activity: n/a\n"
+            "Lowest activity: n/a\n"
+            "Easiest course: n/a\n"
+            "Hardest course: n/a"
+        ))
+
+    def test_matches_full_recalculation(self):
+        """Инкрементальная статистика совпадает с полным пересчетом."""
+        rng = random.Random(7)
+        for i in range(20):
+            Student("John", "Smith", f"js{i}@example.com")
+        statistics = TrackerStatistics()
+        for _ in range(300):
+            student = Student.students[rng.randrange(1000, 1020)]
+            points = " ".join(str(rng.choice((0, 0, 1, 5, 10)))
+                              for _ in Course.courses)
+            with redirect_stdout(io.StringIO()):
+                student.add_points(points)
+            self.assertEqual(statistics.get_statistic(),
+                             statistics.get_exact_statistic())
+            for course in Course.courses.values():
+                self.assertEqual(course.ranking, sorted(
+                    (-points, student_id)
+                    for student_id, points in course.student_scores.items()
+                ))
+
+
+class TestConcurrentUpdates(unittest.TestCase):
+
+    workers = 8
+
+    def setUp(self):
+        reset_state()
+        TrackerLocks.enable(shards=4)
+        # Частое переключение потоков, чтобы гонки проявлялись.
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+        TrackerLocks.disable()
+
+    def run_workers(self, target) -> None:
+        barrier = threading.Barrier(self.workers)
+
+        def run(worker):
+            barrier.wait()
+            target(worker)
+
+        threads = [threading.Thread(target=run, args=(worker,))
+                   for worker in range(self.workers)]
+        with redirect_stdout(io.StringIO()):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    def test_unique_ids_and_emails(self):
+        """Параллельная регистрация выдает уникальные id и email."""
+        taken = []
+
+        def register(worker):
+            for i in range(50):
+                Student("John", "Smith", f"js{worker}.{i}@example.com")
+            try:
+                Student("John", "Smith", "shared@example.com")
+            except EmailIsTaken:
+                taken.append(worker)
+
+        self.run_workers(register)
+        count = self.workers * 50 + 1
+        self.assertEqual(len(taken), self.workers - 1)
+        self.assertEqual(sorted(Student.students),
+                         list(range(1000, 1000 + count)))
+        self.assertEqual(Student.id_counter, 1000 + count)
+        self.assertEqual(len(Student.emails), count)
+
+    def test_checkpoints_during_writes(self):
+        """Снимки по checkpoint_every не теряют и не повторяют события."""
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        storage = TrackerStorage(directory, checkpoint_every=20)
+        storage.open()
+        self.addCleanup(storage.close)
+        Student.import_students(f"John Smith js{i}@example.com"
+                                for i in range(40))
+        errors = []
+
+        def write(worker):
+            try:
+                for i in range(100):
+                    Student("John", "Smith", f"w{worker}.{i}@example.com")
+                    Student.students[1000 + (worker * 7 + i) % 40] \
+                        .add_points("1 2 3 4")
+                Student.add_points_many(f"{1000 + i} 1 0 0 1"
+                                        for i in range(40))
+            except Exception as error:
+                errors.append(error)
+
+        self.run_workers(write)
+        self.assertEqual(errors, [])
+        self.assertGreater(storage.generation, 5)
+        expected = tracker_state()
+        storage.close()
+        reset_state()
+        storage = TrackerStorage(directory)
+        storage.open()
+        self.addCleanup(storage.close)
+        self.assertEqual(tracker_state(), expected)
+
+    def test_points_totals_are_exact(self):
+        """Баллы из нескольких потоков суммируются без потерь."""
+        for i in range(20):
+            Student("John", "Smith", f"js{i}@example.com")
+        ids = list(Student.students)
+
+        def add(worker):
+            rng = random.Random(worker)
+            for _ in range(100):
+                student = Student.students[rng.choice(ids)]
+                student.add_points("10 5 0 1")
+            Student.add_points_many(f"{student_id} 1 1 1 1"
+                                    for student_id in ids)
+
+        statistics = TrackerStatistics()
+        reader_results = []
+        stop = threading.Event()
+
+        def read_statistics():
+            while not stop.is_set():
+                reader_results.append(statistics.get_statistic())
+
+        reader = threading.Thread(target=read_statistics)
+        reader.start()
+        self.run_workers(add)
+        stop.set()
+        reader.join()
+
+        updates = self.workers * 100
+        expected = {"Python": 10, "DSA": 5, "Databases": 0, "Flask": 1}
+        for name, course in Course.courses.items():
+            tasks = (updates if expected[name] else 0) + self.workers * 20
+            self.assertEqual(course.completed_tasks, tasks)
+            self.assertEqual(course.all_score,
+                             updates * expected[name] + self.workers * 20)
+            self.assertEqual(sum(course.student_scores.values()),
+                             course.all_score)
+            self.assertEqual(course.ranking, sorted(
+                (-points, student_id)
+                for student_id, points in course.student_scores.items()
+            ))
+        for student in Student.students.values():
+            for name, points in student.points.items():
+                self.assertEqual(
+                    points, Course.courses[name].student_scores[student.id]
+                )
+        self.assertEqual(statistics.get_statistic(),
+                         statistics.get_exact_statistic())
+        self.assertTrue(all(result.count("\n") == 5
+                            for result in reader_results))
+        # Каждый студент попадает в очередь уведомлений один раз.
+        completed = Course.courses["Python"].completed_course
+        self.assertEqual(len(completed), len({s.id for s in completed}))
+
+
+class TestCompletedStudents(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+        self.course = Course.courses["DSA"]
+        self.student = Student("John", "Smith", "js@example.com")
+
+    def add_points(self, points: str) -> None:
+        with redirect_stdout(io.StringIO()):
+            self.student.add_points(points)
+
+    def test_completion_recorded_once(self):
+        """Повторные баллы после окончания курса не растят очередь."""
+        self.add_points("0 400 0 0")
+        for _ in range(1000):
+            self.add_points("0 1 0 0")
+        self.assertEqual(self.course.completed_course, [self.student])
+
+        message, students = self.course.get_completed_student_data()
+        self.assertEqual(message.count("To: js@example.com"), 1)
+        self.assertEqual(self.course.notified, {1000})
+
+        for _ in range(1000):
+            self.add_points("0 1 0 0")
+        self.assertEqual(self.course.completed_course, [])
+        self.assertEqual(self.course.get_completed_student_data(), ("", []))
+
+    def test_notified_students_are_skipped(self):
+        """Уже уведомленный студент не получает письмо повторно."""
+        self.add_points("0 400 0 0")
+        self.course.get_completed_student_data()
+        self.course.completed_course.append(self.student)
+        self.assertEqual(self.course.get_completed_student_data(), ("", []))
+        self.assertEqual(self.course.completed_course, [])
+
+    def test_notify_counts_unique_students(self):
+        """Студент, окончивший два курса, считается один раз."""
+        self.add_points("600 400 0 0")
+        output = run_session(["notify", "notify", "exit"])
+        self.assertEqual(output.count("To: js@example.com"), 2)
+        self.assertIn("Total 1 students have been notified.", output)
+        self.assertIn("Total 0 students have been notified.", output)
+
+
+class TestNotificationSinks(unittest.TestCase):
+
+    session = [
+        "add students",
+        "John Smith js@example.com",
+        "Mary Jane mj@example.com",
+        "back",
+        "add points",
+        "1000 600 400 0 0",
+        "1001 0 0 480 0",
+        "back",
+        "notify",
+        "notify",
+        "exit",
+    ]
+
+    def setUp(self):
+        reset_state()
+
+    def test_console_output(self):
+        """Уведомления в консоли выводятся в прежнем формате."""
+        output = run_session(self.session)
+        self.assertTrue(output.endswith(
+            "Points updated.\n"
+            "Points updated.\n"
+            "To: js@example.com\n"
+            "Re: Your Learning Progress\n"
+            "Hello, John Smith! You have accomplished our Python course!\n"
+            "To: js@example.com\n"
+            "Re: Your Learning Progress\n"
+            "Hello, John Smith! You have accomplished our DSA course!\n"
+            "To: mj@example.com\n"
+            "Re: Your Learning Progress\n"
+            "Hello, Mary Jane! You have accomplished our Databases course!\n"
+            "Total 2 students have been notified.\n"
+            "\n"
+            "Total 0 students have been notified.\n"
+            "Bye!\n"
+        ))
+
+    def test_small_buffer(self):
+        """Размер буфера не влияет на вывод."""
+        expected = run_session(self.session)
+        reset_state()
+        output = io.StringIO()
+        with patch("builtins.input", side_effect=self.session), \
+                redirect_stdout(output):
+            LearningProgressTracker(
+                StreamNotificationSink(buffer_size=1)
+            ).start()
+        self.assertEqual(output.getvalue(), expected)
+
+    def test_maildir(self):
+        """Каждое письмо попадает в отдельный файл каталога new."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = io.StringIO()
+            with patch("builtins.input", side_effect=self.session), \
+                    redirect_stdout(output):
+                LearningProgressTracker(
+                    MaildirNotificationSink(directory)
+                ).start()
+            new_dir = os.path.join(directory, "new")
+            messages = []
+            for name in os.listdir(new_dir):
+                with open(os.path.join(new_dir, name)) as file:
+                    messages.append(file.read())
+
+        self.assertEqual(len(messages), 3)
+        self.assertIn("To: mj@example.com\n", messages[0] + messages[1]
+                      + messages[2])
+        self.assertIn("Total 2 students have been notified.",
+                      output.getvalue())
+
+
+def tracker_state() -> tuple:
+    """Состояние студентов и курсов для сравнения в тестах."""
+    students = [(s.id, s.first_name, s.last_name, s.email, dict(s.points))
+                for s in Student.students.values()]
+    courses = [(c.name, dict(c.student_scores), list(c.ranking),
+                c.completed_tasks, c.all_score,
+                [s.id for s in c.completed_course], set(c.notified))
+               for c in Course.courses.values()]
+    index = Student.index
+    index.build()
+    names = deepcopy((index.last_names,
+                      index.full_names))
+    indexes = (dict(Student.emails), names,
+               list(index.email_prefixes.search("")),
+               list(index.last_name_prefixes.search("")))
+    return (Student.id_counter, students, courses, indexes,
+            TrackerStatistics().get_statistic())
+
+
+class TestTrackerStorage(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.storage = TrackerStorage(self.tmp.name, sync_every=2)
+        self.storage.open()
+        self.addCleanup(self.storage.close)
+
+    def fill(self, offset: int = 0) -> None:
+        """Добавляет студентов, баллы и отправляет уведомления."""
+        Student.import_students(f"John Smith js{offset + i}@example.com"
+                                for i in range(5))
+        Student.add_points_many(f"{student_id} 300 200 0 {student_id % 7}"
+                                for student_id in Student.students)
+        with redirect_stdout(io.StringIO()):
+            Student.students[1000].add_points("300 0 0 0")
+            Student.students[1001].add_points("0 200 0 0")
+            LearningProgressTracker().commands["notify"]()
+            Student.students[1002].add_points("300 0 0 0")
+
+    def reopen(self) -> int:
+        self.storage.close()
+        reset_state()
+        self.storage = TrackerStorage(self.tmp.name)
+        return self.storage.open()
+
+    def test_recover_from_log(self):
+        """Состояние восстанавливается только из журнала."""
+        self.fill()
+        expected = tracker_state()
+        self.assertEqual(self.reopen(), 5 + 5 + 3 + 2)
+        self.assertEqual(tracker_state(), expected)
+
+    def test_no_renotification_after_restart(self):
+        """Уведомленные студенты сохраняются и не получают письмо снова."""
+        self.fill()
+        self.storage.checkpoint()
+        with redirect_stdout(io.StringIO()):
+            Student.students[1003].add_points("300 0 0 0")
+        self.reopen()
+        python = Course.courses["Python"]
+        self.assertEqual(python.notified, {1000})
+        # Очередь, восстановленная вместе с уже уведомленным студентом
+        # (например, из снимка, записанного до отправки писем).
+        python.completed_course.insert(0, Student.students[1000])
+        output = run_session(["notify", "exit"])
+        self.assertNotIn("js0@example.com", output)
+        self.assertEqual(output.count("To: "), 2)
+        self.assertIn("Total 2 students have been notified.", output)
+        self.assertEqual(python.notified, {1000, 1002, 1003})
+        self.assertEqual(run_session(["notify", "exit"]).count("To: "), 0)
+
+    def test_recover_from_snapshot_and_log_tail(self):
+        """После снимка применяется только хвост журнала."""
+        self.fill()
+        self.storage.checkpoint()
+        self.fill(offset=100)
+        expected = tracker_state()
+        self.assertEqual(self.reopen(), 5 + 10 + 3 + 2)
+        self.assertEqual(tracker_state(), expected)
+        # Новые события продолжают писаться после восстановления.
+        Student("Mary", "Jane", "mj@example.com")
+        expected = tracker_state()
+        self.reopen()
+        self.assertEqual(tracker_state(), expected)
+
+    def test_torn_tail_is_dropped(self):
+        """Недописанная последняя запись журнала отбрасывается."""
+        Student("John", "Smith", "js@example.com")
+        expected = tracker_state()
+        Student("Mary", "Jane", "mj@example.com")
+        self.storage.close()
+        path = os.path.join(self.tmp.name, "events.0.log")
+        with open(path, 'r+b') as file:
+            file.truncate(os.path.getsize(path) - 3)
+        self.assertEqual(self.reopen(), 1)
+        self.assertEqual(tracker_state(), expected)
+
+    def test_course_changes_are_recovered(self):
+        """Добавление и удаление курсов восстанавливается из журнала."""
+        self.fill()
+        Course("Django", 300)
+        Student.add_points_many(["1000 1 2 3 4 300", "1001 0 0 0 0 5"])
+        Course.remove("DSA")
+        expected = tracker_state()
+        self.reopen()
+        self.assertEqual(tracker_state(), expected)
+
+        self.storage.checkpoint()
+        Course.remove("Python")
+        Course("Go", 100)
+        expected = tracker_state()
+        self.reopen()
+        self.assertEqual(list(Course.courses),
+                         ["Databases", "Flask", "Django", "Go"])
+        self.assertEqual(tracker_state(), expected)
+
+    def test_version_1_snapshot(self):
+        """Снимок версии 1 с плотной матрицей баллов читается."""
+        self.storage.close()
+        courses = [("Python", 600, [1000], {1000: 600}),
+                   ("DSA", 400, [], {1001: 5}),
+                   ("Databases", 480, [], {}),
+                   ("Flask", 550, [], {})]
+        chunks = [TrackerStorage.snapshot_header.pack(
+            b'LPTS', 1, 3, 1002, len(courses), 2
+        )]
+        for name, passing_scores, pending, scores in courses:
+            chunks.append(TrackerStorage._pack_str(name))
+            chunks.append(TrackerStorage.course_header_v1.pack(
+                passing_scores, len(scores), sum(scores.values()),
+                len(pending), 0,
+            ))
+            chunks.append(struct.pack(f'<{len(pending)}q', *pending))
+        for student_id in (1000, 1001):
+            chunks.append(struct.pack(
+                '<q4q', student_id,
+                *(scores.get(student_id, 0) for *_, scores in courses)
+            ))
+            for value in ("John", "Smith", f"js{student_id}@example.com"):
+                chunks.append(TrackerStorage._pack_str(value))
+        with open(os.path.join(self.tmp.name, "snapshot.bin"), 'wb') as file:
+            file.write(b''.join(chunks))
+
+        self.assertEqual(self.reopen(), 0)
+        self.assertEqual(Student.students[1001].get_student_score(),
+                         "1001 points: Python=0; DSA=5; Databases=0; Flask=0")
+        self.assertEqual(Course.courses["Python"].get_top_page(),
+                         [(1000, 600)])
+        self.assertEqual(
+            [s.id for s in Course.courses["Python"].completed_course], [1000]
+        )
+        self.assertEqual(Student.id_counter, 1002)
+
+    def test_parallel_points_are_logged(self):
+        """Баллы, добавленные в нескольких процессах, пишутся в журнал."""
+        Student.import_students(f"John Smith js{i}@example.com"
+                                for i in range(10))
+        Student.add_points_parallel(
+            (f"{1000 + i % 10} {i} 0 {i % 3} 1" for i in range(50)),
+            workers=2, chunk_size=20,
+        )
+        expected = tracker_state()
+        self.assertEqual(self.reopen(), 10 + 50)
+        self.assertEqual(tracker_state(), expected)
+
+
+class TestTrackerImage(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "tracker.image")
+
+    def fill(self) -> None:
+        """Студенты с баллами, выпускники и отправленные уведомления."""
+        Student.import_students(f"John Smith{'abc'[i % 3]} js{i}@example.com"
+                                for i in range(30))
+        Student("Mary", "Jane", "mary@example.com")
+        Student.add_points_many(f"{student_id} {student_id % 9 * 80} "
+                                f"{student_id % 4 * 150} 0 {student_id % 7}"
+                                for student_id in Student.students)
+        with redirect_stdout(io.StringIO()):
+            LearningProgressTracker().commands["notify"]()
+            Student.students[1001].add_points("600 0 0 0")
+        Course("Django", 300)
+
+    def change(self) -> None:
+        """Изменения поверх загруженного состояния."""
+        Student("Ann", "Lee", "ann@example.com")
+        Student.add_points_many(["1031 700 0 0 0 0", "1002 0 5 0 0 300"])
+        with redirect_stdout(io.StringIO()):
+            LearningProgressTracker().commands["notify"]()
+        Course.remove("Databases")
+
+    def reload(self) -> None:
+        TrackerImage.export(self.path)
+        reset_state()
+        TrackerImage.load(self.path)
+
+    def test_round_trip(self):
+        """Состояние после экспорта и загрузки образа то же самое."""
+        self.fill()
+        expected = tracker_state()
+        self.reload()
+        self.assertEqual(tracker_state(), expected)
+        self.assertEqual(TrackerStatistics().get_statistic(),
+                         TrackerStatistics().get_exact_statistic())
+        self.assertEqual(list(Course.courses),
+                         ["Python", "DSA", "Databases", "Flask", "Django"])
+        with self.assertRaises(EmailIsTaken):
+            Student("John", "Smith", "js3@example.com")
+
+    def test_changes_after_load(self):
+        """Загруженное состояние изменяется так же, как исходное."""
+        self.fill()
+        TrackerImage.export(self.path)
+        self.change()
+        expected = tracker_state()
+
+        reset_state()
+        TrackerImage.load(self.path)
+        # Курсы читают баллы из файла, пока их не изменят.
+        self.assertNotIsInstance(Course.courses["Flask"].student_scores,
+                                 dict)
+        self.change()
+        self.assertEqual(tracker_state(), expected)
+        self.assertIsInstance(Course.courses["Python"].student_scores, dict)
+
+    def test_export_loaded_state(self):
+        """Загруженное и измененное состояние снова сохраняется в образ."""
+        self.fill()
+        self.reload()
+        self.change()
+        expected = tracker_state()
+        self.reload()
+        self.assertEqual(tracker_state(), expected)
+
+    def test_unknown_format(self):
+        """Файл другого формата не загружается."""
+        with open(self.path, 'wb') as file:
+            file.write(b'\0' * TrackerImage.header.size)
+        with self.assertRaises(ValueError):
+            TrackerImage.load(self.path)
+
+
+class TestPointHistory(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+        Student.import_students(f"John Smith js{i}@example.com"
+                                for i in range(10))
+        self.now = 1_700_000_000
+        PointHistory.active = PointHistory(clock=lambda: self.now)
+        self.addCleanup(setattr, PointHistory, "active", None)
+
+    @staticmethod
+    def brute_force(history: PointHistory, start: int,
+                    end: int) -> dict[str, tuple[int, int]]:
+        """Итоги окна перебором всех событий истории."""
+        result = {}
+        for partition in history.partitions.values():
+            for timestamp, code, points in zip(partition.timestamps,
+                                               partition.courses,
+                                               partition.points):
+                if start <= timestamp < end:
+                    name = history.course_names[code]
+                    tasks, total = result.get(name, (0, 0))
+                    result[name] = (tasks + 1, total + points)
+        return dict(sorted(result.items(),
+                           key=lambda item: history.course_codes[item[0]]))
+
+    def test_records_accepted_points(self):
+        """В историю попадают только принятые ненулевые баллы."""
+        history = PointHistory.active
+        with redirect_stdout(io.StringIO()):
+            Student.students[1000].add_points("10 0 5 0")
+            Student.add_points_many(["1001 1 2 0 0", "1002 -1 2 3 4",
+                                     "9999 1 1 1 1"])
+        self.assertEqual(len(history), 4)
+        self.assertEqual(history.window(self.now, self.now + 1),
+                         {"Python": (2, 11), "DSA": (1, 2),
+                          "Databases": (1, 5)})
+        self.assertEqual(history.window(self.now + 1, self.now + 2), {})
+        partition = next(iter(history.partitions.values()))
+        self.assertEqual(sorted(partition.students),
+                         [1000, 1000, 1001, 1001])
+
+    def test_window_matches_scan(self):
+        """Окна с любыми краями совпадают с перебором событий."""
+        history = PointHistory.active
+        rng = random.Random(5)
+        courses = list(Course.courses.values())
+        base = self.now - self.now % 3600
+        times = [base + rng.randrange(5 * 3600) for _ in range(600)]
+        # Часть событий приходит не по порядку времени.
+        times[100:200] = sorted(times[100:200], reverse=True)
+        for timestamp in times:
+            rows = [(rng.randrange(1000, 1010),
+                     [rng.choice((0, 3, 50)) for _ in courses])]
+            history.record(rows, courses, timestamp)
+        Course.remove("DSA")
+        history.record([(1000, [1, 1, 1])],
+                       list(Course.courses.values()), base + 7)
+
+        edges = [base - 10, base, base + 7, base + 60, base + 3599,
+                 base + 3600, base + 3661, base + 9000, base + 5 * 3600,
+                 base + 6 * 3600]
+        edges += [base + rng.randrange(-100, 6 * 3600) for _ in range(30)]
+        for start in edges:
+            for end in edges:
+                if start < end:
+                    self.assertEqual(history.window(start, end),
+                                     self.brute_force(history, start, end))
+
+        series = history.series(base, base + 5 * 3600, 7200)
+        self.assertEqual([start for start, _ in series],
+                         [base, base + 7200, base + 14400])
+        self.assertEqual(series[-1][1],
+                         self.brute_force(history, base + 14400,
+                                          base + 5 * 3600))
+
+    def test_parallel_points_are_recorded(self):
+        """Баллы из нескольких процессов попадают в историю."""
+        Student.add_points_parallel(
+            (f"{1000 + i % 10} {i} 0 {i % 3} 1" for i in range(50)),
+            workers=2, chunk_size=20,
+        )
+        self.assertEqual(PointHistory.active.window(self.now, self.now + 1),
+                         {"Python": (49, sum(range(50))),
+                          "Databases": (33, 49), "Flask": (50, 50)})
+
+    def test_activity_command(self):
+        """Команда activity выводит итоги за последние дни."""
+        history = PointHistory.active
+        history.record([(1000, [5, 0, 0, 0])],
+                       list(Course.courses.values()), self.now - 3 * 86400)
+        output = run_session(["activity", "0", "1", "back", "add points",
+                              "1001 7 0 0 1", "back", "activity", "1", "5",
+                              "back", "exit"])
+        self.assertEqual(output.splitlines()[1:], [
+            "Enter a number of days or 'back' to return:",
+            "Incorrect number of days.",
+            "No activity.",
+            "Enter an id and points or 'back' to return:",
+            "Points updated.",
+            "Enter a number of days or 'back' to return:",
+            "Python: 1 tasks, 7 points",
+            "Flask: 1 tasks, 1 points",
+            "Python: 2 tasks, 12 points",
+            "Flask: 1 tasks, 1 points",
+            "Bye!",
+        ])
+
+        PointHistory.active = None
+        self.assertEqual(run_session(["activity", "exit"]).splitlines()[1:],
+                         ["History is disabled.", "Bye!"])
+
+
+class TestSQLiteTracker(unittest.TestCase):
+
+    session = [
+        "list",
+        "add students",
+        "John Smith jsmith@example.com",
+        "Jean-Clause van Helsing jch@example.com",
+        "Mary Jane mj@example.com",
+        "John Smith jsmith@example.com",
+        "help",
+        "John Sm1th js@example.com",
+        "Ann Lee al@example.com",
+        "back",
+        "list",
+        "add points",
+        "1000 600 400 0 0",
+        "1001 1 2 3 4",
+        "1002 10 0 500 0",
+        "1000 1 1 1 1",
+        "1001 1 2 3",
+        "9999 1 1 1 1",
+        "abc 1 1 1 1",
+        "1003 5 -1 0 0",
+        "back",
+        "find",
+        "1000",
+        "1001",
+        "1003",
+        "1004",
+        "x",
+        "back",
+        "statistics",
+        "python",
+        "DSA",
+        "databases",
+        "flask",
+        "java",
+        "back",
+        "notify",
+        "add points",
+        "1001 600 0 0 0",
+        "back",
+        "notify",
+        "notify",
+        "exit",
+    ]
+
+    def setUp(self):
+        reset_state()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "tracker.sqlite")
+
+    def open_tracker(self) -> SQLiteLearningProgressTracker:
+        tracker = SQLiteLearningProgressTracker(self.path, COURSES_POINTS)
+        self.addCleanup(tracker.close)
+        return tracker
+
+    def test_session_output_matches_memory(self):
+        """Вывод сессии совпадает с хранением в памяти."""
+        expected = run_session(self.session)
+        self.assertEqual(run_session(self.session, self.open_tracker()),
+                         expected)
+
+    def test_bulk_import_matches_memory(self):
+        """Пакетный импорт дает тот же результат, что и в памяти."""
+        students = [f"John Smith js{i % 7}@example.com" for i in range(10)]
+        students.append("Bad1 Name bad@example.com")
+        points = ["1000 600 0 0 1", "1003 1 2 3 4", "1099 1 1 1 1",
+                  "1001 1 2", "1002 0 400 0 0"]
+        tracker = self.open_tracker()
+
+        results = []
+        for import_tracker in (LearningProgressTracker(), tracker):
+            rejects = io.StringIO()
+            results.append((
+                import_tracker.import_students(students, rejects),
+                import_tracker.import_points(points, rejects),
+                rejects.getvalue(),
+            ))
+        self.assertEqual(results[0], results[1])
+
+        commands = ["list", "find", "1000", "1002", "back", "statistics",
+                    "python", "dsa", "back", "notify", "exit"]
+        self.assertEqual(run_session(commands, tracker),
+                         run_session(commands))
+
+    def test_state_survives_reopen(self):
+        """Данные остаются в файле после перезапуска."""
+        tracker = self.open_tracker()
+        tracker.import_students(["John Smith js@example.com"])
+        tracker.import_points(["1000 600 0 0 0"])
+        tracker.close()
+
+        output = run_session(["add students", "Mary Jane js@example.com",
+                              "Mary Jane mj@example.com", "back",
+                              "find", "1000", "1001", "back",
+                              "notify", "exit"], self.open_tracker())
+        self.assertIn("This email is already taken.", output)
+        self.assertIn("1000 points: Python=600; DSA=0; Databases=0; Flask=0",
+                      output)
+        self.assertIn("1001 points: Python=0;", output)
+        self.assertIn("Total 1 students have been notified.", output)
+
+
+class TestStudentValidator(unittest.TestCase):
+
+    alphabet = "aZ-' .@_%+09\n\té²"
+
+    def random_strings(self, count: int) -> list[str]:
+        rng = random.Random(10)
+        strings = ["John", "O'Neil", "Jean-Clause", "van Helsing", "a@b.c",
+                   "John\n", "a@b.c\n", "J", "", "ab--c", "x@y..z"]
+        for _ in range(count):
+            strings.append("".join(rng.choice(self.alphabet)
+                                   for _ in range(rng.randrange(8))))
+        return strings
+
+    def test_same_decisions_as_patterns(self):
+        """Быстрые проверки дают те же решения, что и шаблоны."""
+        for value in self.random_strings(20000):
+            self.assertEqual(
+                StudentValidator.is_valid_name(value),
+                re.match(Student.name_pattern, value) is not None, value
+            )
+            self.assertEqual(
+                StudentValidator.is_valid_email(value),
+                re.match(Student.email_pattern, value) is not None, value
+            )
+
+    def test_parse_points_same_decisions(self):
+        """Проверка баллов совпадает с прежней."""
+        tokens = ["0", "10", "-1", "1.5", "abc", "", "٣", "007"]
+        rng = random.Random(3)
+        for _ in range(2000):
+            points = [rng.choice(tokens) for _ in range(rng.randrange(6))]
+            expected = (all(num.isdigit() and int(num) >= 0
+                            for num in points) and len(points) == 4)
+            parsed = StudentValidator.parse_points(points, 4)
+            self.assertEqual(parsed is not None, expected, points)
+            if expected:
+                self.assertEqual(parsed, list(map(int, points)))
+        with self.assertRaises(ValueError):
+            StudentValidator.parse_points(["1", "²", "1", "1"], 4)
+
+    def test_validate_many_codes(self):
+        """Коды ошибок соответствуют сообщениям интерактивного режима."""
+        reset_state()
+        Student("Mary", "Jane", "mj@example.com")
+        lines = [
+            "John Smith js@example.com",
+            "John Smith js@example.com",
+            "Mary Jane mj@example.com",
+            "help",
+            "J. Smith jsmith@ex.com",
+            "John Sm1th js2@example.com",
+            "John Smith jsexample.com",
+        ]
+        codes = StudentValidator.validate_many(lines, Student.emails)
+        self.assertEqual(codes, [
+            StudentValidator.OK,
+            StudentValidator.EMAIL_TAKEN,
+            StudentValidator.EMAIL_TAKEN,
+            StudentValidator.INCORRECT_CREDENTIALS,
+            StudentValidator.INCORRECT_FIRST_NAME,
+            StudentValidator.INCORRECT_LAST_NAME,
+            StudentValidator.INCORRECT_EMAIL,
+        ])
+        output = run_session(["add students", *lines, "back", "exit"])
+        for code in codes[1:]:
+            self.assertIn(StudentValidator.messages[code], output)
+
+
+class TestTrackerMetrics(unittest.TestCase):
+
+    session = [
+        "add students", "John Smith js@example.com", "back",
+        "add points", "1000 1 2 3 4", "back",
+        "statistics", "Python", "back",
+        "foo",
+    ]
+
+    def setUp(self):
+        reset_state()
+        self.addCleanup(TrackerMetrics.reset)
+        self.addCleanup(TrackerMetrics.disable)
+
+    def test_disabled_by_default(self):
+        """Без включения методы не обернуты, а вывод прежний."""
+        add_points = Student.add_points
+        output = run_session(self.session + ["metrics", "exit"])
+        self.assertIs(Student.add_points, add_points)
+        self.assertIn("Error: unknown command!\nMetrics are disabled.\n",
+                      output)
+        self.assertEqual(TrackerMetrics.histograms, {})
+
+    def test_statistics_command_is_timed(self):
+        """После команды statistics гистограмма статистики не пуста."""
+        TrackerMetrics.enable()
+        run_session(["statistics", "back", "exit"])
+        histogram = TrackerMetrics.histograms[
+            "TrackerStatistics.get_statistic"]
+        self.assertEqual(histogram.count, 1)
+        self.assertGreater(histogram.max_ns, 0)
+        report = run_session(["metrics", "exit"])
+        self.assertIn("TrackerStatistics.get_statistic", report)
+
+    def test_counts_commands_and_methods(self):
+        """Команды и горячие методы считаются с гистограммами задержек."""
+        expected = run_session(self.session + ["exit"])
+        reset_state()
+        originals = [owner.__dict__[attr]
+                     for owner, attr in TrackerMetrics.targets]
+        TrackerMetrics.enable()
+        self.assertEqual(run_session(self.session + ["exit"]), expected)
+        with redirect_stdout(io.StringIO()):
+            Student.add_points_many(["1000 1 0 0 0", "1000 0 1 0 0"])
+
+        counts = {name: histogram.count
+                  for name, histogram in TrackerMetrics.histograms.items()}
+        self.assertEqual(counts, {
+            "command:add students": 3,
+            "command:add points": 3,
+            "command:statistics": 3,
+            "command:unknown": 1,
+            "command:exit": 1,
+            "Student.add_points": 1,
+            "Student.add_points_many": 1,
+            "Course.update_many": 8,
+            "Course.get_top_students": 1,
+            "TrackerStatistics.course_updated": 6,
+            "TrackerStatistics.get_statistic": 1,
+        })
+        histogram = TrackerMetrics.histograms["Course.update_many"]
+        self.assertLessEqual(histogram.percentile(0.5),
+                             histogram.percentile(0.99))
+        self.assertLessEqual(histogram.percentile(0.99), histogram.max_ns)
+
+        report = run_session(["metrics", "exit"]).splitlines()
+        self.assertTrue(report[1].startswith("name"))
+        self.assertEqual(len(report), 2 + len(counts) + 1)
+
+        TrackerMetrics.disable()
+        self.assertEqual(
+            [owner.__dict__[attr] for owner, attr in TrackerMetrics.targets],
+            originals,
+        )
+
+
+class TestRunScript(unittest.TestCase):
+
+    def setUp(self):
+        reset_state()
+
+    def test_transcript_matches_console(self):
+        """Вывод сценария совпадает с выводом интерактивной сессии."""
+        session = TestSQLiteTracker.session + ["list", "back", "", "exit"]
+        expected = run_session(session)
+        reset_state()
+        output = io.StringIO()
+        count = LearningProgressTracker().run_script(
+            (line + "\n" for line in session), output, buffer_size=16
+        )
+        self.assertEqual(output.getvalue(), expected)
+        self.assertEqual(count, session.index("exit") + 1)
+
+    def test_script_without_exit(self):
+        """Сценарий без exit заканчивается вместе со строками."""
+        output = io.StringIO()
+        count = LearningProgressTracker().run_script(
+            ["add students", "John Smith js@example.com"], output
+        )
+        self.assertEqual(count, 2)
+        self.assertEqual(output.getvalue(), (
+            "Learning Progress Tracker\n"
+            "Enter student credentials or 'back' to return: \n"
+            "The student has been added.\n"
+        ))
+
+
+class TestTrackerServer(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        reset_state()
+
+    async def asyncSetUp(self):
+        self.server = TrackerServer()
+        server = await self.server.start_tcp("127.0.0.1", 0)
+        self.port = server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.server.wait_closed()
+
+    async def run_client(self, lines: list[str]) -> str:
+        reader, writer = await asyncio.open_connection("127.0.0.1",
+                                                       self.port)
+        writer.write("".join(line + "\n" for line in lines).encode())
+        await writer.drain()
+        output = await reader.read()
+        writer.close()
+        return output.decode()
+
+    async def test_same_output_as_console(self):
+        """Клиент получает тот же вывод, что и в консоли."""
+        session = TestSQLiteTracker.session
+        expected = run_session(session)
+        reset_state()
+        self.assertEqual(await self.run_client(session), expected)
+
+    async def test_connections_share_data(self):
+        """Подключения работают с общими данными и своими подрежимами."""
+        reader, writer = await asyncio.open_connection("127.0.0.1",
+                                                       self.port)
+        await reader.readline()
+        # Первый клиент остается в подрежиме add points.
+        writer.write(b"add points\n")
+        await reader.readline()
+
+        outputs = await asyncio.gather(*(
+            self.run_client(["add students",
+                             f"John Smith js{i}@example.com", "back",
+                             "exit"])
+            for i in range(20)
+        ))
+        self.assertTrue(all("Total 1 students have been added." in output
+                            for output in outputs))
+
+        writer.write(b"1019 600 0 0 0\nback\nexit\n")
+        self.assertEqual(await reader.read(), b"Points updated.\nBye!\n")
+        writer.close()
+        self.assertEqual(Student.students[1019].points["Python"], 600)
+        self.assertEqual(sorted(Student.students), list(range(1000, 1020)))
+
+
+if __name__ == "__main__":
+    unittest.main()